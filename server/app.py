@@ -47,6 +47,8 @@ from routes.upload_routes import register_upload_routes
 from routes.chat_routes import register_chat_routes
 from routes.doc_chat_routes import register_doc_chat_routes
 from routes.test_routes import register_test_routes  # 添加新的导入
+from llm_clients import preconnect_default_endpoints
+from local_embeddings import LOCAL_MODEL_PREFIX
 
 # 加载环境变量
 # 优先从项目根目录加载.env文件
@@ -71,16 +73,19 @@ logger = setup_logger()
 # 创建应用
 app = Flask(__name__)
 
+# 允许跨域访问的前端地址，异步服务入口（asgi.py）同样使用
+ALLOWED_ORIGINS = [
+    "http://localhost:5173", 
+    "http://192.168.1.11:5173",  # 添加本地IP
+    "https://joytianya.github.io",
+    "https://mini-chatbot-backend.onrender.com"
+]
+
 # 配置 CORS
 CORS(app, 
     resources={
         r"/*": {
-            "origins": [
-                "http://localhost:5173", 
-                "http://192.168.1.11:5173",  # 添加本地IP
-                "https://joytianya.github.io",
-                "https://mini-chatbot-backend.onrender.com"
-            ],
+            "origins": ALLOWED_ORIGINS,
             "methods": ["GET", "POST", "OPTIONS", "PUT", "DELETE"],
             "allow_headers": ["Content-Type", "Authorization", "Accept", "X-Requested-With", "Origin", 
                              "X-Title", "HTTP-Referer", "x-title", "http-referer",
@@ -126,8 +131,8 @@ def init_doc_store():
     base_url = os.getenv('ARK_BASE_URL', '')
     model_name = os.getenv('ARK_EMBEDDING_MODEL', '')
     
-    if api_key:
-        logger.info(f"ARK_API_KEY 已配置，使用嵌入模型: {model_name}")
+    if api_key or model_name.startswith(LOCAL_MODEL_PREFIX):
+        logger.info(f"ARK_API_KEY 已配置或使用本地嵌入模型，使用嵌入模型: {model_name}")
         doc_store = DocumentStore(
             api_key=api_key,
             base_url=base_url,
@@ -201,8 +206,7 @@ def after_request(response):
     # 检查是否已经设置了 CORS 头
     if 'Access-Control-Allow-Origin' not in response.headers:
         origin = request.headers.get('Origin')
-        allowed_origins = ["http://localhost:5173", "http://192.168.1.11:5173", "https://joytianya.github.io", "https://mini-chatbot-backend.onrender.com"]
-        if origin in allowed_origins:
+        if origin in ALLOWED_ORIGINS:
             response.headers.add('Access-Control-Allow-Origin', origin)
             response.headers.add('Access-Control-Allow-Credentials', 'true')
             response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,Accept,X-Requested-With,Origin,X-Title,HTTP-Referer,x-title,http-referer,content-type,authorization,accept,x-requested-with,origin')
@@ -281,6 +285,9 @@ def init_app():
     # 注册路由
     register_routes()
 
+    # 后台预连接默认的上游模型服务
+    preconnect_default_endpoints()
+
 # 启动调度器
 scheduler.start()
 
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""异步服务入口（ASGI）
+
+/api/chat 和 /api/chat_with_doc 的流式请求在事件循环上处理，上游的 token 流由进程级客户端池（llm_clients）
+中的 AsyncOpenAI 客户端读取，打开的 SSE 流不再各占一个工作线程，一个进程可以同时保持上千个流。
+联网搜索、意图提取和文档检索等同步调用在大小为 ASYNC_WORKER_THREADS 的专用线程池中执行。
+其余请求，以及深度研究、非流式请求，经 WsgiToAsgi 交给原来的 Flask 应用处理，接口和响应格式不变。
+
+启动:
+    cd server && uvicorn asgi:app --host 0.0.0.0 --port 5001
+或:
+    python server/asgi.py
+"""
+import asyncio
+import json
+import logging
+import os
+
+from asgiref.wsgi import WsgiToAsgi
+
+import app as flask_server
+from llm_clients import close_async_llm_clients
+from routes.async_chat_routes import build_async_chat_routes
+
+logger = logging.getLogger(__name__)
+
+# 初始化 DocumentStore 并注册 Flask 路由
+flask_server.init_app()
+wsgi_app = WsgiToAsgi(flask_server.app)
+async_routes = build_async_chat_routes(flask_server.doc_store)
+
+
+async def _read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+def _replay(body, receive):
+    """请求体已经读出，交给 Flask 处理时重新提供一次"""
+    sent = False
+
+    async def replay():
+        nonlocal sent
+        if not sent:
+            sent = True
+            return {'type': 'http.request', 'body': body, 'more_body': False}
+        return await receive()
+
+    return replay
+
+
+async def _wait_disconnect(receive):
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+
+
+def _cors_headers(request_headers):
+    """与 Flask 的 CORS 配置一致，只对允许的前端地址返回跨域响应头"""
+    origin = request_headers.get('origin')
+    if origin not in flask_server.ALLOWED_ORIGINS:
+        return {}
+    return {
+        'Access-Control-Allow-Origin': origin,
+        'Access-Control-Allow-Credentials': 'true',
+        'Access-Control-Expose-Headers': 'Content-Type, X-CSRFToken',
+        'Vary': 'Origin',
+    }
+
+
+async def _send_response(send, receive, status, headers, body):
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(key.lower().encode('latin-1'), str(value).encode('latin-1')) for key, value in headers.items()],
+    })
+    if isinstance(body, bytes):
+        await send({'type': 'http.response.body', 'body': body, 'more_body': False})
+        return
+
+    async def pump():
+        async for event in body:
+            await send({'type': 'http.response.body', 'body': event, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b'', 'more_body': False})
+
+    # 客户端断开（停止生成、关闭页面）时取消转发，同时关闭上游的流
+    pump_task = asyncio.ensure_future(pump())
+    disconnect_task = asyncio.ensure_future(_wait_disconnect(receive))
+    try:
+        done, _ = await asyncio.wait({pump_task, disconnect_task}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        disconnect_task.cancel()
+        if not pump_task.done():
+            pump_task.cancel()
+            # 等转发任务退出，上游的流在生成器的 finally 中关闭
+            await asyncio.gather(pump_task, return_exceptions=True)
+    if pump_task in done:
+        pump_task.result()
+    else:
+        logger.info("客户端已断开，停止转发上游响应")
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            # 异步客户端的连接池绑定在这个事件循环上，循环关闭前关闭
+            try:
+                await close_async_llm_clients()
+            except Exception as e:
+                logger.error(f"关闭异步上游连接池失败: {str(e)}")
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+
+    handler = async_routes.get(scope.get('path')) if scope['type'] == 'http' and scope['method'] == 'POST' else None
+    if handler is None:
+        return await wsgi_app(scope, receive, send)
+
+    body = await _read_body(receive)
+    if body is None:
+        return
+    request_headers = {key.decode('latin-1').lower(): value.decode('latin-1') for key, value in scope['headers']}
+    try:
+        data = json.loads(body) if body else None
+    except ValueError:
+        data = None
+
+    result = await handler(data, request_headers)
+    if result is None:
+        return await wsgi_app(scope, _replay(body, receive), send)
+
+    status, headers, response_body = result
+    await _send_response(send, receive, status, {**headers, **_cors_headers(request_headers)}, response_body)
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    uvicorn.run(app, host='0.0.0.0', port=int(os.environ.get('PORT', 5001)), log_level='info')
@@ -1,10 +1,6 @@
-from langchain_community.document_loaders import DirectoryLoader, TextLoader, PyPDFLoader, UnstructuredWordDocumentLoader
-from langchain_community.document_loaders.markdown import UnstructuredMarkdownLoader
-from langchain_community.document_loaders.pdf import PyPDFLoader
-from langchain_community.document_loaders.word_document import UnstructuredWordDocumentLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from openai import OpenAI
+from openai import OpenAI, APIConnectionError, APIStatusError
 from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
 import os
 import sys
 import json
@@ -16,8 +12,27 @@ from dotenv import load_dotenv
 import pathlib
 from typing import List, Dict, Any, Optional, Tuple
 import hashlib
+import random
+import shutil
+import queue
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 import logging
+import re
+from vector_index import VectorIndex
+from keyword_index import KeywordIndex, reciprocal_rank_fusion
+from manifest import DocumentManifest
+from parse_pool import ParsePool
+from parse_worker import LOADERS, split_chunks, split_chunk_batches
+from text_chunker import count_tokens
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache, normalize_query, text_hash
+from retrieval_cache import RetrievalCache
+from embedding_provider import EmbeddingProvider
+from local_embeddings import LOCAL_MODEL_PREFIX, LocalEmbeddings
 
 # 加载环境变量
 # 优先从项目根目录加载.env文件
@@ -43,67 +58,209 @@ logger.setLevel(logging.INFO)
 for h in logger.handlers[:]:
     logger.removeHandler(h)
 
-class ArkEmbeddings:
-    def __init__(self, api_key, base_url, model_name):
+# 嵌入接口的默认并发和批大小限制
+DEFAULT_EMBEDDING_LIMITS = {
+    "concurrency": int(os.getenv('EMBEDDING_CONCURRENCY', '4')),  # 同时在途的批次数
+    "max_batch_size": int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '10')),  # 每批最多文本数
+    "max_batch_tokens": int(os.getenv('EMBEDDING_MAX_BATCH_TOKENS', '8000')),  # 每批最多 token 数
+    "max_retries": int(os.getenv('EMBEDDING_MAX_RETRIES', '5')),  # 429/5xx 的最大重试次数
+}
+
+# 进程级共享的查询向量缓存，ArkEmbeddings 实例重建后仍然有效
+query_embedding_cache = QueryEmbeddingCache(
+    max_entries=int(os.getenv('QUERY_EMBEDDING_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('QUERY_EMBEDDING_CACHE_TTL', '3600'))
+)
+
+# 进程级共享的检索结果缓存，相同的问题在相同的文档中再次检索时直接返回，RETRIEVAL_CACHE_SIZE=0 关闭
+retrieval_cache = RetrievalCache(
+    max_entries=int(os.getenv('RETRIEVAL_CACHE_SIZE', '1024')),
+    ttl=float(os.getenv('RETRIEVAL_CACHE_TTL', '600'))
+)
+
+# 查询向量化的超时和重试次数，检索时超时后退回关键词检索
+QUERY_EMBEDDING_TIMEOUT = float(os.getenv('QUERY_EMBEDDING_TIMEOUT', '10'))
+QUERY_EMBEDDING_MAX_RETRIES = int(os.getenv('QUERY_EMBEDDING_MAX_RETRIES', '1'))
+
+# 检索模式: hybrid（BM25 + 向量，RRF 融合）、vector、keyword
+RETRIEVAL_MODE = os.getenv('RETRIEVAL_MODE', 'hybrid')
+
+# 流式入库：每批向量化并写入索引的文本块数，以及各阶段之间队列的容量（按批计）
+INGEST_BATCH_CHUNKS = int(os.getenv('INGEST_BATCH_CHUNKS', '64'))
+INGEST_QUEUE_SIZE = int(os.getenv('INGEST_QUEUE_SIZE', '4'))
+
+# 解析是 CPU 密集型的文件类型，在子进程中解析，不占用服务进程的 GIL
+SUBPROCESS_PARSE_EXTENSIONS = {'.pdf', '.doc', '.docx'}
+
+# 批量入库时多个文件共享向量化批次：每次合并的最多文本数，以及等待其他文件凑批的时间（秒）
+BATCH_EMBED_MAX_TEXTS = int(os.getenv('BATCH_EMBED_MAX_TEXTS', '256'))
+BATCH_EMBED_LINGER = float(os.getenv('BATCH_EMBED_LINGER_MS', '20')) / 1000
+
+# 除 5xx 以外需要退避重试的 HTTP 状态码
+RETRYABLE_STATUS_CODES = {408, 409, 429}
+
+def get_embedding_limits(base_url):
+    """获取嵌入接口的限制配置
+
+    EMBEDDING_ENDPOINT_LIMITS 可以按 base_url 覆盖默认值，例如:
+    {"https://ark.cn-beijing.volces.com/api/v3": {"concurrency": 8, "max_batch_tokens": 16000}}
+    """
+    limits = dict(DEFAULT_EMBEDDING_LIMITS)
+    try:
+        overrides = json.loads(os.getenv('EMBEDDING_ENDPOINT_LIMITS', '') or '{}')
+    except json.JSONDecodeError as e:
+        logger.warning(f"EMBEDDING_ENDPOINT_LIMITS 格式错误，使用默认配置: {str(e)}")
+        overrides = {}
+    normalized = {url.rstrip('/'): value for url, value in overrides.items()}
+    limits.update(normalized.get((base_url or '').rstrip('/'), {}))
+    return limits
+
+class ArkEmbeddings(EmbeddingProvider):
+    """OpenAI 兼容的远程嵌入接口"""
+
+    def __init__(self, api_key, base_url, model_name, cache=None, limits=None):
+        # 重试由 _create_embeddings 统一处理
         self.client = OpenAI(
             api_key=api_key,
-            base_url=base_url
+            base_url=base_url,
+            max_retries=0
         )
         self.model_name = model_name
-        logger.info(f"初始化ArkEmbeddings，模型名称: {self.model_name}")
+        self.base_url = base_url
+        self.cache = cache  # 可选的 EmbeddingCache，按文本内容缓存文档向量
+        self.limits = limits or get_embedding_limits(base_url)
+        logger.info(f"初始化ArkEmbeddings，模型名称: {self.model_name}, 限制: {self.limits}")
     
-    def __call__(self, text):
-        """使类实例可调用，用于兼容 FAISS 的接口"""
-        if isinstance(text, str):
-            return self.embed_query(text)
-        elif isinstance(text, list):
-            return self.embed_documents(text)
-        else:
-            raise ValueError(f"Unsupported input type: {type(text)}")
-    
-    def embed_documents(self, texts):
-        """将文档转换为向量"""
-        logger.info(f"正在生成 {len(texts)} 个文档的向量，使用模型: {self.model_name}")
-        # 分批处理，每批最多 10 个文档
-        batch_size = 10
-        all_embeddings = []
-        
-        for i in range(0, len(texts), batch_size):
-            batch_texts = texts[i:i + batch_size]
-            logger.info(f"处理第 {i//batch_size + 1} 批，共 {len(batch_texts)} 个文档")
-            
-            try:
-                # 确保文本是UTF-8编码
-                encoded_texts = []
-                for text in batch_texts:
-                    if isinstance(text, str):
-                        # 如果是字符串，确保是UTF-8编码
-                        encoded_text = text.encode('utf-8').decode('utf-8')
-                    else:
-                        # 如果不是字符串，转换为字符串
-                        encoded_text = str(text).encode('utf-8').decode('utf-8')
-                    encoded_texts.append(encoded_text)
+    def embed_documents(self, texts, progress_callback=None):
+        """将文档转换为向量
 
-                # 检查模型名称是否为空
-                if not self.model_name:
-                    raise ValueError("模型名称不能为空")
-                
-                logger.info(f"发送嵌入请求，模型: {self.model_name}, 文本数量: {len(encoded_texts)}")
-                response = self.client.embeddings.create(
+        相同内容的文本块在同一批中只请求一次；配置了缓存时，
+        已经生成过向量的文本块直接从缓存读取。
+
+        Args:
+            texts: 文本列表
+            progress_callback: 可选，每完成一批调用 progress_callback(已完成数, 总数)，按去重后的文本计数
+        """
+        # 确保文本是UTF-8编码
+        encoded_texts = []
+        for text in texts:
+            if isinstance(text, str):
+                # 如果是字符串，确保是UTF-8编码
+                encoded_text = text.encode('utf-8').decode('utf-8')
+            else:
+                # 如果不是字符串，转换为字符串
+                encoded_text = str(text).encode('utf-8').decode('utf-8')
+            encoded_texts.append(encoded_text)
+
+        hashes = [text_hash(text) for text in encoded_texts]
+        # 内容去重，保持首次出现的顺序
+        unique_texts = dict(zip(hashes, encoded_texts))
+
+        vectors = self.cache.get_many(self.model_name, list(unique_texts)) if self.cache else {}
+        missing_hashes = [hash_value for hash_value in unique_texts if hash_value not in vectors]
+        cached_count = len(unique_texts) - len(missing_hashes)
+        logger.info(f"共 {len(texts)} 个文档，去重后 {len(unique_texts)} 个，缓存命中 {cached_count} 个")
+        if progress_callback:
+            progress_callback(cached_count, len(unique_texts))
+
+        if missing_hashes:
+            batch_callback = None
+            if progress_callback:
+                def batch_callback(done, total):
+                    progress_callback(cached_count + done, len(unique_texts))
+            new_embeddings = self._embed_batches([unique_texts[hash_value] for hash_value in missing_hashes],
+                                                 progress_callback=batch_callback)
+            new_items = list(zip(missing_hashes, new_embeddings))
+            vectors.update(new_items)
+            if self.cache:
+                self.cache.put_many(self.model_name, new_items)
+
+        return [vectors[hash_value] for hash_value in hashes]
+
+    def _make_batches(self, texts):
+        """按 token 数和文本数切分批次，返回每批的起止下标"""
+        max_batch_size = self.limits["max_batch_size"]
+        max_batch_tokens = self.limits["max_batch_tokens"]
+        batches = []
+        start = 0
+        batch_tokens = 0
+        for i, text in enumerate(texts):
+            tokens = count_tokens(text)
+            # 当前批次放不下时先结束它；单个超长文本单独成批
+            if i > start and (batch_tokens + tokens > max_batch_tokens or i - start >= max_batch_size):
+                batches.append((start, i))
+                start = i
+                batch_tokens = 0
+            batch_tokens += tokens
+        if start < len(texts):
+            batches.append((start, len(texts)))
+        return batches
+
+    def _create_embeddings(self, batch_texts, max_retries=None, timeout=None):
+        """请求嵌入接口，对 429/5xx 和连接错误做指数退避重试"""
+        if max_retries is None:
+            max_retries = self.limits["max_retries"]
+        client = self.client.with_options(timeout=timeout) if timeout else self.client
+        for attempt in range(max_retries + 1):
+            try:
+                response = client.embeddings.create(
                     model=self.model_name,
-                    input=encoded_texts
+                    input=batch_texts
                 )
-                batch_embeddings = [embedding.embedding for embedding in response.data]
-                all_embeddings.extend(batch_embeddings)
+                return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+            except (APIConnectionError, APIStatusError) as e:
+                status_code = getattr(e, 'status_code', None)
+                retryable = status_code is None or status_code in RETRYABLE_STATUS_CODES or status_code >= 500
+                if not retryable or attempt == max_retries:
+                    raise
+                delay = min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+                logger.warning(f"嵌入请求失败({status_code or type(e).__name__})，{delay:.1f} 秒后第 {attempt + 1} 次重试")
+                time.sleep(delay)
+
+    def _embed_batches(self, texts, progress_callback=None):
+        """分批并发请求嵌入接口，结果顺序与输入一致"""
+        # 检查模型名称是否为空
+        if not self.model_name:
+            raise ValueError("模型名称不能为空")
+
+        batches = self._make_batches(texts)
+        concurrency = max(1, min(self.limits["concurrency"], len(batches)))
+        logger.info(f"正在生成 {len(texts)} 个文档的向量，使用模型: {self.model_name}，"
+                    f"共 {len(batches)} 批，并发数 {concurrency}")
+
+        all_embeddings = [None] * len(texts)
+        progress_lock = threading.Lock()
+        done_count = [0]
+
+        def run_batch(batch_no, start, end):
+            try:
+                embeddings = self._create_embeddings(texts[start:end])
             except Exception as e:
-                logger.error(f"处理批次 {i//batch_size + 1} 时出错: {str(e)}")
+                logger.error(f"处理批次 {batch_no + 1} 时出错: {str(e)}")
                 raise
-        
+            all_embeddings[start:end] = embeddings
+            if progress_callback:
+                with progress_lock:
+                    done_count[0] += end - start
+                    progress_callback(done_count[0], len(texts))
+
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            futures = [executor.submit(run_batch, batch_no, start, end)
+                       for batch_no, (start, end) in enumerate(batches)]
+            try:
+                for future in futures:
+                    future.result()
+            except Exception:
+                # 一个批次失败后取消尚未开始的批次
+                for future in futures:
+                    future.cancel()
+                raise
+
         logger.info(f"向量生成完成，共 {len(all_embeddings)} 个向量")
         return all_embeddings
     
     def embed_query(self, text):
-        """将查询转换为向量"""
+        """将查询转换为向量，重复的查询直接使用进程内缓存"""
         try:
             # 确保查询文本是UTF-8编码
             encoded_text = text.encode('utf-8').decode('utf-8') if isinstance(text, str) else str(text).encode('utf-8').decode('utf-8')
@@ -112,18 +269,166 @@ class ArkEmbeddings:
             if not self.model_name:
                 raise ValueError("模型名称不能为空")
             
+            cache_key = (self.model_name, self.base_url, normalize_query(encoded_text))
+            cached = query_embedding_cache.get(cache_key)
+            if cached is not None:
+                logger.info(f"查询向量命中缓存，模型: {self.model_name}")
+                return cached
+
             logger.info(f"发送查询嵌入请求，模型: {self.model_name}")
-            response = self.client.embeddings.create(
-                model=self.model_name,
-                input=[encoded_text]
-            )
-            return response.data[0].embedding
+            embedding = self._create_embeddings([encoded_text], max_retries=QUERY_EMBEDDING_MAX_RETRIES,
+                                                timeout=QUERY_EMBEDDING_TIMEOUT)[0]
+            query_embedding_cache.put(cache_key, embedding)
+            return embedding
         except Exception as e:
             logger.error(f"生成查询向量时出错: {str(e)}")
             logger.error(f"查询文本: {encoded_text}")
             logger.error(f"模型名称: {self.model_name}")
             raise
 
+def _take_per_document(results, per_document_k):
+    """按原有顺序保留每个文档的前 per_document_k 个结果"""
+    counts = {}
+    kept = []
+    for doc, score in results:
+        document_id = doc.metadata.get('document_id')
+        if counts.get(document_id, 0) < per_document_k:
+            counts[document_id] = counts.get(document_id, 0) + 1
+            kept.append((doc, score))
+    return kept
+
+
+def _model_slug(model_name):
+    """嵌入模型名称对应的目录名：可读的前缀加名称哈希，避免不同名称清洗后冲突"""
+    readable = re.sub(r'[^A-Za-z0-9._-]', '_', model_name)[:64]
+    return f"{readable}-{hashlib.sha1(model_name.encode('utf-8')).hexdigest()[:8]}"
+
+
+class IndexNamespace:
+    """一个嵌入模型的语料索引（向量索引和关键词索引）
+
+    不同模型的向量维度和语义空间不同，各自保存在 faiss_index/models/<模型> 下。
+    """
+
+    def __init__(self, model_name, index_dir, vector_index_options):
+        self.model_name = model_name
+        self.index_dir = Path(index_dir)
+        self.vector_index = VectorIndex(self.index_dir, **vector_index_options)
+        self.keyword_index = KeywordIndex(self.index_dir / "keywords.db")
+        # 正在入库的文档: document_id -> [锁, 使用数]，同一文档同时只有一条流水线写入
+        self._ingest_locks = {}
+        self._ingest_locks_lock = threading.Lock()
+
+    @contextmanager
+    def ingest_lock(self, document_id):
+        """持有期间只有当前线程写入该文档：第一批写入会替换文档的旧数据，失败时的清理会删除文档的全部数据"""
+        with self._ingest_locks_lock:
+            entry = self._ingest_locks.setdefault(document_id, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._ingest_locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._ingest_locks[document_id]
+
+    def bump_versions(self, *document_ids):
+        """文档写入或删除后调用，使涉及这些文档的检索缓存失效（包括其他 worker 进程中的缓存）"""
+        self.vector_index.bump_versions(document_ids)
+
+    def versions(self, document_ids=None):
+        """返回文档的当前版本，document_ids 为 None 时返回整个索引的版本
+
+        版本号保存在向量索引的 chunks.db 中，由所有 worker 进程共享；清空索引后纪元改变，之前缓存的结果全部失效。
+        """
+        return self.vector_index.versions(document_ids)
+
+    def stats(self):
+        return {
+            "index_dir": str(self.index_dir),
+            "vector_index": self.vector_index.stats(),
+            "keyword_index": self.keyword_index.stats(),
+        }
+
+
+class SharedEmbeddingBatcher(EmbeddingProvider):
+    """多个文件共享的向量化批次
+
+    批量入库时每个文件的流水线各自调用 embed_documents，这里把同一时刻到达的请求合并成一次调用
+    （最多 max_texts 个文本，最多等待 linger 秒凑批），小文件不再各自发出不满的批次。
+    接口与嵌入客户端相同，可以直接传给 process_single_file。
+    """
+
+    def __init__(self, embeddings, max_texts=BATCH_EMBED_MAX_TEXTS, linger=BATCH_EMBED_LINGER):
+        self.embeddings = embeddings
+        self.model_name = embeddings.model_name
+        self.max_texts = max_texts
+        self.linger = linger
+        self.calls = 0  # 合并后实际调用的次数
+        self.requests = 0  # 各文件发出的请求数
+        self._pending = []  # [(文本列表, Future)]
+        self._changed = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name='shared-embedding', daemon=True)
+        self._thread.start()
+
+    def embed_documents(self, texts, progress_callback=None):
+        future = Future()
+        with self._changed:
+            if self._closed:
+                raise RuntimeError("共享向量化批次已关闭")
+            self._pending.append((list(texts), future))
+            self.requests += 1
+            self._changed.notify_all()
+        return future.result()
+
+    def embed_query(self, text):
+        return self.embeddings.embed_query(text)
+
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify_all()
+        self._thread.join()
+
+    def _pending_texts(self):
+        return sum(len(texts) for texts, _ in self._pending)
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                # 稍等其他文件的请求，凑满一批
+                deadline = time.monotonic() + self.linger
+                while not self._closed and self._pending_texts() < self.max_texts:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._changed.wait(remaining)
+                requests = [self._pending.pop(0)]
+                total = len(requests[0][0])
+                while self._pending and total + len(self._pending[0][0]) <= self.max_texts:
+                    requests.append(self._pending.pop(0))
+                    total += len(requests[-1][0])
+
+            texts = [text for request_texts, _ in requests for text in request_texts]
+            try:
+                vectors = self.embeddings.embed_documents(texts) if texts else []
+                self.calls += 1
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+            start = 0
+            for request_texts, future in requests:
+                future.set_result(vectors[start:start + len(request_texts)])
+                start += len(request_texts)
+
+
 class DocumentStore:
     _instance = None
     _initialized = False
@@ -138,38 +443,84 @@ class DocumentStore:
             logger.info(f"初始化DocumentStore，API基础URL: {base_url}, 模型名称: {model_name}")
             
             # 验证参数
-            if not api_key:
-                logger.warning("API密钥为空")
-            if not base_url:
-                logger.warning("API基础URL为空")
+            if not (model_name or '').startswith(LOCAL_MODEL_PREFIX):
+                if not api_key:
+                    logger.warning("API密钥为空")
+                if not base_url:
+                    logger.warning("API基础URL为空")
             if not model_name:
                 logger.warning("模型名称为空")
                 
-            self.embeddings = ArkEmbeddings(
-                api_key=api_key,
-                base_url=base_url,
-                model_name=model_name
+            # 文档向量缓存，按 (模型, 文本内容哈希) 复用已生成的向量
+            self.embedding_cache = EmbeddingCache(
+                Path("embedding_cache") / "embeddings.db",
+                max_entries=int(os.getenv('EMBEDDING_CACHE_MAX_ENTRIES', '200000'))
+            )
+            # 进程内 CPU 嵌入模型（模型名称为 local:<模型目录>）的推理参数
+            self._local_embedding_options = dict(
+                batch_size=int(os.getenv('LOCAL_EMBEDDING_BATCH_SIZE', '32')),
+                max_length=int(os.getenv('LOCAL_EMBEDDING_MAX_LENGTH', '512')),
+                threads=int(os.getenv('LOCAL_EMBEDDING_THREADS', '0')),
+                query_prefix=os.getenv('LOCAL_EMBEDDING_QUERY_PREFIX', ''),
+                pooling=os.getenv('LOCAL_EMBEDDING_POOLING') or None
             )
+            # 嵌入客户端池: (base_url, api_key 哈希, 模型) -> 嵌入后端，请求之间复用连接池
+            self._embedding_pool = OrderedDict()
+            self._embedding_pool_size = int(os.getenv('EMBEDDING_CLIENT_POOL_SIZE', '32'))
+            self._embedding_pool_lock = threading.Lock()
+            self._embedding_builds = {}  # 键 -> [创建锁, 等待数]，客户端在池锁之外创建
+            self.embedding_pool_hits = 0
+            self.embedding_pool_misses = 0
+            # 默认嵌入配置（环境变量），请求没有指定时使用
+            self.embeddings = self.get_embeddings(api_key, base_url, model_name)
             self.model_name = model_name  # 保存模型名称
-            self.vector_stores = {}  # 使用字典存储多个向量存储，键为文件哈希
             self.index_dir = Path("faiss_index")  # 索引存储目录
-            self.file_hashes = {}  # 文件路径到哈希的映射
             
             # 创建必要的目录
             self.index_dir.mkdir(exist_ok=True)
-            self._load_existing_hashes()
+            # 文件路径到哈希的映射和文档统计
+            self.manifest = DocumentManifest(self.index_dir / "manifest.db")
+            self._migrate_file_hashes()
             
-            # 尝试加载已有的向量存储
+            # 每个嵌入模型一个索引命名空间（faiss_index/models/<模型>），不同维度的向量互不干扰；
+            # 语料级向量索引第一次使用时才从磁盘加载
+            warm_set = [doc_id.strip() for doc_id in os.getenv('DOC_WARM_SET', '').split(',') if doc_id.strip()]
+            self._vector_index_options = dict(
+                cache_max_bytes=int(os.getenv('DOCSTORE_CACHE_MAX_BYTES', str(256 * 1024 * 1024))),
+                pinned=warm_set,
+                # 近似索引: auto 时存活文本块超过阈值后自动升级为 HNSW / IVF-PQ
+                index_type=os.getenv('VECTOR_INDEX_TYPE', 'auto'),
+                hnsw_threshold=int(os.getenv('VECTOR_INDEX_HNSW_THRESHOLD', '50000')),
+                ivf_threshold=int(os.getenv('VECTOR_INDEX_IVF_THRESHOLD', '500000')),
+                ef_search=int(os.getenv('HNSW_EF_SEARCH', '64')),
+                nprobe=int(os.getenv('IVF_NPROBE', '16')),
+                nlist=int(os.getenv('IVF_NLIST', '0')) or None
+            )
+            self._namespaces = {}
+            self._namespaces_lock = threading.Lock()
+            # PDF/DOCX 在子进程中解析，PARSE_WORKERS 默认为 CPU 核数
+            self.parse_pool = ParsePool(
+                workers=int(os.getenv('PARSE_WORKERS', '0')) or None,
+                timeout=float(os.getenv('PARSE_TIMEOUT', '300'))
+            )
+            self._migrate_root_index(model_name)
+            namespace = self._namespace(model_name)
             try:
-                self._load_all_vector_stores()
-                logger.info("成功加载已有的向量存储")
+                self._migrate_legacy_vector_stores(namespace)
             except Exception as e:
-                logger.error(f"加载向量存储失败: {str(e)}")
+                logger.error(f"迁移旧的向量存储失败: {str(e)}")
+
+            # 在后台预加载固定文档，不阻塞启动
+            if warm_set:
+                threading.Thread(target=namespace.vector_index.warm_up, daemon=True).start()
             
             self._initialized = True
     
     def update_config(self, api_key, base_url, model_name):
-        """更新DocumentStore的配置"""
+        """更新DocumentStore的默认嵌入配置
+
+        会修改进程内共享的状态，处理请求时应使用 get_embeddings 取得客户端并传给各个方法。
+        """
         logger.info(f"更新DocumentStore配置，新模型名称: {model_name}")
         
         # 验证参数
@@ -180,14 +531,110 @@ class DocumentStore:
         if not model_name:
             logger.warning("模型名称为空")
             
-        self.embeddings = ArkEmbeddings(
-            api_key=api_key,
-            base_url=base_url,
-            model_name=model_name
-        )
+        self.embeddings = self.get_embeddings(api_key, base_url, model_name)
         self.model_name = model_name
         logger.info("DocumentStore配置更新成功")
 
+    def get_embeddings(self, api_key, base_url, model_name):
+        """从客户端池中取得嵌入客户端，不修改共享状态
+
+        以 (base_url, api_key 的哈希, 模型名称) 为键复用长期存在的 ArkEmbeddings 及其 HTTP 连接池，
+        池满时淘汰最久未使用的客户端（正在使用它的请求不受影响）。
+        模型名称为 local:<模型目录> 时使用进程内的 CPU 模型，与 base_url 和 api_key 无关。
+        创建客户端（加载本地模型）时不持有池锁，其他键的请求不会被阻塞。
+        """
+        local = bool(model_name) and model_name.startswith(LOCAL_MODEL_PREFIX)
+        if local:
+            key = (None, None, model_name)
+        else:
+            key = (base_url, hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16], model_name)
+        with self._embedding_pool_lock:
+            embeddings = self._pooled_embeddings(key)
+            if embeddings is not None:
+                return embeddings
+            # 同一个键同时只创建一次（加载本地模型可能要几秒）
+            entry = self._embedding_builds.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                with self._embedding_pool_lock:
+                    # 等待期间另一个请求可能已经创建好
+                    embeddings = self._pooled_embeddings(key)
+                    if embeddings is not None:
+                        return embeddings
+                    self.embedding_pool_misses += 1
+                if local:
+                    # 本地推理不经过网络，不使用向量缓存
+                    embeddings = LocalEmbeddings(model_name[len(LOCAL_MODEL_PREFIX):], model_name=model_name,
+                                                 **self._local_embedding_options)
+                else:
+                    embeddings = ArkEmbeddings(
+                        api_key=api_key,
+                        base_url=base_url,
+                        model_name=model_name,
+                        cache=self.embedding_cache
+                    )
+                with self._embedding_pool_lock:
+                    self._embedding_pool[key] = embeddings
+                    while len(self._embedding_pool) > self._embedding_pool_size:
+                        self._embedding_pool.popitem(last=False)
+                return embeddings
+        finally:
+            with self._embedding_pool_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._embedding_builds[key]
+
+    def _pooled_embeddings(self, key):
+        """持有 _embedding_pool_lock 时调用：返回池中的客户端并记一次命中，没有时返回 None"""
+        embeddings = self._embedding_pool.get(key)
+        if embeddings is not None:
+            self._embedding_pool.move_to_end(key)
+            self.embedding_pool_hits += 1
+        return embeddings
+
+    def _namespace(self, model_name, create=True):
+        """返回嵌入模型对应的索引命名空间，第一次使用时打开
+
+        create 为 False 时，磁盘上还没有该模型的索引则返回 None，只读的查询不会创建空目录。
+        """
+        with self._namespaces_lock:
+            namespace = self._namespaces.get(model_name)
+            if namespace is None:
+                index_dir = self.index_dir / "models" / _model_slug(model_name)
+                if not create and not index_dir.exists():
+                    return None
+                namespace = IndexNamespace(model_name, index_dir, self._vector_index_options)
+                self._namespaces[model_name] = namespace
+                # 在后台补建缺失的关键词索引
+                threading.Thread(target=self._backfill_keyword_index, args=(namespace,), daemon=True).start()
+            return namespace
+
+    @property
+    def vector_index(self):
+        """默认嵌入模型的向量索引"""
+        return self._namespace(self.embeddings.model_name).vector_index
+
+    @property
+    def keyword_index(self):
+        """默认嵌入模型的关键词索引"""
+        return self._namespace(self.embeddings.model_name).keyword_index
+
+    def _migrate_root_index(self, model_name):
+        """把旧版本直接放在 faiss_index 下的语料索引移到默认嵌入模型的命名空间"""
+        root_files = [path for pattern in ("vectors.f32", "chunks.db*", "keywords.db*", "ann_*.faiss")
+                      for path in self.index_dir.glob(pattern)]
+        if not root_files:
+            return
+        target_dir = self.index_dir / "models" / _model_slug(model_name)
+        if (target_dir / "chunks.db").exists():
+            logger.warning(f"默认模型的命名空间已存在，保留 faiss_index 下的旧索引文件: {target_dir}")
+            return
+        target_dir.mkdir(parents=True, exist_ok=True)
+        for path in root_files:
+            path.rename(target_dir / path.name)
+        logger.info(f"已把旧的语料索引移到模型 {model_name} 的命名空间: {target_dir}")
+
     def _file_hash(self, file_path):
         """计算文件的 SHA256 哈希"""
         hash_sha256 = hashlib.sha256()
@@ -196,78 +643,95 @@ class DocumentStore:
                 hash_sha256.update(chunk)
         return hash_sha256.hexdigest()
 
-    def _load_existing_hashes(self):
-        """加载已有的哈希记录"""
+    def _migrate_file_hashes(self):
+        """把旧版本的 file_hashes.json 导入清单，导入后改名保留"""
         hash_file = self.index_dir / "file_hashes.json"
-        if hash_file.exists():
+        if not hash_file.exists():
+            return
+        try:
             with open(hash_file) as f:
-                self.file_hashes = json.load(f)
-            logger.info(f"已加载 {len(self.file_hashes)} 条文件哈希记录")
-            
-            # 记录文件名到哈希值的映射，方便调试
-            file_name_to_hash = {}
-            for file_path, file_hash in self.file_hashes.items():
-                file_name = Path(file_path).name
-                if file_name not in file_name_to_hash:
-                    file_name_to_hash[file_name] = []
-                file_name_to_hash[file_name].append(file_hash)
-            
-            # 记录同名文件的情况
-            for file_name, hashes in file_name_to_hash.items():
-                if len(hashes) > 1:
-                    logger.info(f"文件名 '{file_name}' 对应多个哈希值: {hashes}")
-        else:
-            logger.info("没有找到文件哈希记录，将创建新的记录")
-
-    def _save_hashes(self):
-        """保存哈希记录"""
-        hash_file = self.index_dir / "file_hashes.json"
-        with open(hash_file, "w") as f:
-            json.dump(self.file_hashes, f)
-        logger.info(f"已保存 {len(self.file_hashes)} 条文件哈希记录到 {hash_file}")
+                file_hashes = json.load(f)
+            self.manifest.import_hashes(file_hashes)
+            hash_file.rename(hash_file.with_name("file_hashes.json.migrated"))
+            logger.info(f"已把 {len(file_hashes)} 条文件哈希记录迁移到清单")
+        except Exception as e:
+            logger.error(f"迁移文件哈希记录失败: {str(e)}")
 
-    def _load_all_vector_stores(self):
-        """加载所有已存在的向量存储"""
-        if not self.file_hashes:
-            return
-        
-        for file_path, file_hash in self.file_hashes.items():
+    def _migrate_legacy_vector_stores(self, namespace):
+        """把旧版本按文件保存的 faiss_index/<hash> 索引合并到默认模型的语料索引中"""
+        migrated = []
+        for file_hash in self.manifest.content_hashes():
+            legacy_path = self.index_dir / file_hash
+            # 先检查旧目录是否存在，没有旧索引时不触发语料索引的加载
+            if not (legacy_path / "index.faiss").exists() or file_hash in namespace.vector_index:
+                continue
             try:
-                index_path = self.index_dir / file_hash
-                if index_path.exists():
-                    self.vector_stores[file_hash] = FAISS.load_local(
-                        str(index_path),
-                        self.embeddings,
-                        allow_dangerous_deserialization=True
-                    )
-                    logger.info(f"已加载索引: {file_hash} (文件: {file_path})")
+                legacy_store = FAISS.load_local(
+                    str(legacy_path),
+                    self.embeddings,
+                    allow_dangerous_deserialization=True
+                )
+                ntotal = legacy_store.index.ntotal
+                vectors = legacy_store.index.reconstruct_n(0, ntotal)
+                documents = [
+                    legacy_store.docstore.search(legacy_store.index_to_docstore_id[i])
+                    for i in range(ntotal)
+                ]
+                chunk_ids = namespace.vector_index.add_document(file_hash, documents, vectors)
+                namespace.keyword_index.add_document(file_hash, chunk_ids, [doc.page_content for doc in documents])
+                namespace.bump_versions(file_hash)
+                migrated.append(file_hash)
+                logger.info(f"已迁移旧索引: {file_hash}，共 {ntotal} 个文本块")
             except Exception as e:
-                logger.error(f"加载索引失败 {file_hash}: {str(e)}")
-    
-    def _save_vector_store(self, file_hash):
-        """保存指定哈希的向量存储到磁盘"""
-        if file_hash in self.vector_stores:
-            index_path = self.index_dir / file_hash
-            self.vector_stores[file_hash].save_local(str(index_path))
-            logger.info(f"向量索引已保存到: {index_path}")
-
-    def _load_vector_store(self, file_hash):
-        """从磁盘加载指定哈希的向量存储"""
-        index_path = self.index_dir / file_hash
-        if index_path.exists():
-            self.vector_stores[file_hash] = FAISS.load_local(
-                str(index_path),
-                self.embeddings,
-                allow_dangerous_deserialization=True
-            )
-            logger.info(f"已加载缓存的向量索引: {file_hash}")
-            return True
-        else:
-            logger.warning(f"没有找到缓存的向量索引: {file_hash}")
-            return False
+                logger.error(f"迁移旧索引失败 {file_hash}: {str(e)}")
+
+        if migrated:
+            # 语料索引写入即持久化，迁移成功后删除旧目录
+            for file_hash in migrated:
+                shutil.rmtree(self.index_dir / file_hash, ignore_errors=True)
+            logger.info(f"共迁移 {len(migrated)} 个旧索引到语料索引")
+
+    def _backfill_keyword_index(self, namespace):
+        """为向量索引中已有但关键词索引中缺失的文档建立倒排表"""
+        try:
+            missing = set(namespace.vector_index.document_ids()) - set(namespace.keyword_index.document_ids())
+            for document_id in missing:
+                chunks = namespace.vector_index.document_chunks(document_id)
+                namespace.keyword_index.add_document(document_id, [chunk_id for chunk_id, _ in chunks],
+                                                     [doc.page_content for _, doc in chunks])
+                namespace.bump_versions(document_id)
+            if missing:
+                logger.info(f"已为 {len(missing)} 个文档补建关键词索引")
+        except Exception as e:
+            logger.error(f"补建关键词索引失败: {str(e)}")
+
+    def process_single_file(self, file_path, embeddings=None, progress_callback=None, parse_timeout=None,
+                            expected_hash=None, replaces=None):
+        """处理单个文件
+
+        Args:
+            file_path: 文件路径
+            embeddings: 可选，使用指定的嵌入客户端（见 get_embeddings），默认为默认嵌入配置；
+                文档写入该客户端模型的索引命名空间
+            progress_callback: 可选，进度回调 progress_callback(阶段, 已完成数, 总数)，
+                阶段依次为 loading / embedding；embedding 阶段的已完成数为已写入索引的文本块数，
+                总数为目前已切分出的文本块数
+            parse_timeout: 可选，在子进程中解析时的超时秒数，默认为 PARSE_TIMEOUT
+            expected_hash: 可选，提交时文件内容的 SHA256；文件内容已经不同时不入库，返回失败
+            replaces: 可选，客户端指明这个文件是哪个文档的新版本（旧的 document_id）。
+                旧版本中未变化的文本块直接复用，新版本完成后旧版本被删除；
+                不指定时同名文件的不同内容各自成为独立的文档，已经返回给客户端的 document_id 不受影响
+
+        Returns:
+            dict: {"success", "document_id"}，失败时带有 "error"
+        """
+        embeddings = embeddings or self.embeddings
+        namespace = self._namespace(embeddings.model_name)
+
+        def report(stage, done=0, total=0):
+            if progress_callback:
+                progress_callback(stage, done, total)
 
-    def process_single_file(self, file_path):
-        """处理单个文件"""
         logger.info(f"处理文件: {file_path}")
         
         # 获取文件名（不含路径）
@@ -276,139 +740,512 @@ class DocumentStore:
         
         # 获取文件类型和对应的加载器
         ext = Path(file_path).suffix.lower()
-        loaders = {
-            '.txt': TextLoader,
-            '.pdf': PyPDFLoader,
-            '.doc': UnstructuredWordDocumentLoader,
-            '.docx': UnstructuredWordDocumentLoader,
-            '.md': UnstructuredMarkdownLoader,
-        }
-        
-        loader_cls = loaders.get(ext)
-        if not loader_cls:
+        if ext not in LOADERS:
             logger.error(f"不支持的文件类型: {ext}")
             raise ValueError(f"不支持的文件类型: {ext}")
         
         try:
             # 计算文件哈希
             current_hash = self._file_hash(file_path)
+            if expected_hash and current_hash != expected_hash:
+                raise ValueError(f"文件内容与提交时不一致: {file_path}")
             
-            # 检查是否有相同文件名的文档已经处理过
-            same_name_hash = None
-            for existing_path, existing_hash in self.file_hashes.items():
-                if Path(existing_path).name == file_name and existing_hash in self.vector_stores:
-                    same_name_hash = existing_hash
-                    logger.info(f"发现同名文件的索引: {file_name} -> {same_name_hash}")
-                    break
+            # 同一文档同时只有一条流水线写入：另一条流水线先完成时直接复用它的结果，
+            # 失败时的清理也只会删除本流水线写入的数据
+            with namespace.ingest_lock(current_hash):
+                # 内容完全相同的文档已经入库时直接复用，与文件名和路径无关
+                if current_hash in namespace.vector_index:
+                    logger.info(f"相同内容的文档已入库，直接使用: {current_hash}")
+                    self.manifest.set_hash(file_path, current_hash)
+                    return {
+                        "success": True,
+                        "document_id": current_hash
+                    }
             
-            # 如果找到同名文件的索引，直接使用
-            if same_name_hash:
-                logger.info(f"使用同名文件的索引: {same_name_hash}")
-                # 更新哈希映射，将当前文件路径映射到同名文件的哈希值
-                self.file_hashes[file_path] = same_name_hash
-                self._save_hashes()
-                return {
-                    "success": True,
-                    "document_id": same_name_hash
-                }
+                # 客户端指明的上一个版本：没有其他文件引用它时，未变化的文本块直接复用
+                previous_hash = None
+                if replaces and replaces != current_hash and replaces in namespace.vector_index:
+                    other_paths = [path for path in self.manifest.paths_for_hash(replaces) if path != file_path]
+                    if other_paths:
+                        logger.info(f"旧版本 {replaces} 还被其他文件引用，保留旧版本并完整入库新版本")
+                    else:
+                        previous_hash = replaces
+                        logger.info(f"基于旧版本 {previous_hash} 增量重建索引")
+
+                # 按页流式加载、切分、向量化并追加到索引，每写入一批即可被检索
+                started = time.time()
+                report("loading")
+                if ext in SUBPROCESS_PARSE_EXTENSIONS:
+                    chunks = self._parse_chunks(file_path, timeout=parse_timeout)
+                else:
+                    chunks = split_chunks(file_path)
+                try:
+                    chunk_count = self._ingest_stream(namespace, current_hash, chunks, embeddings, report,
+                                                      previous_id=previous_hash)
+                except Exception:
+                    # 写入失败时删除已经写入的部分，避免留下不完整的文档
+                    namespace.vector_index.remove_document(current_hash)
+                    namespace.keyword_index.remove_document(current_hash)
+                    namespace.bump_versions(current_hash)
+                    raise
+                logger.info(f"共写入 {chunk_count} 个文本块")
+
+                # 更新清单，每次只写入一行
+                self.manifest.set_hash(file_path, current_hash)
+                self.manifest.record_document(current_hash, file_name, chunk_count, os.path.getsize(file_path),
+                                              embeddings.model_name, time.time() - started)
+                if previous_hash:
+                    self.manifest.remove_document(previous_hash, embeddings.model_name)
             
-            # 检查文件是否已经处理过且未修改
-            if self.file_hashes.get(file_path) == current_hash and current_hash in self.vector_stores:
-                logger.info(f"文件未修改，使用缓存的向量索引: {current_hash}")
+                logger.info("向量存储更新完成")
                 return {
                     "success": True,
                     "document_id": current_hash
                 }
             
-            # 加载文档
-            if loader_cls == TextLoader:
-                loader = loader_cls(file_path, encoding='utf-8')
-            else:
-                loader = loader_cls(file_path)
-            documents = loader.load()
-            
-            if not documents:
-                logger.error("文档加载失败")
-                raise ValueError("文档加载失败")
-            
-            # 更新哈希映射
-            self.file_hashes[file_path] = current_hash
-            
-            # 切分文档
-            text_splitter = RecursiveCharacterTextSplitter(
-                chunk_size=1000,
-                chunk_overlap=200
-            )
-            texts = text_splitter.split_documents(documents)
-            
-            if not texts:
-                logger.error("文档切分失败")
-                raise ValueError("文档切分失败")
-            
-            logger.info(f"处理 {len(texts)} 个文本块...")
-            
-            # 创建新的向量存储
-            self.vector_stores[current_hash] = FAISS.from_documents(texts, self.embeddings)
-            
-            # 保存向量存储和哈希
-            self._save_vector_store(current_hash)
-            self._save_hashes()
-            
-            logger.info("向量存储更新完成")
-            return {
-                "success": True,
-                "document_id": current_hash
-            }
-            
         except Exception as e:
             logger.error(f"处理文件时出错: {str(e)}")
             return {
                 "success": False,
-                "document_id": None
+                "document_id": None,
+                "error": str(e)
             }
 
-    def search(self, query, k=3, document_id=None):
-        """在向量存储中搜索
-        
+    def _parse_chunks(self, file_path, timeout=None):
+        """在解析子进程中加载切分文档，依次返回文本块"""
+        batches = self.parse_pool.iter(split_chunk_batches, file_path, INGEST_BATCH_CHUNKS, timeout=timeout)
+        try:
+            for batch in batches:
+                yield from batch
+        finally:
+            batches.close()
+
+    def _ingest_stream(self, namespace, document_id, chunks, embeddings, report, previous_id=None):
+        """流式入库
+
+        chunks 为按顺序产出文本块的迭代器（本线程切分或解析子进程传回）。
+        加载切分线程 -> 有界队列 -> 向量化线程 -> 有界队列 -> 当前线程写索引，
+        任意时刻内存中最多只有几批文本块和向量，与文档大小无关。
+        第一批写入时替换该文档的旧数据，之后追加，全部写完后才标记为完整。
+
+        指定 previous_id（客户端通过 replaces 指明要替换的文档）时按内容哈希比对文本块：
+        内容相同的文本块不重新向量化。写入过程中它们在两个索引里都仍属于旧版本，
+        全部写完后才把向量行和关键词倒排表一起转给新文档，旧版本中剩下的文本块随旧文档一起记为墓碑。
+        转移过程中失败时文本块还给旧版本，旧版本保持可检索。
+
+        Returns:
+            int: 写入的文本块数
+        """
+        chunk_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        vector_queue = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+        stop = threading.Event()
+        done = object()
+        counts = {"split": 0}
+
+        # 旧版本文本块: 内容哈希 -> 可复用的 chunk_id（内容重复的文本块按出现顺序依次复用）
+        reusable = {}
+        if previous_id:
+            for chunk_id, content_hash in namespace.vector_index.chunk_hashes(previous_id):
+                reusable.setdefault(content_hash, deque()).append(chunk_id)
+
+        def put(target, item):
+            # 下游出错退出后不再阻塞在满队列上
+            while not stop.is_set():
+                try:
+                    target.put(item, timeout=0.5)
+                    return
+                except queue.Full:
+                    continue
+
+        def load_and_split():
+            try:
+                batch = []
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    batch.append(chunk)
+                    counts["split"] += 1
+                    if len(batch) >= INGEST_BATCH_CHUNKS:
+                        put(chunk_queue, batch)
+                        batch = []
+                if batch:
+                    put(chunk_queue, batch)
+                put(chunk_queue, done)
+            except Exception as e:
+                put(chunk_queue, e)
+            finally:
+                # 提前停止时结束切分（终止解析子进程）
+                close = getattr(chunks, 'close', None)
+                if close:
+                    close()
+
+        def embed():
+            while not stop.is_set():
+                batch = chunk_queue.get()
+                if batch is done or isinstance(batch, Exception):
+                    put(vector_queue, batch)
+                    return
+                # 只有旧版本中没有的文本块需要向量化
+                reused_ids = []
+                new_chunks = []
+                for chunk in batch:
+                    candidates = reusable.get(text_hash(chunk.page_content))
+                    if candidates:
+                        reused_ids.append(candidates.popleft())
+                    else:
+                        reused_ids.append(None)
+                        new_chunks.append(chunk)
+                try:
+                    vectors = embeddings.embed_documents([chunk.page_content for chunk in new_chunks]) \
+                        if new_chunks else []
+                except Exception as e:
+                    put(vector_queue, e)
+                    return
+                put(vector_queue, (batch, reused_ids, new_chunks, vectors))
+
+        workers = [threading.Thread(target=load_and_split, daemon=True),
+                   threading.Thread(target=embed, daemon=True)]
+        for worker in workers:
+            worker.start()
+
+        written = 0
+        appended = 0
+        keyword_written = False
+        # 复用的文本块: (chunk_id, 新元数据, 文本)，写完后一次性转给新文档，中途失败时旧版本保持完整
+        reused = []
+        try:
+            while True:
+                item = vector_queue.get()
+                if item is done:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                batch, reused_ids, new_chunks, vectors = item
+                new_ids = iter(namespace.vector_index.add_document(document_id, new_chunks, vectors,
+                                                                   append=appended > 0, complete=False)
+                               if new_chunks else [])
+                appended += len(new_chunks)
+                chunk_ids = []
+                for chunk, reused_id in zip(batch, reused_ids):
+                    if reused_id is None:
+                        chunk_ids.append(next(new_ids))
+                    else:
+                        reused.append((reused_id, chunk.metadata, chunk.page_content))
+                # 用同样的 chunk_id 建立关键词倒排表；复用的文本块仍属于旧版本，最后与向量行一起转移
+                if new_chunks:
+                    namespace.keyword_index.add_document(document_id, chunk_ids,
+                                                         [chunk.page_content for chunk in new_chunks],
+                                                         append=keyword_written)
+                    keyword_written = True
+                # 两个索引都写入后再更新版本，检索缓存不会留下只含一半新内容的结果
+                namespace.bump_versions(document_id)
+                written += len(batch)
+                report("embedding", written, counts["split"])
+        finally:
+            stop.set()
+            # 唤醒可能阻塞在 get 上的向量化线程
+            try:
+                chunk_queue.put_nowait(done)
+            except queue.Full:
+                pass
+
+        if not written:
+            logger.error("文档切分失败")
+            raise ValueError("文档切分失败")
+
+        if previous_id:
+            self._replace_previous(namespace, document_id, previous_id, reused, append=keyword_written)
+            logger.info(f"增量重建完成: 复用 {len(reused)} 个文本块，新向量化 {appended} 个")
+        else:
+            namespace.vector_index.mark_complete(document_id)
+        namespace.bump_versions(document_id)
+        return written
+
+    def _replace_previous(self, namespace, document_id, previous_id, reused, append):
+        """把复用的文本块从旧版本转给新文档，并删除旧版本
+
+        向量行和关键词倒排表各在一个事务中转移（关键词索引在同一个事务中删除旧版本的倒排表），
+        最后才把旧版本剩下的向量行记为墓碑。之前的任何一步失败时，文本块还给旧版本并重建旧版本的倒排表，
+        调用方随后删除新文档时不会删掉旧版本的文本块。
+        """
+        chunk_ids = [chunk_id for chunk_id, _, _ in reused]
+        previous_metadata = {chunk_id: doc.metadata
+                             for chunk_id, doc in namespace.vector_index.document_chunks(previous_id)}
+        try:
+            if chunk_ids:
+                namespace.vector_index.reassign_chunks(chunk_ids, document_id,
+                                                       [metadata for _, metadata, _ in reused], complete=True)
+            else:
+                namespace.vector_index.mark_complete(document_id)
+            namespace.keyword_index.add_document(document_id, chunk_ids, [text for _, _, text in reused],
+                                                 append=append, replaces=previous_id)
+        except Exception:
+            logger.error(f"复用的文本块转移失败，还给旧版本 {previous_id}")
+            namespace.vector_index.reassign_chunks(chunk_ids, previous_id,
+                                                   [previous_metadata[chunk_id] for chunk_id in chunk_ids])
+            previous_chunks = namespace.vector_index.document_chunks(previous_id)
+            namespace.keyword_index.add_document(previous_id, [chunk_id for chunk_id, _ in previous_chunks],
+                                                 [doc.page_content for _, doc in previous_chunks])
+            namespace.bump_versions(document_id, previous_id)
+            raise
+        # 旧版本中没有被复用的文本块记为墓碑
+        namespace.vector_index.remove_document(previous_id)
+        namespace.bump_versions(previous_id)
+
+    def process_files(self, file_paths, embeddings=None, progress_callback=None, parse_timeout=None):
+        """批量入库多个文件
+
+        每个文件各自走 process_single_file 的流式流水线，PDF/DOCX 在解析子进程池中并行解析，
+        各文件的向量化请求合并成共享的批次。
+
+        Args:
+            file_paths: 文件路径列表
+            embeddings: 可选，使用指定的嵌入客户端，默认为默认嵌入配置
+            progress_callback: 可选，进度回调 progress_callback(文件序号, 阶段, 已完成数, 总数)
+            parse_timeout: 可选，单个文件的解析超时秒数，默认为 PARSE_TIMEOUT
+
+        Returns:
+            List[dict]: 与 file_paths 一一对应的 process_single_file 结果
+        """
+        if not file_paths:
+            return []
+        batcher = SharedEmbeddingBatcher(embeddings or self.embeddings)
+
+        def run(index, file_path):
+            def on_progress(stage, done, total):
+                if progress_callback:
+                    progress_callback(index, stage, done, total)
+            return self.process_single_file(file_path, embeddings=batcher, progress_callback=on_progress,
+                                            parse_timeout=parse_timeout)
+
+        try:
+            workers = min(len(file_paths), self.parse_pool.workers)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='batch-ingest') as executor:
+                results = list(executor.map(run, range(len(file_paths)), file_paths))
+        finally:
+            batcher.close()
+        logger.info(f"批量入库 {len(file_paths)} 个文件，成功 {sum(r['success'] for r in results)} 个，"
+                    f"向量化请求 {batcher.requests} 次合并为 {batcher.calls} 次")
+        return results
+
+    def search_with_scores(self, query, k=3, document_ids=None, mode=None, embeddings=None, per_document_k=None):
+        """在文档中检索，并返回带分数的结果
+
+        hybrid 模式同时做 BM25 关键词检索和向量检索，用倒数排名融合（RRF）合并；
+        查询向量化失败或超时时只使用关键词检索的结果。
+        查询只向量化一次，指定 document_ids 时在索引内部过滤。
+
         Args:
             query: 搜索查询
             k: 返回结果数量
-            document_id: 文件哈希值，如果指定则只在该文件的索引中搜索，否则搜索所有索引
+            document_ids: 文件哈希值列表，如果指定则只在这些文件中搜索，否则搜索所有文件
+            mode: 检索模式，hybrid / vector / keyword，默认为 RETRIEVAL_MODE
+            embeddings: 可选，查询使用的嵌入客户端（见 get_embeddings），在该模型的索引命名空间中检索
+            per_document_k: 可选，与 document_ids 一起使用时每个文档各返回最多 per_document_k 个结果（忽略 k），
+                一个高度相关的文档不会占满全部名额；查询仍只向量化一次、只做一次关键词检索
+
+        Returns:
+            List[Tuple[Document, float]]: (文本块, 分数) 列表，按相关性降序排列。
+            vector 模式下分数为 L2 距离（越小越相关），其余模式为融合分数（越大越相关）
         """
-        if not self.vector_stores:
+        mode = mode or RETRIEVAL_MODE
+        embeddings = embeddings or self.embeddings
+        namespace = self._namespace(embeddings.model_name, create=False)
+        if namespace is None or not len(namespace.vector_index):
             logger.warning("没有可用的向量存储")
             return []
-        
-        all_results = []
-        if document_id:
-            # 只在指定文档中搜索
-            if document_id not in self.vector_stores:
-                logger.warning(f"未找到指定文档的向量存储: {document_id}")
-                return []
+
+        # 重新生成回答、多个标签页或分享链接会用同样的问题检索同样的文档，命中缓存时跳过检索
+        document_ids = sorted(set(document_ids)) if document_ids else None
+        per_document_k = per_document_k if document_ids else None
+        cache_key = (normalize_query(query), tuple(document_ids) if document_ids else None,
+                     embeddings.model_name, k, mode, per_document_k)
+        # 版本号在检索开始前读取，检索期间文档有写入时这次的结果下次读取即失效
+        versions = namespace.versions(document_ids)
+        cached = retrieval_cache.get(cache_key, versions)
+        if cached is not None:
+            logger.info(f"命中检索结果缓存，返回 {len(cached)} 个相关片段")
+            return cached
+
+        started = time.perf_counter()
+        results, degraded = self._search_namespace(namespace, query, k, document_ids, mode, embeddings,
+                                                   per_document_k)
+        # 查询向量化失败时只有关键词检索的结果，不写入缓存
+        if not degraded:
+            retrieval_cache.put(cache_key, versions, results, time.perf_counter() - started)
+        return results
+
+    def _search_namespace(self, namespace, query, k, document_ids, mode, embeddings, per_document_k=None):
+        """在一个命名空间中检索，返回 (结果, 是否因查询向量化失败而只用了关键词检索)"""
+        if document_ids:
+            target_hashes = []
+            for document_id in document_ids:
+                # 正在流式写入的文档，已写入的部分同样可以检索
+                if namespace.vector_index.document_status(document_id) is not None:
+                    target_hashes.append(document_id)
+                else:
+                    logger.warning(f"未找到指定文档的向量存储: {document_id}")
+            if not target_hashes:
+                return [], False
+        else:
+            target_hashes = None
+
+        # 融合前每路多取一些候选；按文档分配名额时每个文档各取候选，保证每个文档都能凑够名额
+        per_document = per_document_k if target_hashes else None
+        base_k = per_document or k
+        candidate_k = base_k if mode == 'vector' else max(base_k * 2, 20)
+
+        vector_results = []
+        degraded = False
+        if mode in ('hybrid', 'vector'):
             try:
-                results = self.vector_stores[document_id].similarity_search(query, k=k)
-                all_results.extend(results)
-                logger.info(f"在文档 {document_id} 中找到 {len(results)} 个相关片段")
+                # 只生成一次查询向量，在语料索引内部按文档过滤
+                query_embedding = embeddings.embed_query(query)
+                if per_document:
+                    # 同一个查询向量在每个文档内各取候选，再按距离合成一个排名
+                    for document_id in target_hashes:
+                        vector_results.extend(namespace.vector_index.search_by_vector(
+                            query_embedding, k=candidate_k, document_ids=[document_id]))
+                    vector_results.sort(key=lambda item: item[1])
+                else:
+                    vector_results = namespace.vector_index.search_by_vector(query_embedding, k=candidate_k,
+                                                                             document_ids=target_hashes)
             except Exception as e:
-                logger.error(f"搜索向量存储 {document_id} 时出错: {str(e)}")
-        else:
-            # 在所有文档中搜索
-            for file_hash, vector_store in self.vector_stores.items():
-                try:
-                    results = vector_store.similarity_search(query, k=k)
-                    all_results.extend(results)
-                    logger.info(f"在文档 {file_hash} 中找到 {len(results)} 个相关片段")
-                except Exception as e:
-                    logger.error(f"搜索向量存储 {file_hash} 时出错: {str(e)}")
+                if mode == 'vector':
+                    raise
+                logger.error(f"向量检索失败，只使用关键词检索: {str(e)}")
+                degraded = True
+            logger.info(f"向量检索找到 {len(vector_results)} 个相关片段")
+            if mode == 'vector':
+                if per_document:
+                    return _take_per_document(vector_results, per_document), False
+                return vector_results[:k], False
+
+        keyword_k = candidate_k * len(target_hashes) if per_document else candidate_k
+        keyword_results = namespace.keyword_index.search(query, k=keyword_k, document_ids=target_hashes)
+        logger.info(f"关键词检索找到 {len(keyword_results)} 个相关片段")
+
+        candidate_lists = [
+            [doc.metadata['chunk_id'] for doc, _ in vector_results],
+            [chunk_id for chunk_id, _ in keyword_results],
+        ]
+        fused = reciprocal_rank_fusion(candidate_lists, sum(len(ranked) for ranked in candidate_lists)
+                                       if per_document else k)
+
+        documents = {doc.metadata['chunk_id']: doc for doc, _ in vector_results}
+        bm25_scores = dict(keyword_results)
+        missing = [chunk_id for chunk_id, _ in fused if chunk_id not in documents]
+        for chunk_id, (document_id, doc) in namespace.vector_index.get_chunks(missing).items():
+            documents[chunk_id] = Document(page_content=doc.page_content,
+                                           metadata={**doc.metadata, 'document_id': document_id,
+                                                     'chunk_id': chunk_id})
+
+        results = []
+        for chunk_id, score in fused:
+            doc = documents.get(chunk_id)
+            if doc is None:
+                continue
+            if 'score' in doc.metadata:
+                doc.metadata['distance'] = doc.metadata['score']
+            if chunk_id in bm25_scores:
+                doc.metadata['bm25'] = bm25_scores[chunk_id]
+            doc.metadata['score'] = score
+            results.append((doc, score))
+        if per_document:
+            results = _take_per_document(results, per_document)
+        logger.info(f"融合后返回 {len(results)} 个相关片段")
+        return results, degraded
+
+    def search(self, query, k=3, document_id=None, document_ids=None, embeddings=None):
+        """在向量存储中搜索
         
-        # 按相关性排序并返回前k个结果
-        return sorted(all_results, key=lambda x: x.metadata.get('score', 0), reverse=True)[:k]
+        Args:
+            query: 搜索查询
+            k: 返回结果数量
+            document_id: 文件哈希值，如果指定则只在该文件的索引中搜索，否则搜索所有索引
+            document_ids: 文件哈希值列表，与 document_id 含义相同，可以同时指定多个文件
+            embeddings: 可选，查询使用的嵌入客户端
+        """
+        if document_id:
+            document_ids = list(document_ids or []) + [document_id]
+        return [doc for doc, _ in self.search_with_scores(query, k=k, document_ids=document_ids,
+                                                          embeddings=embeddings)]
+
+    def stats(self):
+        """返回索引和各级缓存的统计信息"""
+        with self._namespaces_lock:
+            namespaces = dict(self._namespaces)
+        with self._embedding_pool_lock:
+            embedding_clients = {
+                "size": len(self._embedding_pool),
+                "max_size": self._embedding_pool_size,
+                "hits": self.embedding_pool_hits,
+                "misses": self.embedding_pool_misses,
+            }
+        default = self._namespace(self.embeddings.model_name)
+        return {
+            "vector_index": default.vector_index.stats(),
+            "keyword_index": default.keyword_index.stats(),
+            "namespaces": {model: namespace.stats() for model, namespace in namespaces.items()},
+            "embedding_clients": embedding_clients,
+            "parse_pool": self.parse_pool.stats(),
+            "embedding_cache": self.embedding_cache.stats(),
+            "query_embedding_cache": query_embedding_cache.stats(),
+            "retrieval_cache": retrieval_cache.stats(),
+            "manifest": self.manifest.stats(),
+        }
+
+    def find_by_content_hash(self, content_hash, file_path=None, model_name=None):
+        """按内容哈希（文件字节的 sha256）查找已入库的文档
+
+        Args:
+            content_hash: 文件内容的 SHA256
+            file_path: 可选，找到时把这个路径也记到清单中，之后同一路径的更新可以增量重建
+            model_name: 可选，只在该嵌入模型的索引命名空间中查找，默认为默认嵌入模型
+
+        Returns:
+            str: 文档ID，没有完整入库时返回 None
+        """
+        namespace = self._namespace(model_name or self.embeddings.model_name, create=False)
+        if namespace is None or content_hash not in namespace.vector_index:
+            return None
+        if file_path:
+            self.manifest.set_hash(file_path, content_hash)
+        return content_hash
+
+    def document_info(self, document_id, model_name=None):
+        """返回文档的清单信息（统计和文件路径）以及在某个嵌入模型索引中的状态"""
+        model_name = model_name or self.embeddings.model_name
+        info = self.manifest.document(document_id, model_name)
+        namespace = self._namespace(model_name, create=False)
+        status = namespace.vector_index.document_status(document_id) if namespace is not None else None
+        if info is None and status is None:
+            return None
+        info = info or {"document_id": document_id, "paths": []}
+        info["status"] = status
+        return info
 
     def clear(self):
-        """清空向量存储"""
-        self.vector_stores = {}
-        self.file_hashes = {}
+        """清空所有嵌入模型的向量存储"""
+        with self._namespaces_lock:
+            namespaces = list(self._namespaces.values())
+        for namespace in namespaces:
+            namespace.vector_index.clear()
+            namespace.keyword_index.clear()
+        retrieval_cache.clear()
+        self.manifest.clear()
         if self.index_dir.exists():
+            opened = {namespace.index_dir.name for namespace in namespaces}
+            models_dir = self.index_dir / "models"
+            for f in models_dir.glob("*"):
+                # 已打开的命名空间在上面清空，其余的直接删除
+                if f.name not in opened:
+                    shutil.rmtree(f) if f.is_dir() else f.unlink()
             for f in self.index_dir.glob("*"):
-                f.unlink()
+                if f.name == "models" or f.name.startswith("manifest.db"):
+                    continue
+                if f.is_dir():
+                    shutil.rmtree(f)
+                else:
+                    f.unlink()
         logger.info("向量存储已清空")
\ No newline at end of file
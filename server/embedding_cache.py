@@ -0,0 +1,203 @@
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger('document_store')
+
+
+def text_hash(text):
+    """计算文本块内容的 SHA256，作为缓存的内容地址"""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """持久化的内容寻址向量缓存
+
+    以 (模型名称, sha256(文本)) 为键，把向量以 float32 二进制形式保存在 SQLite 中。
+    条目数超过上限时按最近使用时间淘汰最旧的条目。
+    """
+
+    def __init__(self, db_path, max_entries=200000):
+        self.db_path = Path(db_path)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings(last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        logger.info(f"向量缓存已打开: {self.db_path}，现有 {self._size} 条记录")
+
+    def get_many(self, model, hashes):
+        """批量查询缓存
+
+        Returns:
+            Dict[str, List[float]]: 命中的 text_hash -> 向量
+        """
+        found = {}
+        if not hashes:
+            return found
+        unique_hashes = list(dict.fromkeys(hashes))
+        with self._lock:
+            # SQLite 单条语句的参数数量有限，分段查询
+            for i in range(0, len(unique_hashes), 500):
+                part = unique_hashes[i:i + 500]
+                placeholders = ",".join("?" * len(part))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *part]
+                ).fetchall()
+                for hash_value, blob in rows:
+                    found[hash_value] = np.frombuffer(blob, dtype='float32').tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, hash_value) for hash_value in found]
+                )
+                self._conn.commit()
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+        return found
+
+    def put_many(self, model, items):
+        """批量写入缓存
+
+        Args:
+            model: 模型名称
+            items: (text_hash, 向量) 列表
+        """
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (model, hash_value, np.asarray(vector, dtype='float32').tobytes(), now)
+            for hash_value, vector in items
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._conn.commit()
+            self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            if self._size > self.max_entries:
+                self._evict()
+
+    def _evict(self):
+        """淘汰最久未使用的条目，一次多淘汰 10%，避免每次写入都触发"""
+        target = int(self.max_entries * 0.9)
+        overflow = self._size - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN "
+            "(SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (overflow,)
+        )
+        self._conn.commit()
+        self._size -= overflow
+        self.evictions += overflow
+        logger.info(f"向量缓存淘汰 {overflow} 条记录，剩余 {self._size} 条")
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": self._size,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+
+
+def normalize_query(text):
+    """规范化查询文本：统一全角半角、合并空白、忽略大小写"""
+    return " ".join(unicodedata.normalize('NFKC', text).split()).casefold()
+
+
+class QueryEmbeddingCache:
+    """进程内的查询向量 LRU 缓存
+
+    以 (模型名称, base_url, 规范化后的查询) 为键，条目超过 ttl 秒后失效，
+    条目数超过上限时淘汰最久未使用的条目。
+    """
+
+    def __init__(self, max_entries=1024, ttl=3600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (写入时间, 向量)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            created_at, vector = entry
+            if time.monotonic() - created_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, key, vector):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), vector)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
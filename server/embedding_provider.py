@@ -0,0 +1,36 @@
+from abc import ABC, abstractmethod
+
+
+class EmbeddingProvider(ABC):
+    """嵌入后端接口
+
+    DocumentStore 只依赖这里的方法：入库调用 embed_documents，检索调用 embed_query，
+    model_name 决定文档写入哪个索引命名空间和向量缓存的键。
+    """
+
+    model_name = None
+
+    def __call__(self, text):
+        """使类实例可调用，用于兼容 FAISS 的接口"""
+        if isinstance(text, str):
+            return self.embed_query(text)
+        elif isinstance(text, list):
+            return self.embed_documents(text)
+        else:
+            raise ValueError(f"Unsupported input type: {type(text)}")
+
+    @abstractmethod
+    def embed_documents(self, texts, progress_callback=None):
+        """将文档转换为向量
+
+        Args:
+            texts: 文本列表
+            progress_callback: 可选，进度回调 progress_callback(已完成数, 总数)
+
+        Returns:
+            List[List[float]]: 与 texts 一一对应的向量
+        """
+
+    @abstractmethod
+    def embed_query(self, text):
+        """将查询转换为向量"""
@@ -0,0 +1,196 @@
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger('document_store')
+
+# 同时处理的入库任务数，以及排队任务数上限
+INGEST_WORKERS = int(os.getenv('INGEST_WORKERS', '2'))
+INGEST_MAX_PENDING = int(os.getenv('INGEST_MAX_PENDING', '32'))
+# 已结束的任务在内存中保留的秒数
+INGEST_JOB_TTL = int(os.getenv('INGEST_JOB_TTL', '3600'))
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class QueueFullError(Exception):
+    """排队的入库任务已达上限"""
+
+
+class IngestJob:
+    """一个文件的入库任务及其进度"""
+
+    def __init__(self, file_path, file_name, content_hash, model_name=None, replaces=None):
+        self.job_id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.file_name = file_name
+        self.content_hash = content_hash
+        self.model_name = model_name
+        self.replaces = replaces  # 客户端指明要替换的旧 document_id
+        self.status = 'queued'
+        self.stage = 'queued'
+        self.done = 0
+        self.total = 0
+        self.document_id = None
+        self.error = None
+        self.created_at = time.time()
+        self.finished_at = None
+        # 进度变化时唤醒等待者（流式进度、同步等待）
+        self.version = 0
+        self.changed = threading.Condition()
+
+    def update(self, **fields):
+        with self.changed:
+            for name, value in fields.items():
+                setattr(self, name, value)
+            self.version += 1
+            self.changed.notify_all()
+
+    def wait_for_change(self, version, timeout=None):
+        """等待进度变化，返回最新的版本号"""
+        with self.changed:
+            self.changed.wait_for(lambda: self.version != version or self.status not in ACTIVE_STATUSES,
+                                  timeout=timeout)
+            return self.version
+
+    def wait(self, timeout=None):
+        """等待任务结束"""
+        with self.changed:
+            return self.changed.wait_for(lambda: self.status not in ACTIVE_STATUSES, timeout=timeout)
+
+    def _progress(self):
+        # 最后一次进度回调之后还有写索引等步骤，完成的任务总是 1.0
+        if self.status == 'completed':
+            return 1.0
+        return self.done / self.total if self.total else 0.0
+
+    def to_dict(self):
+        with self.changed:
+            return {
+                "job_id": self.job_id,
+                "file_name": self.file_name,
+                "content_hash": self.content_hash,
+                "model_name": self.model_name,
+                "replaces": self.replaces,
+                "status": self.status,
+                "stage": self.stage,
+                "done": self.done,
+                "total": self.total,
+                "progress": self._progress(),
+                "document_id": self.document_id,
+                "error": self.error,
+                "created_at": self.created_at,
+                "finished_at": self.finished_at,
+                "version": self.version,
+            }
+
+
+class IngestJobQueue:
+    """后台入库任务队列
+
+    上传接口保存文件后立即返回任务ID，加载、切分、向量化和写索引在有界的线程池中完成。
+    内容哈希和嵌入模型都相同且仍在排队或处理中的任务会合并为同一个任务。
+    """
+
+    def __init__(self, doc_store, workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING, job_ttl=INGEST_JOB_TTL):
+        self.doc_store = doc_store
+        self.max_pending = max_pending
+        self.job_ttl = job_ttl
+        self.coalesced = 0
+        self._jobs = {}  # job_id -> IngestJob
+        self._active_by_hash = {}  # (content_hash, 嵌入模型) -> IngestJob
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='ingest')
+
+    def submit(self, file_path, file_name, content_hash, embeddings=None, replaces=None):
+        """提交入库任务
+
+        replaces 为客户端指明要替换的旧 document_id，新版本入库成功后旧版本被删除；
+        合并到已有任务时以已有任务的设置为准。
+
+        Returns:
+            Tuple[IngestJob, bool]: (任务, 是否合并到了已有任务)
+
+        Raises:
+            QueueFullError: 排队任务数已达上限
+        """
+        model_name = (embeddings or self.doc_store.embeddings).model_name
+        with self._lock:
+            self._prune()
+            existing = self._active_by_hash.get((content_hash, model_name))
+            if existing is not None:
+                self.coalesced += 1
+                logger.info(f"内容相同的文件正在处理，合并到任务 {existing.job_id}: {file_name}")
+                return existing, True
+
+            pending = sum(1 for job in self._active_by_hash.values() if job.status == 'queued')
+            if pending >= self.max_pending:
+                raise QueueFullError(f"排队的入库任务已达上限 ({self.max_pending})")
+
+            job = IngestJob(file_path, file_name, content_hash, model_name, replaces)
+            self._jobs[job.job_id] = job
+            self._active_by_hash[(content_hash, model_name)] = job
+        self._executor.submit(self._run, job, embeddings)
+        logger.info(f"已创建入库任务 {job.job_id}: {file_name}")
+        return job, False
+
+    def active_job(self, content_hash, model_name=None):
+        """返回该内容哈希（在指定嵌入模型下）正在排队或处理中的任务，没有时返回 None"""
+        model_name = model_name or self.doc_store.embeddings.model_name
+        with self._lock:
+            return self._active_by_hash.get((content_hash, model_name))
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _run(self, job, embeddings):
+        job.update(status='running', stage='loading')
+
+        def on_progress(stage, done, total):
+            job.update(stage=stage, done=done, total=total)
+
+        try:
+            # 只为提交时的内容入库：文件已经不是这份内容时任务失败，不会入库其他内容
+            result = self.doc_store.process_single_file(job.file_path, embeddings=embeddings,
+                                                        progress_callback=on_progress,
+                                                        expected_hash=job.content_hash,
+                                                        replaces=job.replaces)
+            if result['success']:
+                job.update(status='completed', stage='completed', document_id=result['document_id'],
+                           finished_at=time.time())
+                logger.info(f"入库任务 {job.job_id} 完成, document_id: {result['document_id']}")
+            else:
+                job.update(status='failed', stage='failed', error=result.get('error') or '文件处理失败',
+                           finished_at=time.time())
+                logger.error(f"入库任务 {job.job_id} 失败")
+        except Exception as e:
+            job.update(status='failed', stage='failed', error=str(e), finished_at=time.time())
+            logger.error(f"入库任务 {job.job_id} 出错: {str(e)}")
+        finally:
+            with self._lock:
+                if self._active_by_hash.get((job.content_hash, job.model_name)) is job:
+                    del self._active_by_hash[(job.content_hash, job.model_name)]
+
+    def _prune(self):
+        """删除结束超过 job_ttl 秒的任务"""
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.finished_at is not None and now - job.finished_at > self.job_ttl]
+        for job_id in expired:
+            del self._jobs[job_id]
+
+    def stats(self):
+        """返回任务队列统计"""
+        with self._lock:
+            statuses = {}
+            for job in self._jobs.values():
+                statuses[job.status] = statuses.get(job.status, 0) + 1
+        return {
+            "jobs": statuses,
+            "max_pending": self.max_pending,
+            "coalesced": self.coalesced,
+        }
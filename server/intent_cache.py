@@ -0,0 +1,171 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+
+from embedding_cache import normalize_query
+
+logger = logging.getLogger(__name__)
+
+
+class SearchIntentCache:
+    """搜索意图缓存
+
+    以 (规范化后的查询, 模型名称) 为键缓存模型提取的搜索意图，热门问题重复出现时省去一次完整的模型调用。
+    内存中是 LRU，指定 db_path 时另有一层 SQLite 缓存，服务重启后仍然有效；
+    两层的条目都在写入 ttl 秒后失效（按墙上时间计算，重启前后一致）。
+    clock 为返回当前墙上时间（秒）的函数，默认 time.time。
+    """
+
+    def __init__(self, max_entries=1024, ttl=86400, db_path=None, max_disk_entries=100000, clock=time.time):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries
+        self._clock = clock
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # key -> (写入时间, 搜索意图)
+        self._lock = threading.Lock()
+        self._conn = None
+        if db_path:
+            db_path = Path(db_path)
+            db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn = sqlite3.connect(str(db_path), check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS search_intents (
+                    query TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    intent TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (query, model)
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS idx_search_intents_created_at ON search_intents(created_at)")
+            # 启动时清理已经过期的条目
+            self._conn.execute("DELETE FROM search_intents WHERE created_at < ?", (clock() - ttl,))
+            self._conn.commit()
+            self._disk_size = self._conn.execute("SELECT COUNT(*) FROM search_intents").fetchone()[0]
+            logger.info(f"搜索意图缓存已打开: {db_path}，现有 {self._disk_size} 条记录")
+
+    def get(self, query, model_name):
+        """读取缓存的搜索意图，未命中或已过期时返回 None"""
+        if self.max_entries <= 0:
+            return None
+        key = (normalize_query(query), model_name)
+        now = self._clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created_at, intent = entry
+                if now - created_at <= self.ttl:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return intent
+                del self._entries[key]
+                self.expirations += 1
+            if self._conn is not None:
+                row = self._conn.execute(
+                    "SELECT intent, created_at FROM search_intents WHERE query = ? AND model = ?", key
+                ).fetchone()
+                if row is not None and now - row[1] <= self.ttl:
+                    self._remember(key, row[1], row[0])
+                    self.disk_hits += 1
+                    return row[0]
+            self.misses += 1
+            return None
+
+    def put(self, query, model_name, intent):
+        """写入模型提取的搜索意图"""
+        if self.max_entries <= 0:
+            return
+        key = (normalize_query(query), model_name)
+        now = self._clock()
+        with self._lock:
+            self._remember(key, now, intent)
+            if self._conn is not None:
+                # 同一个键（例如过期后重新提取）覆盖原来的行，条目数不变
+                exists = self._conn.execute(
+                    "SELECT 1 FROM search_intents WHERE query = ? AND model = ?", key
+                ).fetchone() is not None
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO search_intents (query, model, intent, created_at) VALUES (?, ?, ?, ?)",
+                    (*key, intent, now)
+                )
+                self._conn.commit()
+                if not exists:
+                    self._disk_size += 1
+                if self._disk_size > self.max_disk_entries:
+                    self._evict_disk()
+
+    def _remember(self, key, created_at, intent):
+        self._entries[key] = (created_at, intent)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def _evict_disk(self):
+        """淘汰最早写入的条目，一次多淘汰 10%，避免每次写入都触发"""
+        self._disk_size = self._conn.execute("SELECT COUNT(*) FROM search_intents").fetchone()[0]
+        overflow = self._disk_size - int(self.max_disk_entries * 0.9)
+        if overflow <= 0:
+            return
+        self._conn.execute(
+            "DELETE FROM search_intents WHERE rowid IN "
+            "(SELECT rowid FROM search_intents ORDER BY created_at ASC LIMIT ?)",
+            (overflow,)
+        )
+        self._conn.commit()
+        self._disk_size -= overflow
+        logger.info(f"搜索意图缓存淘汰 {overflow} 条记录，剩余 {self._disk_size} 条")
+
+    def stats(self):
+        """返回缓存命中统计"""
+        with self._lock:
+            total = self.hits + self.disk_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "disk_entries": self._disk_size if self._conn is not None else None,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "expirations": self.expirations,
+                "hit_rate": (self.hits + self.disk_hits) / total if total else 0.0,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._conn is not None:
+                self._conn.execute("DELETE FROM search_intents")
+                self._conn.commit()
+                self._disk_size = 0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def search_intent_cache():
+    """进程级共享的搜索意图缓存，第一次使用时按环境变量创建（此时 .env 已经加载）
+
+    SEARCH_INTENT_CACHE_SIZE=0 关闭缓存，设置 SEARCH_INTENT_CACHE_DB 时启用磁盘缓存。
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = SearchIntentCache(
+                max_entries=int(os.getenv('SEARCH_INTENT_CACHE_SIZE', '1024')),
+                ttl=float(os.getenv('SEARCH_INTENT_CACHE_TTL', '86400')),
+                db_path=os.getenv('SEARCH_INTENT_CACHE_DB') or None,
+                max_disk_entries=int(os.getenv('SEARCH_INTENT_CACHE_DISK_SIZE', '100000')),
+            )
+        return _cache
@@ -0,0 +1,295 @@
+import logging
+import math
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+
+import numpy as np
+
+logger = logging.getLogger('document_store')
+
+# 连续的中日韩文字，或由 . _ - 连接的字母数字串（如错误码、版本号、变量名）
+_TOKEN_PATTERN = re.compile(
+    r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]+'
+    r'|[0-9a-z]+(?:[._\-][0-9a-z]+)*'
+)
+_CJK_PATTERN = re.compile(r'[\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\u3040-\u30ff\uac00-\ud7af]')
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+# 倒排表分段查询时的最大参数数量
+_SQL_BATCH = 500
+
+
+def tokenize(text):
+    """面向中英文混合文本的分词
+
+    中日韩文字按字符二元组（bigram）切分，单个汉字单独成词；
+    字母数字串转小写后整体作为一个词，带 . _ - 的复合串同时拆出各个部分。
+    """
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            if len(token) == 1:
+                tokens.append(token)
+            else:
+                tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+        else:
+            tokens.append(token)
+            parts = re.split(r'[._\-]', token)
+            if len(parts) > 1:
+                tokens.extend(part for part in parts if part)
+    return tokens
+
+
+def reciprocal_rank_fusion(ranked_lists, k, rrf_k=60):
+    """倒数排名融合（RRF）
+
+    Args:
+        ranked_lists: 多个按相关性降序排列的 key 列表
+        k: 返回结果数量
+        rrf_k: RRF 平滑常数
+
+    Returns:
+        List[Tuple[key, float]]: 按融合分数降序排列的 (key, 分数) 列表
+    """
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, key in enumerate(ranked):
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+
+class KeywordIndex:
+    """BM25 倒排索引
+
+    倒排表按 (词, 文档) 分段保存在 SQLite 中，每段把 chunk_id、词频和文本块长度
+    分别存成紧凑的定长数组（uint32 / uint16 / uint32），写入一个文档只需要插入它自己的分段，
+    查询时按词读取分段并用 numpy 向量化计算 BM25 分数。
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                total_length INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                document_id TEXT NOT NULL,
+                chunk_ids BLOB NOT NULL,
+                tfs BLOB NOT NULL,
+                lengths BLOB NOT NULL,
+                PRIMARY KEY (term, document_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS idx_postings_document_id ON postings(document_id);
+            CREATE TABLE IF NOT EXISTS term_stats (
+                term TEXT PRIMARY KEY,
+                df INTEGER NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def __contains__(self, document_id):
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM documents WHERE document_id = ?", (document_id,)).fetchone()
+        return row is not None
+
+    def document_ids(self):
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT document_id FROM documents")]
+
+    def add_document(self, document_id, chunk_ids, texts, append=False, replaces=None):
+        """为一个文档的文本块建立倒排表
+
+        Args:
+            document_id: 文档ID
+            chunk_ids: 文本块ID列表（与向量索引中的 chunk_id 一致）
+            texts: 与 chunk_ids 一一对应的文本
+            append: 为 True 时把这些文本块并入该文档已有的倒排表（流式写入），否则替换
+            replaces: 可选，在同一个事务中删除这个文档的倒排表。增量重建时旧版本的文本块转给新文档，
+                同一个 chunk_id 不会同时出现在两个文档的倒排表中
+        """
+        postings = {}  # term -> ([chunk_id], [tf], [length])
+        lengths = []
+        for chunk_id, text in zip(chunk_ids, texts):
+            term_counts = Counter(tokenize(text))
+            length = sum(term_counts.values())
+            lengths.append(length)
+            for term, tf in term_counts.items():
+                entry = postings.setdefault(term, ([], [], []))
+                entry[0].append(chunk_id)
+                entry[1].append(min(tf, 65535))
+                entry[2].append(length)
+
+        rows = {
+            term: (np.asarray(ids, dtype='<u4').tobytes(),
+                   np.asarray(tfs, dtype='<u2').tobytes(),
+                   np.asarray(lens, dtype='<u4').tobytes())
+            for term, (ids, tfs, lens) in postings.items()
+        }
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replaces:
+                    self._remove_document_rows(replaces)
+                if append:
+                    # 直接拼接到已有分段末尾，检索时按 chunk_id 汇总，不要求分段内有序
+                    terms = list(rows)
+                    for i in range(0, len(terms), _SQL_BATCH):
+                        part = terms[i:i + _SQL_BATCH]
+                        for term, ids_blob, tfs_blob, lengths_blob in self._conn.execute(
+                                f"SELECT term, chunk_ids, tfs, lengths FROM postings "
+                                f"WHERE document_id = ? AND term IN ({','.join('?' * len(part))})",
+                                [document_id, *part]):
+                            new_ids, new_tfs, new_lengths = rows[term]
+                            rows[term] = (ids_blob + new_ids, tfs_blob + new_tfs, lengths_blob + new_lengths)
+                else:
+                    self._remove_document_rows(document_id)
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO postings (term, document_id, chunk_ids, tfs, lengths) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [(term, document_id, *blobs) for term, blobs in rows.items()]
+                )
+                self._conn.executemany(
+                    "INSERT INTO term_stats (term, df) VALUES (?, ?) "
+                    "ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                    [(term, len(ids)) for term, (ids, _, _) in postings.items()]
+                )
+                self._conn.execute(
+                    "INSERT INTO documents (document_id, chunk_count, total_length) VALUES (?, ?, ?) "
+                    "ON CONFLICT(document_id) DO UPDATE SET chunk_count = chunk_count + excluded.chunk_count, "
+                    "total_length = total_length + excluded.total_length",
+                    (document_id, len(lengths), sum(lengths))
+                )
+                self._adjust_meta(len(lengths), sum(lengths))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        logger.info(f"文档 {document_id} 已写入关键词索引，共 {len(lengths)} 个文本块，{len(postings)} 个词")
+
+    def remove_document(self, document_id):
+        """删除一个文档的倒排表"""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._remove_document_rows(document_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def _remove_document_rows(self, document_id):
+        row = self._conn.execute("SELECT chunk_count, total_length FROM documents WHERE document_id = ?",
+                                 (document_id,)).fetchone()
+        if row is None:
+            return
+        term_dfs = [(len(blob) // 4, term) for term, blob in self._conn.execute(
+            "SELECT term, chunk_ids FROM postings WHERE document_id = ?", (document_id,))]
+        self._conn.executemany("UPDATE term_stats SET df = df - ? WHERE term = ?", term_dfs)
+        self._conn.execute("DELETE FROM term_stats WHERE df <= 0")
+        self._conn.execute("DELETE FROM postings WHERE document_id = ?", (document_id,))
+        self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        self._adjust_meta(-row[0], -row[1])
+
+    def _adjust_meta(self, chunk_delta, length_delta):
+        self._conn.executemany(
+            "INSERT INTO meta (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = value + excluded.value",
+            [("chunk_count", chunk_delta), ("total_length", length_delta)]
+        )
+
+    def search(self, query, k=10, document_ids=None):
+        """BM25 检索
+
+        Args:
+            query: 查询文本
+            k: 返回结果数量
+            document_ids: 只在这些文档中搜索，None 表示搜索全部文档
+
+        Returns:
+            List[Tuple[int, float]]: 按 BM25 分数降序排列的 (chunk_id, 分数) 列表
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            chunk_count = meta.get("chunk_count", 0)
+            if not chunk_count:
+                return []
+            avg_length = meta.get("total_length", 0) / chunk_count
+
+            placeholders = ",".join("?" * len(terms))
+            dfs = dict(self._conn.execute(
+                f"SELECT term, df FROM term_stats WHERE term IN ({placeholders})", terms).fetchall())
+            terms = [term for term in terms if term in dfs]
+            if not terms:
+                return []
+
+            placeholders = ",".join("?" * len(terms))
+            sql = f"SELECT term, chunk_ids, tfs, lengths FROM postings WHERE term IN ({placeholders})"
+            if document_ids is None:
+                rows = self._conn.execute(sql, terms).fetchall()
+            else:
+                rows = []
+                document_ids = list(document_ids)
+                for i in range(0, len(document_ids), _SQL_BATCH):
+                    part = document_ids[i:i + _SQL_BATCH]
+                    rows.extend(self._conn.execute(
+                        f"{sql} AND document_id IN ({','.join('?' * len(part))})", [*terms, *part]).fetchall())
+        if not rows:
+            return []
+
+        all_ids = []
+        all_scores = []
+        for term, ids_blob, tfs_blob, lengths_blob in rows:
+            df = dfs[term]
+            idf = math.log(1 + (chunk_count - df + 0.5) / (df + 0.5))
+            tfs = np.frombuffer(tfs_blob, dtype='<u2').astype('float32')
+            lengths = np.frombuffer(lengths_blob, dtype='<u4').astype('float32')
+            norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths / avg_length)
+            all_ids.append(np.frombuffer(ids_blob, dtype='<u4'))
+            all_scores.append(idf * tfs * (BM25_K1 + 1) / (tfs + norm))
+
+        ids, inverse = np.unique(np.concatenate(all_ids), return_inverse=True)
+        scores = np.bincount(inverse, weights=np.concatenate(all_scores))
+        top = np.argsort(-scores)[:k]
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def stats(self):
+        """返回索引规模统计"""
+        with self._lock:
+            meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            terms = self._conn.execute("SELECT COUNT(*) FROM term_stats").fetchone()[0]
+        return {
+            "documents": documents,
+            "chunks": meta.get("chunk_count", 0),
+            "terms": terms,
+        }
+
+    def clear(self):
+        """清空关键词索引"""
+        with self._lock:
+            self._conn.executescript("""
+                DELETE FROM postings;
+                DELETE FROM term_stats;
+                DELETE FROM documents;
+                DELETE FROM meta;
+            """)
@@ -0,0 +1,295 @@
+import hashlib
+import itertools
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from urllib.parse import urlsplit
+
+import httpx
+from openai import AsyncOpenAI, DefaultAsyncHttpxClient, OpenAI, DefaultHttpxClient
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 异步服务（asgi.py）的上游流式请求使用的连接池分片数。httpcore 每次分配连接都要遍历池中所有连接，
+# 上千个并发流放在一个池里时开销随连接数平方增长，所以每个上游服务分成多个池轮流使用
+ASYNC_POOL_SHARDS = 16
+
+
+def _key_fingerprint(api_key):
+    """API 密钥的指纹，池的键和日志中不保存密钥原文"""
+    return hashlib.sha256((api_key or '').encode('utf-8')).hexdigest()[:16]
+
+
+def _endpoint(base_url):
+    """连接池按 scheme://host:port 共享，同一服务的不同路径和不同密钥复用同一批连接"""
+    parts = urlsplit(base_url)
+    return f"{parts.scheme}://{parts.netloc}"
+
+
+class _EndpointPool:
+    """一个上游服务的 HTTP 连接池（keep-alive，可用时启用 HTTP/2）及连接统计
+
+    同步客户端共享 http_client；异步客户端共享 async_http_clients（第一次使用时创建，分成 ASYNC_POOL_SHARDS 个池）。
+    """
+
+    def __init__(self, endpoint, http2, max_connections, keepalive_expiry, async_max_connections=4096):
+        self.endpoint = endpoint
+        self.http2 = http2
+        self.keepalive_expiry = keepalive_expiry
+        self.async_max_connections = async_max_connections
+        self.async_http_clients = []
+        self.requests = 0
+        self.connections = 0  # 新建的连接数，其余请求复用了已有连接
+        self.connect_seconds = 0.0  # 新建连接的 TCP + TLS 握手耗时
+        self.last_used = time.monotonic()
+        self._lock = threading.Lock()
+        self.http_client = DefaultHttpxClient(
+            http2=http2,
+            limits=httpx.Limits(max_connections=max_connections,
+                                max_keepalive_connections=max_connections,
+                                keepalive_expiry=keepalive_expiry),
+            event_hooks={'request': [self._trace_request]},
+        )
+
+    def _trace_event(self, event_name, started):
+        """记录请求是否新建了连接，以及建立连接的耗时"""
+        if event_name == 'connection.connect_tcp.started':
+            started.append(time.perf_counter())
+        elif event_name.endswith('send_request_headers.started'):
+            with self._lock:
+                self.requests += 1
+                if started:
+                    self.connections += 1
+                    self.connect_seconds += time.perf_counter() - started[0]
+            started.clear()
+
+    def _trace_request(self, request):
+        """通过 httpcore 的 trace 扩展记录连接统计"""
+        started = []
+
+        def trace(event_name, info):
+            self._trace_event(event_name, started)
+
+        request.extensions['trace'] = trace
+
+    async def _trace_async_request(self, request):
+        """异步客户端的 trace 扩展必须是协程函数"""
+        started = []
+
+        async def trace(event_name, info):
+            self._trace_event(event_name, started)
+
+        request.extensions['trace'] = trace
+
+    def ensure_async_clients(self):
+        """创建异步客户端共享的连接池分片，调用方持有 LLMClientPool 的锁"""
+        if not self.async_http_clients:
+            per_shard = max(1, self.async_max_connections // ASYNC_POOL_SHARDS)
+            self.async_http_clients = [
+                DefaultAsyncHttpxClient(
+                    http2=self.http2,
+                    limits=httpx.Limits(max_connections=per_shard,
+                                        max_keepalive_connections=max(1, per_shard // 4),
+                                        keepalive_expiry=self.keepalive_expiry),
+                    event_hooks={'request': [self._trace_async_request]},
+                )
+                for _ in range(ASYNC_POOL_SHARDS)
+            ]
+        return self.async_http_clients
+
+    def preconnect(self):
+        """建立一条连接放入连接池，响应状态码不重要"""
+        try:
+            self.http_client.head(self.endpoint, timeout=10)
+        except Exception as e:
+            logger.warning(f"预连接 {self.endpoint} 失败: {str(e)}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "connections": self.connections,
+                "reuse_rate": 1 - self.connections / self.requests if self.requests else 0.0,
+                "avg_connect_ms": self.connect_seconds / self.connections * 1000 if self.connections else 0.0,
+                "idle_seconds": round(time.monotonic() - self.last_used, 1),
+            }
+
+
+class LLMClientPool:
+    """进程级的上游模型客户端池
+
+    OpenAI 客户端以 (base_url, API 密钥指纹) 为键复用，同一服务的客户端共享一个 HTTP 连接池，
+    每轮对话不再重新进行 TCP 和 TLS 握手。客户端数量超过上限时淘汰最久未使用的，
+    连接池超过 idle_ttl 秒未使用时连同其客户端一起淘汰（正在使用它们的请求不受影响）。
+    异步服务使用 get_async 取得 AsyncOpenAI 客户端，服务关闭时调用 aclose 关闭它们的连接池。
+    """
+
+    def __init__(self, max_clients=64, idle_ttl=600, max_connections=100, keepalive_expiry=120, http2=None,
+                 async_max_connections=4096):
+        self.max_clients = max_clients
+        self.idle_ttl = idle_ttl
+        self.max_connections = max_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.async_max_connections = async_max_connections
+        self.http2 = HTTP2_AVAILABLE if http2 is None else http2
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._clients = OrderedDict()  # (base_url, 密钥指纹) -> OpenAI
+        self._async_clients = OrderedDict()  # (base_url, 密钥指纹) -> [AsyncOpenAI]，每个连接池分片一个
+        self._next_shard = itertools.count()
+        self._endpoints = {}  # scheme://host:port -> _EndpointPool
+        self._lock = threading.Lock()
+
+    def _endpoint_pool(self, base_url):
+        endpoint = _endpoint(base_url)
+        pool = self._endpoints.get(endpoint)
+        if pool is None:
+            pool = _EndpointPool(endpoint, self.http2, self.max_connections, self.keepalive_expiry,
+                                 self.async_max_connections)
+            self._endpoints[endpoint] = pool
+        pool.last_used = time.monotonic()
+        return pool
+
+    def _evict_idle(self):
+        now = time.monotonic()
+        idle = {endpoint for endpoint, pool in self._endpoints.items() if now - pool.last_used > self.idle_ttl}
+        if not idle:
+            return
+        for clients in (self._clients, self._async_clients):
+            for key in [key for key in clients if _endpoint(key[0]) in idle]:
+                del clients[key]
+                self.evictions += 1
+        for endpoint in idle:
+            # 不主动关闭连接池：可能还有请求在使用，释放引用后由垃圾回收关闭
+            del self._endpoints[endpoint]
+            logger.info(f"淘汰空闲的上游连接池: {endpoint}")
+
+    def get(self, api_key, base_url):
+        """取得 (或创建) base_url 和 api_key 对应的 OpenAI 客户端"""
+        key = (base_url, _key_fingerprint(api_key))
+        with self._lock:
+            self._evict_idle()
+            client = self._clients.get(key)
+            pool = self._endpoint_pool(base_url)
+            if client is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return client
+            self.misses += 1
+            client = OpenAI(api_key=api_key, base_url=base_url, http_client=pool.http_client)
+            self._clients[key] = client
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+                self.evictions += 1
+            return client
+
+    def get_async(self, api_key, base_url):
+        """取得 (或创建) base_url 和 api_key 对应的 AsyncOpenAI 客户端，每次调用轮流使用一个连接池分片"""
+        key = (base_url, _key_fingerprint(api_key))
+        with self._lock:
+            self._evict_idle()
+            clients = self._async_clients.get(key)
+            pool = self._endpoint_pool(base_url)
+            if clients is not None:
+                self._async_clients.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+                clients = [AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=http_client)
+                           for http_client in pool.ensure_async_clients()]
+                self._async_clients[key] = clients
+                while len(self._async_clients) > self.max_clients:
+                    self._async_clients.popitem(last=False)
+                    self.evictions += 1
+            return clients[next(self._next_shard) % len(clients)]
+
+    async def aclose(self):
+        """关闭异步客户端的连接池，在事件循环关闭前调用（异步服务的 lifespan.shutdown）"""
+        with self._lock:
+            http_clients = [http_client for pool in self._endpoints.values() for http_client in pool.async_http_clients]
+            for pool in self._endpoints.values():
+                pool.async_http_clients = []
+            self._async_clients.clear()
+        for http_client in http_clients:
+            await http_client.aclose()
+        if http_clients:
+            logger.info(f"已关闭 {len(http_clients)} 个异步上游连接池")
+
+    def preconnect(self, base_urls):
+        """在后台预先连接常用的上游服务，第一个请求不用等握手"""
+        with self._lock:
+            pools = [self._endpoint_pool(base_url) for base_url in base_urls if base_url]
+        for pool in pools:
+            threading.Thread(target=pool.preconnect, daemon=True).start()
+
+    def stats(self):
+        """返回客户端复用和各上游服务的连接统计"""
+        with self._lock:
+            endpoints = dict(self._endpoints)
+            total = self.hits + self.misses
+            stats = {
+                "clients": len(self._clients),
+                "async_clients": len(self._async_clients),
+                "max_clients": self.max_clients,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "evictions": self.evictions,
+                "http2": self.http2,
+            }
+        stats["endpoints"] = {endpoint: pool.stats() for endpoint, pool in endpoints.items()}
+        return stats
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def llm_client_pool():
+    """进程级共享的客户端池，第一次使用时按环境变量创建（此时 .env 已经加载）"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = LLMClientPool(
+                max_clients=int(os.getenv('LLM_CLIENT_POOL_SIZE', '64')),
+                idle_ttl=float(os.getenv('LLM_CLIENT_IDLE_TTL', '600')),
+                max_connections=int(os.getenv('LLM_MAX_CONNECTIONS', '100')),
+                async_max_connections=int(os.getenv('ASYNC_UPSTREAM_MAX_CONNECTIONS', '4096')),
+            )
+        return _pool
+
+
+def get_llm_client(api_key, base_url):
+    """从进程级客户端池取得上游模型的 OpenAI 客户端"""
+    return llm_client_pool().get(api_key, base_url)
+
+
+def get_async_llm_client(api_key, base_url):
+    """从进程级客户端池取得上游模型的 AsyncOpenAI 客户端（异步服务使用）"""
+    return llm_client_pool().get_async(api_key, base_url)
+
+
+async def close_async_llm_clients():
+    """关闭所有异步客户端的连接池，还没有创建客户端池时什么也不做"""
+    with _pool_lock:
+        pool = _pool
+    if pool is not None:
+        await pool.aclose()
+
+
+def preconnect_default_endpoints():
+    """预连接配置的默认上游服务：LLM_PRECONNECT_URLS（逗号分隔），默认为 OPENROUTER_BASE_URL"""
+    urls = os.getenv('LLM_PRECONNECT_URLS') or os.getenv('OPENROUTER_BASE_URL', '')
+    urls = [url.strip() for url in urls.split(',') if url.strip()]
+    if urls:
+        logger.info(f"预连接上游服务: {urls}")
+        llm_client_pool().preconnect(urls)
@@ -0,0 +1,150 @@
+import json
+import logging
+import threading
+from pathlib import Path
+
+import numpy as np
+
+from embedding_cache import text_hash
+from embedding_provider import EmbeddingProvider
+
+logger = logging.getLogger('document_store')
+
+# 嵌入模型名称以此为前缀时使用进程内的 CPU 模型，例如 local:/models/bge-small-zh-v1.5
+LOCAL_MODEL_PREFIX = 'local:'
+
+# 已加载的模型，每个进程每个模型只加载一次
+_models = {}
+_models_lock = threading.Lock()
+
+
+def _detect_pooling(model_dir):
+    """读取 sentence-transformers 导出的池化配置，没有时使用平均池化"""
+    config_path = Path(model_dir) / "1_Pooling" / "config.json"
+    try:
+        config = json.loads(config_path.read_text(encoding='utf-8'))
+        if config.get("pooling_mode_cls_token"):
+            return 'cls'
+    except (OSError, ValueError):
+        pass
+    return 'mean'
+
+
+class _OnnxModel:
+    """ONNX Runtime 推理：目录中需要 tokenizer.json 和 model.onnx（优先使用量化后的 model_quantized.onnx）"""
+
+    def __init__(self, model_dir, onnx_path, max_length, threads, pooling):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        options = ort.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(str(onnx_path), sess_options=options,
+                                            providers=['CPUExecutionProvider'])
+        self.input_names = {item.name for item in self.session.get_inputs()}
+        self.tokenizer = Tokenizer.from_file(str(Path(model_dir) / "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_length)
+        pad_token = next((token for token in ("[PAD]", "<pad>") if self.tokenizer.token_to_id(token) is not None),
+                         "[PAD]")
+        self.tokenizer.enable_padding(pad_id=self.tokenizer.token_to_id(pad_token) or 0, pad_token=pad_token)
+        self.pooling = pooling or _detect_pooling(model_dir)
+
+    def encode(self, texts):
+        encodings = self.tokenizer.encode_batch(texts)
+        attention_mask = np.array([item.attention_mask for item in encodings], dtype=np.int64)
+        feeds = {
+            "input_ids": np.array([item.ids for item in encodings], dtype=np.int64),
+            "attention_mask": attention_mask,
+        }
+        if "token_type_ids" in self.input_names:
+            feeds["token_type_ids"] = np.array([item.type_ids for item in encodings], dtype=np.int64)
+        output = self.session.run(None, feeds)[0]
+        if output.ndim == 3:
+            if self.pooling == 'cls':
+                output = output[:, 0]
+            else:
+                mask = attention_mask[:, :, None].astype(np.float32)
+                output = (output * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+        norms = np.linalg.norm(output, axis=1, keepdims=True)
+        return (output / np.maximum(norms, 1e-12)).astype(np.float32)
+
+
+class _SentenceTransformerModel:
+    """没有 ONNX 文件时用 sentence-transformers 在 CPU 上推理"""
+
+    def __init__(self, model_path, max_length, threads):
+        from sentence_transformers import SentenceTransformer
+
+        if threads:
+            import torch
+            torch.set_num_threads(threads)
+        self.model = SentenceTransformer(str(model_path), device='cpu')
+        self.model.max_seq_length = max_length
+
+    def encode(self, texts):
+        return self.model.encode(texts, batch_size=len(texts), convert_to_numpy=True,
+                                 normalize_embeddings=True).astype(np.float32)
+
+
+def load_local_model(model_path, max_length=512, threads=0, pooling=None):
+    """加载（或复用已加载的）本地嵌入模型"""
+    key = (str(model_path), max_length, threads, pooling)
+    with _models_lock:
+        model = _models.get(key)
+        if model is None:
+            model_dir = Path(model_path)
+            onnx_path = next((path for path in (
+                model_dir / "model_quantized.onnx",
+                model_dir / "model.onnx",
+                model_dir / "onnx" / "model_quantized.onnx",
+                model_dir / "onnx" / "model.onnx",
+            ) if path.exists()), None)
+            if onnx_path is not None:
+                model = _OnnxModel(model_dir, onnx_path, max_length, threads, pooling)
+                logger.info(f"已加载本地 ONNX 嵌入模型: {onnx_path}")
+            else:
+                model = _SentenceTransformerModel(model_path, max_length, threads)
+                logger.info(f"已加载本地 sentence-transformers 嵌入模型: {model_path}")
+            # 推理本身会用满多个核，同一模型的调用串行执行，避免线程互相争抢
+            model.lock = threading.Lock()
+            _models[key] = model
+        return model
+
+
+class LocalEmbeddings(EmbeddingProvider):
+    """进程内的 CPU 嵌入模型
+
+    不经过网络，没有远程延迟和限流，也可以作为测试和性能测试的离线嵌入。
+    文本按长度排序后分批推理，同一批内的填充最少。
+    """
+
+    def __init__(self, model_path, model_name=None, batch_size=32, max_length=512, threads=0,
+                 query_prefix='', pooling=None):
+        self.model_path = model_path
+        self.model_name = model_name or f"{LOCAL_MODEL_PREFIX}{model_path}"
+        self.batch_size = batch_size
+        self.query_prefix = query_prefix  # 部分模型（如 e5、bge）的查询需要加指令前缀
+        self.model = load_local_model(model_path, max_length, threads, pooling)
+
+    def _encode(self, texts):
+        with self.model.lock:
+            return self.model.encode(texts)
+
+    def embed_documents(self, texts, progress_callback=None):
+        texts = [text if isinstance(text, str) else str(text) for text in texts]
+        hashes = [text_hash(text) for text in texts]
+        # 内容去重，相同的文本块只推理一次
+        unique_texts = dict(zip(hashes, texts))
+        order = sorted(unique_texts, key=lambda hash_value: len(unique_texts[hash_value]))
+        vectors = {}
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for hash_value, vector in zip(batch, self._encode([unique_texts[h] for h in batch])):
+                vectors[hash_value] = vector.tolist()
+            if progress_callback:
+                progress_callback(min(start + self.batch_size, len(order)), len(order))
+        return [vectors[hash_value] for hash_value in hashes]
+
+    def embed_query(self, text):
+        return self._encode([self.query_prefix + text])[0].tolist()
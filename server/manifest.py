@@ -0,0 +1,177 @@
+import logging
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+logger = logging.getLogger('document_store')
+
+_DOCUMENTS_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS documents (
+        content_hash TEXT NOT NULL,
+        embedding_model TEXT NOT NULL,
+        source_name TEXT,
+        chunk_count INTEGER NOT NULL,
+        bytes INTEGER NOT NULL,
+        ingested_at REAL NOT NULL,
+        ingest_seconds REAL NOT NULL,
+        PRIMARY KEY (content_hash, embedding_model)
+    )
+"""
+
+
+class DocumentManifest:
+    """文件与文档的清单
+
+    保存在 SQLite（WAL 模式）中，每次更新只写入一行并在事务中提交，进程崩溃不会损坏已有记录：
+    - files: 文件路径 -> 内容哈希（document_id），按路径、文件名、内容哈希建索引
+    - documents: 每个文档在每个嵌入模型索引中的统计信息（文本块数、字节数、入库时间和耗时），
+      以 (内容哈希, 嵌入模型) 为键，同一内容在不同模型下各有一行
+    """
+
+    def __init__(self, db_path):
+        self.db_path = Path(db_path)
+        self._lock = threading.Lock()
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                name TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_files_name ON files(name);
+            CREATE INDEX IF NOT EXISTS idx_files_content_hash ON files(content_hash);
+        """)
+        self._migrate_documents()
+        self._conn.execute(_DOCUMENTS_SCHEMA)
+
+    def _migrate_documents(self):
+        """旧版本的 documents 表只以内容哈希为主键，重建为 (内容哈希, 嵌入模型) 主键"""
+        columns = {row[1]: row[5] for row in self._conn.execute("PRAGMA table_info(documents)")}
+        if not columns or columns.get("embedding_model"):
+            return
+        self._conn.execute("BEGIN IMMEDIATE")
+        try:
+            self._conn.execute("ALTER TABLE documents RENAME TO documents_v1")
+            self._conn.execute(_DOCUMENTS_SCHEMA)
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(content_hash, embedding_model, source_name, chunk_count, bytes, ingested_at, ingest_seconds) "
+                "SELECT content_hash, COALESCE(embedding_model, ''), source_name, chunk_count, bytes, "
+                "ingested_at, ingest_seconds FROM documents_v1"
+            )
+            self._conn.execute("DROP TABLE documents_v1")
+            self._conn.execute("COMMIT")
+        except Exception:
+            self._conn.execute("ROLLBACK")
+            raise
+        logger.info("文档清单已迁移为按 (内容哈希, 嵌入模型) 记录")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def get_hash(self, path):
+        """返回文件路径当前对应的内容哈希，没有记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute("SELECT content_hash FROM files WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else None
+
+    def set_hash(self, path, content_hash):
+        """记录文件路径对应的内容哈希"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO files (path, name, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+                (path, Path(path).name, content_hash, time.time())
+            )
+
+    def find_by_name(self, name):
+        """按文件名查找，返回 [(路径, 内容哈希)]，最近更新的在前"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT path, content_hash FROM files WHERE name = ? ORDER BY updated_at DESC", (name,)
+            ).fetchall()
+
+    def paths_for_hash(self, content_hash):
+        """返回引用某个内容哈希的全部文件路径"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute(
+                "SELECT path FROM files WHERE content_hash = ?", (content_hash,))]
+
+    def content_hashes(self):
+        """返回所有文件路径引用到的内容哈希"""
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT DISTINCT content_hash FROM files")]
+
+    def import_hashes(self, file_hashes):
+        """批量导入 {路径: 内容哈希}，用于从 file_hashes.json 迁移"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO files (path, name, content_hash, updated_at) VALUES (?, ?, ?, ?)",
+                    [(path, Path(path).name, content_hash, now) for path, content_hash in file_hashes.items()]
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def record_document(self, content_hash, source_name, chunk_count, size, embedding_model, ingest_seconds):
+        """记录文档在某个嵌入模型索引中入库后的统计信息"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents "
+                "(content_hash, source_name, chunk_count, bytes, embedding_model, ingested_at, ingest_seconds) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (content_hash, source_name, chunk_count, size, embedding_model, time.time(), ingest_seconds)
+            )
+
+    def remove_document(self, content_hash, embedding_model):
+        """删除文档在某个嵌入模型索引中的统计信息，其他模型下的记录不受影响"""
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE content_hash = ? AND embedding_model = ?",
+                               (content_hash, embedding_model))
+
+    def document(self, content_hash, embedding_model):
+        """返回文档在某个嵌入模型索引中的统计信息和引用它的文件路径，没有记录时返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT source_name, chunk_count, bytes, embedding_model, ingested_at, ingest_seconds "
+                "FROM documents WHERE content_hash = ? AND embedding_model = ?", (content_hash, embedding_model)
+            ).fetchone()
+            paths = [path for (path,) in self._conn.execute(
+                "SELECT path FROM files WHERE content_hash = ?", (content_hash,))]
+        if row is None and not paths:
+            return None
+        info = {"document_id": content_hash, "paths": paths}
+        if row is not None:
+            info.update(zip(("source_name", "chunk_count", "bytes", "embedding_model", "ingested_at",
+                             "ingest_seconds"), row))
+        return info
+
+    def stats(self):
+        """返回清单规模统计，documents/chunks/bytes 按嵌入模型分别统计"""
+        with self._lock:
+            files = self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+            rows = self._conn.execute(
+                "SELECT embedding_model, COUNT(*), SUM(chunk_count), SUM(bytes) FROM documents GROUP BY embedding_model"
+            ).fetchall()
+        return {
+            "files": files,
+            "models": {model: {"documents": documents, "chunks": chunks, "bytes": size}
+                       for model, documents, chunks, size in rows},
+        }
+
+    def clear(self):
+        """清空清单"""
+        with self._lock:
+            self._conn.executescript("""
+                DELETE FROM files;
+                DELETE FROM documents;
+            """)
@@ -0,0 +1,148 @@
+import logging
+import os
+import pickle
+import subprocess
+import sys
+import threading
+import time
+from multiprocessing.connection import Connection
+
+logger = logging.getLogger('document_store')
+
+
+class ParseTimeoutError(Exception):
+    """文件解析超时"""
+
+
+def _stream_in_child(func, args, conn):
+    """子进程入口：把生成器产出的每一项依次发回父进程"""
+    try:
+        for item in func(*args):
+            conn.send(('item', item))
+        conn.send(('done', None))
+    except Exception as e:
+        try:
+            conn.send(('error', e))
+        except Exception:
+            # 异常对象无法序列化时只传回描述
+            conn.send(('error', RuntimeError(repr(e))))
+    finally:
+        conn.close()
+
+
+def _child_main():
+    """子进程入口：从标准输入读取要运行的函数和参数，结果经标准输出发回父进程"""
+    conn = Connection(os.dup(sys.stdout.fileno()), readable=False)
+    # 解析库打印的内容写到标准错误，不混进结果管道
+    os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    try:
+        sys.path[:] = pickle.load(sys.stdin.buffer)
+        # 函数按模块名和函数名反序列化，子进程只导入它所在的模块
+        func, args = pickle.load(sys.stdin.buffer)
+    except Exception as e:
+        conn.send(('error', RuntimeError(f"解析进程无法加载任务: {e!r}")))
+        conn.close()
+        return
+    _stream_in_child(func, args, conn)
+
+
+class ParsePool:
+    """在子进程中解析文档
+
+    PDF/DOCX 解析是 CPU 密集型的纯 Python 代码，放在线程中会互相争抢 GIL。
+    每个文件在独立的子进程中解析，解析结果分批经管道流回父进程（管道写满时子进程阻塞，内存有界）；
+    同时运行的进程数不超过 workers，超时的进程直接终止，不会一直占着工作槽位。
+
+    子进程是新启动的解释器（python parse_pool.py），不 fork 服务进程：服务进程有很多线程，
+    fork 出的子进程可能继承其他线程持有的锁（日志、SQLite、导入锁）而永远阻塞。
+    multiprocessing 的 spawn / forkserver 会在子进程中重新导入服务的主模块（app.py / asgi.py），
+    而主模块在导入时就会打开索引、启动定时任务，所以也不使用。子进程只导入任务函数所在的模块。
+    """
+
+    def __init__(self, workers=None, timeout=300):
+        self.workers = max(1, workers or os.cpu_count() or 2)
+        self.timeout = timeout
+        self._slots = threading.BoundedSemaphore(self.workers)
+        self._lock = threading.Lock()
+        self.completed = 0
+        self.failed = 0
+        self.timed_out = 0
+
+    def iter(self, func, *args, timeout=None):
+        """在子进程中运行生成器函数 func(*args)，逐项返回它产出的结果
+
+        func 必须是模块级函数，它所在的模块会在子进程中导入，不能是导入时有副作用的模块
+        （如 app / document_store，见 parse_worker）。func、args 和产出的结果都必须可以 pickle。
+        timeout 为父进程等待结果的累计时间（不含下游消费的时间）。
+
+        Raises:
+            ParseTimeoutError: 超时，子进程已被终止
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._slots:
+            process = subprocess.Popen([sys.executable, os.path.abspath(__file__)],
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            receiver = Connection(os.dup(process.stdout.fileno()), writable=False)
+            process.stdout.close()
+            waited = 0.0
+            status = None
+            try:
+                try:
+                    pickle.dump(sys.path, process.stdin)
+                    pickle.dump((func, args), process.stdin)
+                    process.stdin.close()
+                except BrokenPipeError:
+                    # 子进程已经退出，下面读取时报告退出码
+                    pass
+                while True:
+                    started = time.monotonic()
+                    ready = receiver.poll(max(timeout - waited, 0))
+                    waited += time.monotonic() - started
+                    if not ready:
+                        status = 'timeout'
+                        raise ParseTimeoutError(f"解析超时（{timeout:.0f} 秒）")
+                    try:
+                        kind, payload = receiver.recv()
+                    except EOFError:
+                        raise RuntimeError(f"解析进程异常退出，退出码: {process.wait()}")
+                    if kind == 'item':
+                        yield payload
+                    elif kind == 'done':
+                        status = 'completed'
+                        return
+                    else:
+                        raise payload
+            finally:
+                # 超时、出错或调用方提前停止读取时终止子进程
+                if process.poll() is None:
+                    process.kill()
+                process.wait()
+                if not process.stdin.closed:
+                    try:
+                        process.stdin.close()
+                    except BrokenPipeError:
+                        pass
+                receiver.close()
+                with self._lock:
+                    if status == 'completed':
+                        self.completed += 1
+                    elif status == 'timeout':
+                        self.timed_out += 1
+                    else:
+                        self.failed += 1
+                if status == 'timeout':
+                    logger.error(f"解析进程超时已终止: {args}")
+
+    def stats(self):
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "timeout": self.timeout,
+                "completed": self.completed,
+                "failed": self.failed,
+                "timed_out": self.timed_out,
+            }
+
+
+if __name__ == '__main__':
+    _child_main()
@@ -0,0 +1,80 @@
+"""文档加载和切分
+
+解析子进程只导入这个模块（以及加载器、切分器），不导入 app / document_store：
+服务的主模块在导入时就会打开索引、启动定时任务，子进程中不能再执行一次。
+"""
+import logging
+import os
+from pathlib import Path
+
+from langchain_community.document_loaders import TextLoader
+from langchain_community.document_loaders.markdown import UnstructuredMarkdownLoader
+from langchain_community.document_loaders.pdf import PyPDFLoader
+from langchain_community.document_loaders.word_document import UnstructuredWordDocumentLoader
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+from text_chunker import TextChunker
+
+logger = logging.getLogger('document_store')
+
+# 文本切分: token（按 tiktoken 计数、在段落/句子边界断开）或 recursive（旧的按字符数切分）
+TEXT_CHUNKER = os.getenv('TEXT_CHUNKER', 'token')
+CHUNK_TOKENS = int(os.getenv('CHUNK_TOKENS', '400'))
+CHUNK_OVERLAP_TOKENS = int(os.getenv('CHUNK_OVERLAP_TOKENS', '80'))
+
+# 文件类型对应的加载器
+LOADERS = {
+    '.txt': TextLoader,
+    '.pdf': PyPDFLoader,
+    '.doc': UnstructuredWordDocumentLoader,
+    '.docx': UnstructuredWordDocumentLoader,
+    '.md': UnstructuredMarkdownLoader,
+}
+
+
+def _iter_pages(loader):
+    """逐页读取文档，加载器不支持 lazy_load 时退回一次性 load"""
+    try:
+        yield from loader.lazy_load()
+    except NotImplementedError:
+        yield from loader.load()
+
+
+def _make_loader(file_path):
+    loader_cls = LOADERS[Path(file_path).suffix.lower()]
+    if loader_cls == TextLoader:
+        return loader_cls(file_path, encoding='utf-8')
+    return loader_cls(file_path)
+
+
+def _make_text_splitter():
+    if TEXT_CHUNKER == 'recursive':
+        return RecursiveCharacterTextSplitter(
+            chunk_size=1000,
+            chunk_overlap=200
+        )
+    return TextChunker(chunk_tokens=CHUNK_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS)
+
+
+def split_chunks(file_path):
+    """逐页加载并切分文档，依次返回文本块"""
+    text_splitter = _make_text_splitter()
+    pages = 0
+    for page in _iter_pages(_make_loader(file_path)):
+        pages += 1
+        yield from text_splitter.split_documents([page])
+    if not pages:
+        logger.error("文档加载失败")
+        raise ValueError("文档加载失败")
+
+
+def split_chunk_batches(file_path, batch_size):
+    """在解析子进程中运行：每 batch_size 个文本块返回一批，减少进程间传输的次数"""
+    batch = []
+    for chunk in split_chunks(file_path):
+        batch.append(chunk)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
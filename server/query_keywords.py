@@ -0,0 +1,218 @@
+import logging
+import math
+import os
+import re
+import threading
+
+logger = logging.getLogger(__name__)
+
+_CJK = r'㐀-䶿一-鿿豈-﫿぀-ヿ가-힯'
+# 连续的中日韩文字，或由 . _ - + 连接的字母数字串（如 GPT-4、node.js、C++），英文缩写（what's）整体作为一个词
+_TOKEN_PATTERN = re.compile(rf"[{_CJK}]+|[0-9A-Za-z]+(?:[._\-+][0-9A-Za-z]+)*\+*(?:['’][A-Za-z]+)?")
+_CJK_PATTERN = re.compile(rf'[{_CJK}]')
+# 问题中间的分句标点，说明问题包含多个部分
+_CLAUSE_PATTERN = re.compile(r'[，,；;。？?！!]')
+
+# 中文的疑问词、语气词和客套话，在连续的汉字中按最长匹配切除，剩下的片段作为关键词
+_ZH_STOPWORDS = {
+    '有什么', '有哪些', '什么是', '是什么', '是多少', '怎么样', '怎么办', '为什么', '是不是', '有没有', '能不能', '可不可以',
+    '请问', '帮我', '告诉我', '我想', '我要', '想知道', '一下', '一些', '哪些', '哪个', '哪里', '什么', '怎么', '如何',
+    '多少', '可以', '应该', '需要', '关于', '介绍', '推荐', '解释', '了解', '知道', '查询', '搜索',
+    '的', '了', '吗', '呢', '吧', '啊', '呀', '么',
+}
+# 问候和客套话：不是要搜索的内容，与停用词一样切除
+_ZH_PLEASANTRIES = {
+    '你好', '您好', '你们好', '大家好', '早上好', '上午好', '中午好', '下午好', '晚上好', '早安', '晚安',
+    '哈喽', '嗨', '在吗', '在不在', '谢谢', '多谢', '辛苦了', '麻烦了', '不客气', '再见', '拜拜',
+}
+_ZH_STOPWORDS |= _ZH_PLEASANTRIES
+_ZH_STOPWORD_MAX_LEN = max(len(word) for word in _ZH_STOPWORDS)
+# 常用于连接词语的单字，只在切分后单独剩下时去掉，不在词语内部切分（避免把“和平”“现在”切开）
+_ZH_FUNCTION_CHARS = set('和与及或跟是在有我你他她它对给把被从到也都就还很请个让')
+_EN_STOPWORDS = {
+    'a', 'an', 'the', 'is', 'are', 'was', 'were', 'be', 'been', 'am', 'do', 'does', 'did',
+    'what', 'how', 'who', 'whom', 'why', 'when', 'where', 'which', 'whose',
+    'whats', 'hows', 'whos', 'im', 'ive', 'id', 'dont', 'doesnt', 'cant',
+    'i', 'me', 'my', 'we', 'our', 'you', 'your', 'he', 'she', 'his', 'her', 'it', 'its', 'they', 'them', 'their',
+    'this', 'that', 'these', 'those', 'there', 'here',
+    'to', 'of', 'in', 'on', 'at', 'for', 'with', 'about', 'from', 'by', 'as', 'into',
+    'and', 'or', 'but', 'if', 'so', 'than', 'then',
+    'can', 'could', 'should', 'would', 'will', 'shall', 'may', 'might', 'must',
+    'please', 'tell', 'explain', 'know', 'want', 'need', 'some', 'any', 'give', 'show', 'find', 'search',
+    # 问候和客套话
+    'hi', 'hello', 'hey', 'hiya', 'thanks', 'thank', 'thx', 'bye', 'goodbye', 'ok', 'okay', 'cheers',
+    'very', 'much', 'really', 'lot', 'lots',
+}
+# 由普通词组成的英文问候语，整句匹配后切除（morning、night 等单独出现时仍是关键词）
+_EN_PLEASANTRY_PATTERN = re.compile(
+    r"\b(?:good (?:morning|afternoon|evening|night)|thank you|how are you(?: doing)?|nice to meet you)\b", re.I)
+# 指代上文的词：问题依赖对话上下文时，本地提取的关键词不可靠
+_ZH_REFERENCES = ('它', '他们', '她们', '这个', '那个', '这些', '那些', '上面', '刚才', '之前', '前面', '其中', '上述')
+_EN_REFERENCES = {'it', 'its', 'thats', 'this', 'that', 'these', 'those', 'they', 'them', 'above', 'previous', 'former', 'latter'}
+
+_DEFAULT_CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'search_query_corpus.txt')
+
+
+def _split_cjk(run):
+    """按停用词切分一段连续的汉字，返回其余的片段"""
+    segments = []
+    current = []
+    i = 0
+    while i < len(run):
+        for size in range(min(_ZH_STOPWORD_MAX_LEN, len(run) - i), 0, -1):
+            if run[i:i + size] in _ZH_STOPWORDS:
+                if current:
+                    segments.append(''.join(current))
+                    current = []
+                i += size
+                break
+        else:
+            current.append(run[i])
+            i += 1
+    if current:
+        segments.append(''.join(current))
+    return [segment for segment in segments if not (len(segment) == 1 and segment in _ZH_FUNCTION_CHARS)]
+
+
+def _ngrams(text):
+    """语料中一行的检索单元：英文词，以及汉字 1~4 元组，用于统计文档频率"""
+    grams = set()
+    for match in _TOKEN_PATTERN.finditer(text.lower()):
+        token = match.group()
+        if _CJK_PATTERN.match(token):
+            for size in range(1, 5):
+                grams.update(token[i:i + size] for i in range(len(token) - size + 1))
+        else:
+            grams.add(token)
+    return grams
+
+
+class LocalIntentExtractor:
+    """本地搜索词提取
+
+    对短的、关键词式的问题，模型提取的搜索意图基本就是原问题去掉疑问词。这里在进程内完成：
+    汉字按停用词（包括问候和客套话）切分，英文去掉停用词，再用词在问题中的词频乘以内置问句语料的 IDF
+    衡量每个词的权重，同时给出置信度。置信度不低于 threshold 时直接使用本地结果，否则仍调用模型。
+    去掉停用词后剩下的内容不足 min_content_chars 个字符时（如“你好”“嗯”），置信度为 0。
+    """
+
+    def __init__(self, corpus_path=_DEFAULT_CORPUS, threshold=0.7, max_keywords=8, generic_idf=0.35,
+                 min_content_chars=2):
+        self.threshold = threshold
+        self.max_keywords = max_keywords
+        self.generic_idf = generic_idf  # 归一化 IDF 低于该值的词在语料中很常见，视为通用词去掉
+        self.min_content_chars = min_content_chars
+        self.local_decisions = 0
+        self.llm_decisions = 0
+        self.local_seconds = 0.0
+        self.llm_seconds = 0.0
+        self._lock = threading.Lock()
+
+        self._document_frequency = {}
+        documents = 0
+        try:
+            with open(corpus_path, encoding='utf-8') as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    documents += 1
+                    for gram in _ngrams(line):
+                        self._document_frequency[gram] = self._document_frequency.get(gram, 0) + 1
+        except OSError as e:
+            logger.warning(f"读取搜索词语料失败: {str(e)}，只按停用词提取")
+        self._documents = documents
+        self._max_idf = math.log(documents + 1) + 1
+
+    def _idf(self, term):
+        """归一化到 0~1 的 IDF，语料中没有出现过的词为 1"""
+        df = self._document_frequency.get(term.lower(), 0)
+        return (math.log((self._documents + 1) / (df + 1)) + 1) / self._max_idf
+
+    def extract(self, query):
+        """提取搜索词
+
+        Returns:
+            Tuple[str, float]: (空格分隔的搜索词, 置信度 0~1)，没有可用的关键词时搜索词为空字符串
+        """
+        terms = []
+        units = 0  # 问题长度：汉字数 + 英文词数
+        has_reference = False
+        for match in _TOKEN_PATTERN.finditer(_EN_PLEASANTRY_PATTERN.sub(' ', query)):
+            token = match.group()
+            if _CJK_PATTERN.match(token):
+                units += len(token)
+                has_reference = has_reference or any(word in token for word in _ZH_REFERENCES)
+                terms.extend(_split_cjk(token))
+            else:
+                units += 1
+                lowered = token.lower().replace("'", '').replace('’', '')
+                has_reference = has_reference or lowered in _EN_REFERENCES
+                if lowered not in _EN_STOPWORDS:
+                    terms.append(token)
+
+        weighted = {}  # 小写的词 -> [原文, 词频, IDF]
+        for term in terms:
+            key = term.lower()
+            if key in weighted:
+                weighted[key][1] += 1
+                continue
+            idf = self._idf(term)
+            if idf >= self.generic_idf:
+                weighted[key] = [term, 1, idf]
+        if not weighted:
+            return '', 0.0
+
+        # 关键词过多时按 TF×IDF 保留权重最高的，输出仍按原问题中的顺序
+        kept = sorted(weighted, key=lambda key: weighted[key][1] * weighted[key][2], reverse=True)[:self.max_keywords]
+        kept = set(kept)
+        keywords = ' '.join(term for key, (term, _, _) in weighted.items() if key in kept)
+        if sum(len(key) for key in kept) < self.min_content_chars:
+            return keywords, 0.0
+
+        specificity = sum(weighted[key][2] for key in kept) / len(kept)
+        # 12 个单位以内的短问题不扣分，超过后线性下降，40 个单位以上为 0
+        length_score = min(1.0, max(0.0, (40 - units) / 28))
+        confidence = length_score * (0.4 + 0.6 * specificity)
+        if has_reference:
+            confidence *= 0.3
+        if _CLAUSE_PATTERN.search(query.strip().rstrip('，,；;。？?！!')):
+            confidence *= 0.6
+        return keywords, round(confidence, 3)
+
+    def record_local(self, elapsed):
+        with self._lock:
+            self.local_decisions += 1
+            self.local_seconds += elapsed
+
+    def record_llm(self, elapsed):
+        with self._lock:
+            self.llm_decisions += 1
+            self.llm_seconds += elapsed
+
+    def stats(self):
+        """返回本地提取和模型提取的次数，以及按模型调用平均耗时估算省下的时间"""
+        with self._lock:
+            total = self.local_decisions + self.llm_decisions
+            avg_llm = self.llm_seconds / self.llm_decisions if self.llm_decisions else 0.0
+            return {
+                "threshold": self.threshold,
+                "local_decisions": self.local_decisions,
+                "llm_decisions": self.llm_decisions,
+                "local_rate": self.local_decisions / total if total else 0.0,
+                "avg_local_ms": self.local_seconds / self.local_decisions * 1000 if self.local_decisions else 0.0,
+                "avg_llm_ms": avg_llm * 1000,
+                "saved_seconds": round(max(0.0, avg_llm * self.local_decisions - self.local_seconds), 3),
+            }
+
+
+_extractor = None
+_extractor_lock = threading.Lock()
+
+
+def local_intent_extractor():
+    """进程级共享的本地搜索词提取器，SEARCH_INTENT_LOCAL_THRESHOLD 大于 1 时总是调用模型"""
+    global _extractor
+    with _extractor_lock:
+        if _extractor is None:
+            _extractor = LocalIntentExtractor(threshold=float(os.getenv('SEARCH_INTENT_LOCAL_THRESHOLD', '0.7')))
+        return _extractor
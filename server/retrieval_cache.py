@@ -0,0 +1,93 @@
+import threading
+import time
+from collections import OrderedDict
+
+from langchain_core.documents import Document
+
+
+def _copy_results(results):
+    """复制检索结果，调用方修改元数据时不影响缓存中的条目"""
+    return [(Document(page_content=doc.page_content, metadata=dict(doc.metadata)), score)
+            for doc, score in results]
+
+
+class RetrievalCache:
+    """进程内的检索结果 LRU 缓存
+
+    以 (规范化后的查询, 排序后的 document_ids, 嵌入模型, k, 检索模式) 为键。
+    每个条目记录写入时相关文档的版本号，文档重新入库或删除后版本号变化，
+    条目在下次读取时被丢弃；条目超过 ttl 秒后同样失效。
+    """
+
+    def __init__(self, max_entries=1024, ttl=600):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.expirations = 0
+        self.saved_seconds = 0.0  # 命中时省下的检索耗时（按条目写入时的实际耗时累计）
+        self._entries = OrderedDict()  # key -> (写入时间, 文档版本, 检索耗时, 结果)
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        """读取缓存的检索结果，versions 与写入时不一致时视为过期"""
+        if self.max_entries <= 0:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            created_at, entry_versions, elapsed, results = entry
+            if entry_versions != versions:
+                del self._entries[key]
+                self.stale += 1
+                self.misses += 1
+                return None
+            if time.monotonic() - created_at > self.ttl:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.saved_seconds += elapsed
+        return _copy_results(results)
+
+    def put(self, key, versions, results, elapsed):
+        """写入检索结果
+
+        Args:
+            key: 缓存键
+            versions: 开始检索前取得的文档版本号，检索期间文档有变化时条目下次读取即失效
+            results: List[Tuple[Document, float]]
+            elapsed: 这次检索的耗时（秒）
+        """
+        if self.max_entries <= 0:
+            return
+        results = _copy_results(results)
+        with self._lock:
+            self._entries[key] = (time.monotonic(), versions, elapsed, results)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        """返回缓存命中统计"""
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / total if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3),
+        }
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,236 @@
+import os
+import json
+import logging
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from datetime import datetime
+from llm_clients import get_llm_client, get_async_llm_client
+from web_kg import get_web_kg, search_with_intent
+from utils.text_utils import is_chinese
+from utils.logger_utils import CustomLogger
+from utils.stream_utils import SSE_HEADERS, SSE_DONE, chunk_event, links_event, error_event
+from system_prompts import search_answer_zh_template, search_answer_en_template
+from routes.chat_routes import clean_messages, get_search_intent
+from routes.doc_chat_routes import REQUIRED_PARAMS, build_doc_messages
+
+logger = logging.getLogger(__name__)
+
+# 同步调用（联网搜索、意图提取、查询向量化和检索）使用专门的线程池，不与事件循环的默认线程池共用，
+# 线程数由 ASYNC_WORKER_THREADS 设置
+_blocking_executor = None
+
+
+async def _run_blocking(func, *args):
+    """在专门的线程池中执行同步调用，不阻塞事件循环"""
+    global _blocking_executor
+    if _blocking_executor is None:
+        _blocking_executor = ThreadPoolExecutor(max_workers=int(os.getenv('ASYNC_WORKER_THREADS', '32')),
+                                                thread_name_prefix='async-blocking')
+    return await asyncio.get_running_loop().run_in_executor(_blocking_executor, partial(func, *args))
+
+
+def _error_response(e, headers):
+    error_msg = f"处理请求时出错: {str(e)}"
+    logger.error(error_msg)
+    return 500, headers, json.dumps({'error': error_msg}, ensure_ascii=False).encode('utf-8')
+
+
+async def _web_search(query):
+    """联网搜索
+
+    get_web_kg 内部的搜索接口是同步请求，放到工作线程的事件循环中运行，不阻塞服务的事件循环
+    """
+    return await _run_blocking(asyncio.run, get_web_kg(query))
+
+
+def _web_context(user_query, search_results_str):
+    cur_date = datetime.now().strftime("%Y-%m-%d")
+    template = search_answer_zh_template if is_chinese(user_query) else search_answer_en_template
+    return template.format(search_results=search_results_str, question=user_query, cur_date=cur_date)
+
+
+def _openrouter_headers(request_headers):
+    """OpenRouter 所需的额外请求头，request_headers 的键为小写"""
+    referer = request_headers.get('http-referer') or request_headers.get('x-forwarded-for', 'https://mini-chatbot.example.com')
+    title = request_headers.get('x-title', 'Mini-Chatbot')
+    return {"HTTP-Referer": referer, "X-Title": title}
+
+
+async def _open_stream(api_key, base_url, completion_args):
+    """发起上游流式请求
+
+    AsyncOpenAI 客户端来自进程级客户端池（llm_clients），与同步版本共享连接统计，
+    服务关闭时由 lifespan.shutdown 关闭它们的连接池。
+    上游返回错误状态码时在这里抛出，和同步版本一样以 500 响应返回给客户端。
+    """
+    client = get_async_llm_client(api_key, base_url)
+    return await client.chat.completions.create(**completion_args)
+
+
+async def _stream(response, cleaned_messages, is_web_search, search_result_urls_str):
+    """逐个转发上游的 token，事件格式与同步版本相同；客户端断开时任务被取消，随即关闭上游连接"""
+    full_response = []
+    try:
+        async for chunk in response:
+            logger.debug("收到 chunk: %s", chunk)
+            event = chunk_event(chunk)
+            if event:
+                yield event[0]
+                full_response.append(event[1])
+
+        # 如果启用了联网搜索，添加网页链接
+        if is_web_search and search_result_urls_str:
+            yield links_event(search_result_urls_str)
+
+        yield SSE_DONE
+        CustomLogger.response_complete(cleaned_messages[-1]['content'], ''.join(full_response))
+    except Exception as e:
+        logger.error("生成响应流时出错: %s", str(e))
+        yield error_event(e)
+        yield SSE_DONE
+    finally:
+        await response.close()
+
+
+def build_async_chat_routes(doc_store):
+    """构建 /api/chat 和 /api/chat_with_doc 的异步处理函数
+
+    处理函数接收 (请求数据, 小写键的请求头)，返回 (状态码, 响应头, 响应体)，
+    响应体为 bytes 或逐个产生 SSE 事件的异步迭代器；返回 None 时请求交给 Flask 应用处理。
+    """
+
+    async def chat(data, request_headers):
+        # 深度研究（JinaChatAPI 是同步流）和非流式请求仍由 Flask 处理
+        if not isinstance(data, dict) or data.get('deep_research') or not data.get("stream", True):
+            return None
+        if not (data.get('api_key') and data.get('base_url')):
+            return None
+
+        headers = dict(SSE_HEADERS)
+        try:
+            logger.info("开始处理POST请求: /api/chat（异步）")
+
+            if 'messages' not in data:
+                raise ValueError("缺少必需的 'messages' 字段")
+
+            messages = data['messages']
+            if not isinstance(messages, list):
+                raise ValueError("'messages' 必须是一个数组")
+
+            if not messages:
+                raise ValueError("'messages' 数组不能为空")
+
+            # 清理消息数组，确保只保留必要的字段
+            cleaned_messages = clean_messages(messages)
+            logger.info(f"清理后的消息数量: {len(cleaned_messages)}")
+
+            base_url = data['base_url']
+            api_key = data['api_key']
+            model_name = data.get('model_name', data.get('model', 'google/gemini-2.0-flash-exp:free'))
+            is_web_search = data.get('web_search', False)
+            logger.info(f"当前模式: 普通对话, 联网搜索: {'开启' if is_web_search else '关闭'}")
+
+            completion_args = {
+                "model": model_name,
+                "messages": cleaned_messages,
+                "stream": True,
+            }
+            if "openrouter.ai" in base_url:
+                completion_args["extra_headers"] = _openrouter_headers(request_headers)
+                logger.info(f"使用 OpenRouter API，模型: {model_name}")
+
+            # 如果启用了联网搜索，获取web搜索结果
+            search_result_urls_str = ""
+            if is_web_search:
+                user_query = cleaned_messages[-1]['content']
+                intent_client = get_llm_client(api_key, base_url)
+                # 意图提取和搜索是同步调用，在工作线程中并行执行
+                web_search_results, search_results_str, search_result_urls_str = await _run_blocking(
+                    search_with_intent, user_query, lambda query: get_search_intent(query, intent_client, model_name))
+
+                web_context = _web_context(user_query, search_results_str)
+                cleaned_messages[-1]['content'] = web_context
+                logger.info(f"添加了联网搜索结果: {web_context}")
+                logger.info(f"添加了联网搜索结果urls: {search_result_urls_str}")
+
+            response = await _open_stream(api_key, base_url, completion_args)
+        except Exception as e:
+            return _error_response(e, headers)
+
+        return 200, headers, _stream(response, cleaned_messages, is_web_search, search_result_urls_str)
+
+    async def chat_with_doc(data, request_headers):
+        if not isinstance(data, dict):
+            return None
+
+        headers = dict(SSE_HEADERS)
+        try:
+            CustomLogger.request('POST', '/api/chat_with_doc', data)
+
+            # 检查必要参数
+            for param in REQUIRED_PARAMS:
+                if not data.get(param):
+                    raise ValueError(f'Missing required parameter: {param}')
+
+            # 清理消息，确保只包含必要的字段
+            cleaned_messages = clean_messages(data['messages'])
+            logger.info(f"清理后的消息数量: {len(cleaned_messages)}")
+
+            base_url = data['base_url']
+            api_key = data['api_key']
+            model_name = data['model_name']
+            document_ids = [doc_id for doc_id in data.get('document_ids', []) if doc_id]  # 过滤掉None和空值
+            # 兼容旧版本，如果提供了单个document_id且有效，将其添加到document_ids列表中
+            if data.get('document_id') and data.get('document_id') not in document_ids:
+                document_ids.append(data.get('document_id'))
+            is_web_search = data.get('web_search', False)
+            logger.info(f"document_ids: {document_ids}, 联网搜索: {'开启' if is_web_search else '关闭'}")
+
+            # 获取用户最新的问题
+            user_query = cleaned_messages[-1]['content']
+            logger.info(f"用户问题: {user_query}")
+
+            # 如果启用了联网搜索，获取web搜索结果
+            search_result_urls_str = ""
+            if is_web_search:
+                web_search_results, search_results_str, search_result_urls_str = await _web_search(user_query)
+                web_context = _web_context(user_query, search_results_str)
+                cleaned_messages[-1]['content'] = web_context
+                logger.info(f"添加了联网搜索结果: {web_context}")
+
+            if doc_store is None:
+                logger.error("doc_store为空，无法处理文档聊天请求")
+                return 500, {'Content-Type': 'application/json'}, json.dumps({'error': 'DocumentStore未初始化'},
+                                                                             ensure_ascii=False).encode('utf-8')
+
+            embeddings = doc_store.get_embeddings(
+                api_key=data['embedding_api_key'],
+                base_url=data['embedding_base_url'],
+                model_name=data['embedding_model_name']
+            )
+            # 查询向量化和检索是同步调用，放到工作线程中执行
+            request_messages = await _run_blocking(build_doc_messages, doc_store, user_query,
+                                                   cleaned_messages, document_ids, embeddings)
+
+            completion_args = {
+                "model": model_name,
+                "messages": request_messages,
+                "stream": True,
+                "temperature": 0.7,
+            }
+            if "openrouter.ai" in base_url:
+                completion_args["extra_headers"] = _openrouter_headers(request_headers)
+                logger.info(f"使用 OpenRouter API，模型: {model_name}")
+
+            logger.info(f"发送请求到模型: {model_name}")
+            response = await _open_stream(api_key, base_url, completion_args)
+        except Exception as e:
+            return _error_response(e, headers)
+
+        return 200, headers, _stream(response, cleaned_messages, is_web_search, search_result_urls_str)
+
+    return {
+        '/api/chat': chat,
+        '/api/chat_with_doc': chat_with_doc,
+    }
@@ -1,14 +1,19 @@
 from flask import request, jsonify, Response, stream_with_context
+import os
 import json
 import logging
-import asyncio
+import time
 from datetime import datetime
 from httpx import stream
 from openai import OpenAI
 from jina import JinaChatAPI
-from web_kg import get_web_kg
+from web_kg import search_with_intent, search_timings
 from utils.text_utils import is_chinese
 from utils.logger_utils import CustomLogger
+from llm_clients import get_llm_client, llm_client_pool
+from intent_cache import search_intent_cache
+from query_keywords import local_intent_extractor
+from utils.stream_utils import SSE_HEADERS, SSE_DONE, chunk_event, links_event, error_event
 from system_prompts import search_answer_zh_template, search_answer_en_template
 
 logger = logging.getLogger(__name__)
@@ -43,6 +48,22 @@ def get_search_intent(query: str, client: OpenAI, model_name: str) -> str:
     Returns:
         str: 优化后的搜索查询语句
     """
+    # 相同的问题和模型直接使用缓存的搜索意图，省去一次模型调用
+    cache = search_intent_cache()
+    cached = cache.get(query, model_name)
+    if cached is not None:
+        logger.info(f"搜索意图缓存命中: {query} -> {cached}")
+        return cached
+
+    # 关键词式的短问题在本地提取搜索词，置信度低时才调用模型
+    extractor = local_intent_extractor()
+    started = time.perf_counter()
+    keywords, confidence = extractor.extract(query)
+    if keywords and confidence >= extractor.threshold:
+        extractor.record_local(time.perf_counter() - started)
+        logger.info(f"本地提取搜索词: {query} -> {keywords}, 置信度: {confidence}")
+        return keywords
+
     try:
         
         # 构建提示词
@@ -81,20 +102,24 @@ Output format:
 }}
 """
 
+        started = time.perf_counter()
         response = client.chat.completions.create(
             model=model_name,
             messages=[
                 {"role": "system", "content": "你是一个搜索意图分析专家"},
                 {"role": "user", "content": prompt}
             ],
-            temperature=0.7
+            # 设为 0 时同一问题的意图稳定，缓存的结果与重新提取的一致
+            temperature=float(os.getenv('SEARCH_INTENT_TEMPERATURE', '0.7'))
         )
         
+        extractor.record_llm(time.perf_counter() - started)
         search_intent = response.choices[0].message.content.strip()
         logger.info(f"原始查询: {query} -> 搜索意图: {search_intent}")
         search_query = extract_search_query(search_intent)
         if search_query:
             logger.info(f"提取搜索意图成功: {search_query}")
+            cache.put(query, model_name, search_query)
             return search_query
         else:
             logger.info(f"提取搜索意图失败: {search_intent}")
@@ -133,16 +158,29 @@ def clean_messages(messages):
 
 def register_chat_routes(app):
     """注册聊天相关路由"""
+
+    @app.route('/api/llm_clients/stats', methods=['GET'])
+    def llm_client_stats():
+        """返回上游模型客户端池的复用和建立连接的统计"""
+        return jsonify(llm_client_pool().stats())
+
+    @app.route('/api/search_intent/stats', methods=['GET'])
+    def search_intent_stats():
+        """返回搜索意图缓存的命中统计，以及本地提取和模型提取的次数"""
+        return jsonify({
+            "cache": search_intent_cache().stats(),
+            "local_extractor": local_intent_extractor().stats(),
+        })
+
+    @app.route('/api/web_search/stats', methods=['GET'])
+    def web_search_stats():
+        """返回联网搜索各阶段（意图提取、两次搜索、总耗时）的平均耗时和与串行流程相比节省的时间"""
+        return jsonify(search_timings.stats())
     
     @app.route('/api/chat', methods=['POST', 'OPTIONS'])
     def chat():
         # 定义响应头
-        headers = {
-            'Content-Type': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-            'X-Accel-Buffering': 'no'  # 禁用 Nginx 缓冲
-        }
+        headers = dict(SSE_HEADERS)
 
         # 处理 OPTIONS 预检请求
         if request.method == 'OPTIONS':
@@ -186,11 +224,8 @@ def register_chat_routes(app):
                 # 检查是否为 OpenRouter 请求
                 is_openrouter = "openrouter.ai" in base_url
                 
-                # 初始化 OpenAI 客户端
-                client = OpenAI(
-                    api_key=api_key,
-                    base_url=base_url
-                )
+                # 从进程级客户端池取得 OpenAI 客户端，复用到上游的连接
+                client = get_llm_client(api_key, base_url)
                 
                 # 创建请求参数
                 completion_args = {
@@ -223,12 +258,9 @@ def register_chat_routes(app):
                 cur_date = datetime.now().strftime("%Y-%m-%d")
                 user_query = cleaned_messages[-1]['content']
 
-                expanded_query = get_search_intent(user_query, client, model_name)
-                # 使用事件循环运行异步函数
-                loop = asyncio.new_event_loop()
-                asyncio.set_event_loop(loop)
-                web_search_results, search_results_str, search_result_urls_str = loop.run_until_complete(get_web_kg(expanded_query))
-                loop.close()
+                # 用原始问题搜索的同时提取搜索意图，意图差别较大时再补充搜索一次
+                web_search_results, search_results_str, search_result_urls_str = search_with_intent(
+                    user_query, lambda query: get_search_intent(query, client, model_name))
                 
                 # 将web搜索结果添加到用户消息中
                 if is_chinese(user_query):
@@ -296,38 +328,21 @@ def register_chat_routes(app):
                 try:
                     for chunk in response:
                         logger.debug("收到 chunk: %s", chunk)
-                        if hasattr(chunk, 'choices') and len(chunk.choices) > 0:
-                            if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
-                                content = chunk.choices[0].delta.reasoning_content
-                                data = json.dumps({'choices': [{'delta': {'reasoning_content': content}}]}, ensure_ascii=False)
-                                yield f"data: {data}\n\n".encode('utf-8')
-                                full_response.append(content)
-                            elif hasattr(chunk.choices[0].delta, 'reasoning') and chunk.choices[0].delta.reasoning:
-                                content = chunk.choices[0].delta.reasoning
-                                data = json.dumps({'choices': [{'delta': {'reasoning_content': content}}]}, ensure_ascii=False)
-                                yield f"data: {data}\n\n".encode('utf-8')
-                                full_response.append(content)
-                            elif hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                                content = chunk.choices[0].delta.content
-                                data = json.dumps({'choices': [{'delta': {'content': content}}]}, ensure_ascii=False)
-                                yield f"data: {data}\n\n".encode('utf-8')
-                                full_response.append(content)
-                        else:
-                            logger.error("收到 chunk 中没有 choices 字段")
+                        event = chunk_event(chunk)
+                        if event:
+                            yield event[0]
+                            full_response.append(event[1])
                     
                     # 如果启用了联网搜索，添加网页链接
                     if is_web_search and search_result_urls_str:
-                        content_str = '\n\n相关网页链接：' + search_result_urls_str + '\n'
-                        data = json.dumps({'choices': [{'delta': {'content': content_str}}]}, ensure_ascii=False)
-                        yield f"data: {data}\n\n".encode('utf-8')
+                        yield links_event(search_result_urls_str)
 
-                    yield b"data: [DONE]\n\n"
+                    yield SSE_DONE
                     CustomLogger.response_complete(cleaned_messages[-1]['content'], ''.join(full_response))
                 except Exception as e:
                     logger.error("生成响应流时出错: %s", str(e))
-                    error_data = json.dumps({'error': str(e)}, ensure_ascii=False)
-                    yield f"data: {error_data}\n\n".encode('utf-8')
-                    yield b"data: [DONE]\n\n"
+                    yield error_event(e)
+                    yield SSE_DONE
 
             return Response(
                 stream_with_context(generate()),
@@ -3,14 +3,21 @@ import json
 import logging
 import asyncio
 from datetime import datetime
-from openai import OpenAI
+from llm_clients import get_llm_client
 from web_kg import get_web_kg
 from utils.text_utils import is_chinese
 from utils.logger_utils import CustomLogger
+from utils.stream_utils import SSE_HEADERS, SSE_DONE, chunk_event, links_event, error_event
 from system_prompts import search_answer_zh_template, search_answer_en_template
 
 logger = logging.getLogger(__name__)
 
+# /api/chat_with_doc 的必要参数
+REQUIRED_PARAMS = ['messages', 'base_url', 'api_key', 'model_name',
+                   'embedding_base_url', 'embedding_api_key', 'embedding_model_name']
+# 每个文档放入上下文的片段数
+DOC_CONTEXT_CHUNKS = 5
+
 def clean_messages(messages):
     """
     清理消息数组，只保留role和content字段，删除id、timestamp等无关字段
@@ -38,17 +45,99 @@ def clean_messages(messages):
     
     return cleaned_messages
 
+def build_doc_messages(doc_store, user_query, cleaned_messages, document_ids, embeddings):
+    """检索相关文档片段，构建发送给模型的消息（同步和异步两种服务方式共用）
+
+    Args:
+        doc_store: DocumentStore 实例
+        user_query: 用户最新的问题
+        cleaned_messages: 清理后的消息数组
+        document_ids: 文件哈希值列表，为空时在所有文档中检索
+        embeddings: 查询使用的嵌入客户端
+
+    Returns:
+        list: 以文档内容作为系统消息的请求消息
+    """
+    # 获取相关文档内容
+    context = ""
+    if document_ids:
+        # 每个文档各取前几个片段，一个高度相关的文档不会占满全部名额；
+        # 只检索一次：查询只向量化一次，关键词只检索一次，再按文档分配名额
+        logger.info(f"在指定的 {len(document_ids)} 个文档中搜索相关内容")
+        hits = doc_store.search_with_scores(user_query, document_ids=document_ids, embeddings=embeddings,
+                                            per_document_k=DOC_CONTEXT_CHUNKS)
+        by_document = {}
+        for doc, score in hits:
+            by_document.setdefault(doc.metadata.get('document_id'), []).append(doc.page_content)
+        for doc_id in document_ids:
+            chunks = by_document.get(doc_id)
+            if chunks:
+                doc_context = "\n\n".join(chunks)
+                context += f"\n\n文档 {doc_id} 的相关内容:\n{doc_context}"
+                logger.info(f"在文档 {doc_id} 中找到 {len(chunks)} 个相关片段")
+            else:
+                logger.warning(f"在文档 {doc_id} 中未找到相关内容")
+    else:
+        # 如果没有提供文档ID，则在所有文档中搜索
+        logger.info("在所有文档中搜索相关内容")
+        hits = doc_store.search_with_scores(user_query, k=DOC_CONTEXT_CHUNKS, embeddings=embeddings)
+        context = "\n\n".join([doc.page_content for doc, score in hits])
+        logger.info(f"找到 {len(hits)} 个相关片段")
+    
+    # 如果没有找到相关内容，记录警告
+    if not context.strip():
+        logger.warning("未找到相关文档内容")
+        context = "未找到相关文档内容。"
+    
+    # 记录聊天完成信息
+    CustomLogger.chat_completion(user_query, len(context.split("\n")), context)
+    
+    # 构建系统消息
+    system_message = {
+        "role": "system",
+        "content": f"""你是一个智能助手，可以回答用户关于文档的问题。
+请基于以下文档内容回答用户的问题。如果文档内容中没有相关信息，请诚实地告诉用户你不知道，不要编造答案。
+
+文档内容:
+{context}
+
+请注意:
+1. 回答要简洁明了，直接基于文档内容回答问题
+2. 如果文档内容不足以回答问题，请明确告知用户
+3. 不要在回答中包含"根据文档内容"、"文档中提到"等词语
+4. 如果用户问题与文档无关，请礼貌地将话题引导回文档内容"""
+    }
+    
+    # 构建请求消息
+    request_messages = [system_message]
+    for msg in cleaned_messages[1:]:  # 跳过原始系统消息，使用清理后的消息
+        request_messages.append(msg)
+    
+    return request_messages
+
 def register_doc_chat_routes(app, doc_store):
     """注册文档聊天相关路由"""
     
+    @app.route('/api/doc_store/stats', methods=['GET'])
+    def doc_store_stats():
+        """返回文档索引和向量缓存的命中统计"""
+        if doc_store is None:
+            return jsonify({'error': 'DocumentStore未初始化'}), 500
+        return jsonify(doc_store.stats())
+
+    @app.route('/api/doc_store/documents/<document_id>', methods=['GET'])
+    def doc_store_document(document_id):
+        """返回单个文档的入库统计和索引状态，可以用 ?model_name= 指定嵌入模型"""
+        if doc_store is None:
+            return jsonify({'error': 'DocumentStore未初始化'}), 500
+        info = doc_store.document_info(document_id, model_name=request.args.get('model_name'))
+        if info is None:
+            return jsonify({'error': '文档不存在'}), 404
+        return jsonify(info)
+
     @app.route('/api/chat_with_doc', methods=['POST', 'OPTIONS'])
     def chat_with_doc():
-        headers = {
-            'Content-Type': 'text/event-stream',
-            'Cache-Control': 'no-cache',
-            'Connection': 'keep-alive',
-            'X-Accel-Buffering': 'no'  # 禁用 Nginx 缓冲
-        }
+        headers = dict(SSE_HEADERS)
 
         # 处理 OPTIONS 预检请求
         if request.method == 'OPTIONS':
@@ -60,9 +149,7 @@ def register_doc_chat_routes(app, doc_store):
             CustomLogger.request(request.method, request.path, data)
             
             # 检查必要参数
-            required_params = ['messages', 'base_url', 'api_key', 'model_name', 
-                             'embedding_base_url', 'embedding_api_key', 'embedding_model_name']
-            for param in required_params:
+            for param in REQUIRED_PARAMS:
                 if not data.get(param):
                     raise ValueError(f'Missing required parameter: {param}')
             
@@ -126,73 +213,18 @@ def register_doc_chat_routes(app, doc_store):
                 logger.error("doc_store为空，无法处理文档聊天请求")
                 return jsonify({'error': 'DocumentStore未初始化'}), 500
             
-            # 更新doc_store配置
-            doc_store.update_config(
+            # 从客户端池取得嵌入客户端，检索该模型的索引
+            embeddings = doc_store.get_embeddings(
                 api_key=embedding_api_key,
                 base_url=embedding_base_url,
                 model_name=embedding_model_name
             )
             
-            # 获取相关文档内容
-            context = ""
-            if document_ids:
-                # 如果提供了文档ID列表，则在这些文档中搜索
-                logger.info(f"在指定的 {len(document_ids)} 个文档中搜索相关内容")
-                for doc_id in document_ids:
-                    logger.info(f"搜索文档: {doc_id}")
-                    try:
-                        # 在每个文档中搜索相关内容
-                        docs = doc_store.search(user_query, k=5, document_id=doc_id)
-                        if docs:
-                            # 将每个文档的搜索结果添加到上下文中
-                            doc_context = "\n\n".join([doc.page_content for doc in docs])
-                            context += f"\n\n文档 {doc_id} 的相关内容:\n{doc_context}"
-                            logger.info(f"在文档 {doc_id} 中找到 {len(docs)} 个相关片段")
-                        else:
-                            logger.warning(f"在文档 {doc_id} 中未找到相关内容")
-                    except Exception as e:
-                        logger.error(f"搜索文档 {doc_id} 时出错: {str(e)}")
-            else:
-                # 如果没有提供文档ID，则在所有文档中搜索
-                logger.info("在所有文档中搜索相关内容")
-                docs = doc_store.search(user_query, k=5)
-                context = "\n\n".join([doc.page_content for doc in docs])
-                logger.info(f"找到 {len(docs)} 个相关片段")
-            
-            # 如果没有找到相关内容，记录警告
-            if not context.strip():
-                logger.warning("未找到相关文档内容")
-                context = "未找到相关文档内容。"
+            # 检索相关片段并构建请求消息
+            request_messages = build_doc_messages(doc_store, user_query, cleaned_messages, document_ids, embeddings)
             
-            # 记录聊天完成信息
-            CustomLogger.chat_completion(user_query, len(context.split("\n")), context)
-            
-            # 构建系统消息
-            system_message = {
-                "role": "system",
-                "content": f"""你是一个智能助手，可以回答用户关于文档的问题。
-请基于以下文档内容回答用户的问题。如果文档内容中没有相关信息，请诚实地告诉用户你不知道，不要编造答案。
-
-文档内容:
-{context}
-
-请注意:
-1. 回答要简洁明了，直接基于文档内容回答问题
-2. 如果文档内容不足以回答问题，请明确告知用户
-3. 不要在回答中包含"根据文档内容"、"文档中提到"等词语
-4. 如果用户问题与文档无关，请礼貌地将话题引导回文档内容"""
-            }
-            
-            # 构建请求消息
-            request_messages = [system_message]
-            for msg in cleaned_messages[1:]:  # 跳过原始系统消息，使用清理后的消息
-                request_messages.append(msg)
-            
-            # 创建客户端
-            client = OpenAI(
-                api_key=api_key,
-                base_url=base_url
-            )
+            # 从进程级客户端池取得客户端
+            client = get_llm_client(api_key, base_url)
             
             # 检查是否为 OpenRouter 请求
             is_openrouter = "openrouter.ai" in base_url
@@ -229,28 +261,21 @@ def register_doc_chat_routes(app, doc_store):
                 try:
                     for chunk in response:
                         logger.debug("收到 chunk: %s", chunk)
-                        if hasattr(chunk, 'choices') and len(chunk.choices) > 0:
-                            if hasattr(chunk.choices[0].delta, 'reasoning_content') and chunk.choices[0].delta.reasoning_content:
-                                content = chunk.choices[0].delta.reasoning_content
-                                yield f"data: {json.dumps({'choices': [{'delta': {'reasoning_content': chunk.choices[0].delta.reasoning_content}}]})}\n\n".encode('utf-8')
-                                full_response.append(content)
-                            elif hasattr(chunk.choices[0].delta, 'content') and chunk.choices[0].delta.content:
-                                content = chunk.choices[0].delta.content
-                                yield f"data: {json.dumps({'choices': [{'delta': {'content': chunk.choices[0].delta.content}}]})}\n\n".encode('utf-8')
-                                full_response.append(content)
-                        else:
-                            logger.error("收到 chunk 中没有 choices 字段")
+                        event = chunk_event(chunk)
+                        if event:
+                            yield event[0]
+                            full_response.append(event[1])
                     
                     # 如果启用了联网搜索，添加网页链接
                     if is_web_search and search_result_urls_str:
-                        yield f"data: {json.dumps({'choices': [{'delta': {'content': f'\n\n相关网页链接：{search_result_urls_str}\n'}}]})}\n\n".encode('utf-8')
+                        yield links_event(search_result_urls_str)
 
-                    yield b"data: [DONE]\n\n"
+                    yield SSE_DONE
                     CustomLogger.response_complete(cleaned_messages[-1]['content'], ''.join(full_response))
                 except Exception as e:
                     logger.error("生成响应流时出错: %s", str(e))
-                    yield f"data: {json.dumps({'error': str(e)})}\n\n".encode('utf-8')
-                    yield b"data: [DONE]\n\n"
+                    yield error_event(e)
+                    yield SSE_DONE
 
             return Response(
                 stream_with_context(generate()),
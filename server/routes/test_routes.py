@@ -1,7 +1,7 @@
 # -*- coding: utf-8 -*-
 import json
 from flask import jsonify, request, Response, stream_with_context
-from openai import OpenAI
+from llm_clients import get_llm_client
 import logging
 import sys
 import os
@@ -99,11 +99,8 @@ def register_test_routes(app):
             if not messages:
                 return jsonify({"error": "缺少消息内容"}), 400
             
-            # 初始化 OpenAI 客户端
-            client = OpenAI(
-                base_url=base_url,
-                api_key=api_key
-            )
+            # 从进程级客户端池取得 OpenAI 客户端
+            client = get_llm_client(api_key, base_url)
             
             # 设置额外的请求头
             extra_headers = {
@@ -1,14 +1,24 @@
-from flask import request, jsonify
+from flask import request, jsonify, Response, stream_with_context
 import os
+import json
+import time
 import traceback
 import logging
-from utils.file_utils import allowed_file, process_filename, check_sensitive_info, is_masked_file
+from ingest_jobs import IngestJobQueue, QueueFullError
+from utils.file_utils import allowed_file, process_filename, is_masked_file, SensitiveInfoScanner, save_upload_stream, upload_path
 from utils.logger_utils import CustomLogger
 
 logger = logging.getLogger(__name__)
 
 def register_upload_routes(app, doc_store, upload_folder):
     """注册上传相关路由"""
+
+    # 文件保存后交给后台任务队列入库，上传请求不再等待向量化完成
+    job_queue = IngestJobQueue(doc_store)
+    # 批量上传一次最多的文件数
+    batch_max_files = int(os.getenv('UPLOAD_BATCH_MAX_FILES', '50'))
+    # wait=true 时最多等待的秒数，超时后返回任务ID，客户端改为查询进度
+    wait_timeout = float(os.getenv('UPLOAD_WAIT_TIMEOUT', '600'))
     
     @app.route('/upload', methods=['POST'])
     def upload_file():
@@ -22,19 +32,20 @@ def register_upload_routes(app, doc_store, upload_folder):
         embedding_api_key = request.form.get('embedding_api_key', '默认的embedding_api_key') 
         embedding_model_name = request.form.get('embedding_model_name', '默认的embedding_model_name')
         sensitive_info_protected = request.form.get('sensitive_info_protected', 'false') == 'true'
+        # 客户端明确指明这是哪个文档的新版本时才基于旧版本增量入库，否则新旧版本各自保留
+        replaces = request.form.get('replaces') or None
         logger.info(f"接收到的embedding配置 - model: {embedding_model_name}, base_url: {embedding_base_url}")
         logger.info(f"敏感信息保护: {'启用' if sensitive_info_protected else '禁用'}")
 
-        # 更新全局DocumentStore实例
+        # 从客户端池取得本次请求的嵌入客户端，不修改全局DocumentStore实例
         try:
-            doc_store.update_config(
+            embeddings = doc_store.get_embeddings(
                 api_key=embedding_api_key,
                 base_url=embedding_base_url,
                 model_name=embedding_model_name
             )
-            logger.info("DocumentStore实例更新成功")
         except Exception as e:
-            logger.error(f"更新DocumentStore实例失败: {str(e)}")
+            logger.error(f"创建嵌入客户端失败: {str(e)}")
             return jsonify({'error': '配置更新失败'}), 500
         
         file = request.files['documents']
@@ -50,41 +61,206 @@ def register_upload_routes(app, doc_store, upload_folder):
                 is_masked = is_masked_file(original_filename)
                 logger.info(f"接收到的文件: {original_filename}, 是否为掩码处理后的文件: {is_masked}")
                 
-                # 读取文件内容并检查
-                file_content = file.read().decode('utf-8', errors='ignore')
-                file_size = len(file_content)
-                content_preview = file_content[:200] + '...' if len(file_content) > 200 else file_content
-                logger.info(f"文件内容预览: {content_preview}")
-                
-                # 检查敏感信息
-                check_sensitive_info(file_content, sensitive_info_protected)
-                
-                # 重置文件指针
-                file.seek(0)
-                
                 # 处理文件名
                 safe_filename = process_filename(original_filename)
-                file_path = os.path.join(upload_folder, safe_filename)
-                logger.info(f"准备保存文件: {safe_filename}, 大小: {file_size} bytes")
-                file.save(file_path)
-                logger.info(f"文件已保存到: {file_path}")
+                logger.info(f"准备保存文件: {safe_filename}")
+
+                # 一遍读取上传流：写入磁盘、计算内容哈希、按文件类型扫描敏感信息，不把整个文件读入内存；
+                # 文件按内容哈希保存，同名的其他上传不会覆盖它
+                scanner = SensitiveInfoScanner(original_filename)
+                file_path, content_hash, file_size = save_upload_stream(file.stream, upload_folder,
+                                                                        safe_filename, scanner)
+                logger.info(f"文件已保存到: {file_path}, 大小: {file_size} bytes")
+                if scanner.preview:
+                    logger.info(f"文件内容预览: {scanner.preview}...")
+                scanner.finish(sensitive_info_protected)
                 
-                # 使用doc_store处理文件
-                logger.info("开始处理文件...")
-                result = doc_store.process_single_file(file_path)
-                if result['success']:
-                    logger.info(f"文件处理成功, document_id: {result['document_id']}")
+                # 内容相同的文档已经入库时直接返回，不论文件名是否相同
+                document_id = doc_store.find_by_content_hash(content_hash, file_path,
+                                                         model_name=embeddings.model_name)
+                if document_id:
+                    logger.info(f"相同内容的文档已入库, document_id: {document_id}")
                     return jsonify({
                         'message': '文件上传并处理成功',
-                        'document_id': result['document_id']
+                        'document_id': document_id,
+                        'status': 'completed',
+                        'duplicate': True
                     })
-                else:
-                    logger.error("文件处理失败")
-                    return jsonify({'error': '文件处理失败'}), 500
+
+                # 提交后台入库任务，固定使用本次请求的嵌入配置
+                try:
+                    job, coalesced = job_queue.submit(file_path, original_filename, content_hash,
+                                                      embeddings=embeddings, replaces=replaces)
+                except QueueFullError as e:
+                    logger.error(str(e))
+                    return jsonify({'error': str(e)}), 503
+
+                # 兼容旧的调用方式：wait=true 时等待处理完成再返回
+                if request.form.get('wait', 'false') == 'true' and job.wait(timeout=wait_timeout):
+                    if job.status == 'completed':
+                        logger.info(f"文件处理成功, document_id: {job.document_id}")
+                        return jsonify({
+                            'message': '文件上传并处理成功',
+                            'document_id': job.document_id,
+                            'job_id': job.job_id
+                        })
+                    logger.error(f"文件处理失败: {job.error}")
+                    return jsonify({'error': '文件处理失败', 'job_id': job.job_id}), 500
+
+                return jsonify({
+                    'message': '文件已上传，正在后台处理',
+                    'job_id': job.job_id,
+                    'status': job.status,
+                    'coalesced': coalesced
+                }), 202
                 
             except Exception as e:
                 logger.error(f"文件上传处理过程出错: {str(e)}\n{traceback.format_exc()}")
                 return jsonify({'error': str(e)}), 500
         else:
             logger.error(f"不支持的文件类型: {file.filename}")
-            return jsonify({'error': '不支持的文件类型'}), 400 
\ No newline at end of file
+            return jsonify({'error': '不支持的文件类型'}), 400
+
+    @app.route('/upload/batch', methods=['POST'])
+    def upload_batch():
+        """批量上传：documents 字段可以包含多个文件，每个文件保存后提交到后台入库任务队列
+
+        与单文件上传共用同一个有界任务队列：内容相同且正在处理的文件合并到已有任务，不会重复入库。
+        返回每个文件的 job_id（已入库的内容直接返回 document_id）；wait=true 时在 UPLOAD_WAIT_TIMEOUT
+        秒内等待全部任务结束，超时的文件仍返回 job_id。
+        """
+        files = [f for f in request.files.getlist('documents') if f.filename]
+        if not files:
+            logger.error("请求中未包含文件")
+            return jsonify({'error': 'No file part'}), 400
+        if len(files) > batch_max_files:
+            return jsonify({'error': f'一次最多上传 {batch_max_files} 个文件'}), 400
+        if doc_store is None:
+            return jsonify({'error': 'DocumentStore未初始化'}), 500
+
+        sensitive_info_protected = request.form.get('sensitive_info_protected', 'false') == 'true'
+        try:
+            embeddings = doc_store.get_embeddings(
+                api_key=request.form.get('embedding_api_key', '默认的embedding_api_key'),
+                base_url=request.form.get('embedding_base_url', '默认的embedding_base_url'),
+                model_name=request.form.get('embedding_model_name', '默认的embedding_model_name')
+            )
+        except Exception as e:
+            logger.error(f"创建嵌入客户端失败: {str(e)}")
+            return jsonify({'error': '配置更新失败'}), 500
+        logger.info(f"开始处理批量上传请求，共 {len(files)} 个文件")
+
+        results = []
+        jobs = {}  # 结果序号 -> 入库任务
+        for file in files:
+            original_filename = file.filename
+            if not allowed_file(original_filename):
+                results.append({'file_name': original_filename, 'status': 'failed', 'error': '不支持的文件类型'})
+                continue
+            try:
+                scanner = SensitiveInfoScanner(original_filename)
+                file_path, content_hash, file_size = save_upload_stream(file.stream, upload_folder,
+                                                                        process_filename(original_filename), scanner)
+                scanner.finish(sensitive_info_protected)
+                logger.info(f"文件已保存到: {file_path}, 大小: {file_size} bytes")
+
+                document_id = doc_store.find_by_content_hash(content_hash, file_path,
+                                                             model_name=embeddings.model_name)
+                if document_id:
+                    results.append({'file_name': original_filename, 'status': 'completed',
+                                    'document_id': document_id, 'duplicate': True})
+                    continue
+                job, coalesced = job_queue.submit(file_path, original_filename, content_hash,
+                                                  embeddings=embeddings)
+            except Exception as e:
+                logger.error(f"处理文件 {original_filename} 失败: {str(e)}")
+                results.append({'file_name': original_filename, 'status': 'failed', 'error': str(e)})
+                continue
+            jobs[len(results)] = job
+            results.append({'file_name': original_filename, 'job_id': job.job_id, 'coalesced': coalesced})
+
+        if request.form.get('wait', 'false') == 'true':
+            deadline = time.monotonic() + wait_timeout
+            for job in jobs.values():
+                if not job.wait(timeout=max(0.0, deadline - time.monotonic())):
+                    break
+        for index, job in jobs.items():
+            state = job.to_dict()
+            results[index].update(status=state['status'], document_id=state['document_id'])
+            if state['error']:
+                results[index]['error'] = state['error']
+
+        succeeded = sum(1 for result in results if result['status'] == 'completed')
+        failed = sum(1 for result in results if result['status'] == 'failed')
+        logger.info(f"批量上传已提交: 完成 {succeeded} 个，失败 {failed} 个，处理中 {len(results) - succeeded - failed} 个")
+        return jsonify({
+            'results': results,
+            'succeeded': succeeded,
+            'failed': failed,
+            'pending': len(results) - succeeded - failed
+        }), 200 if succeeded + failed == len(results) else 202
+
+    @app.route('/upload/check', methods=['POST'])
+    def upload_check():
+        """上传前检查：客户端先发送文件的 sha256，已入库的内容不需要再传输文件
+
+        请求体: {"sha256": "...", "file_name": "可选，原始文件名",
+                 "embedding_model_name": "可选，在该嵌入模型的索引中检查，默认为默认嵌入配置"}
+        """
+        data = request.get_json(silent=True) or {}
+        content_hash = str(data.get('sha256', '')).strip().lower()
+        if len(content_hash) != 64 or any(c not in '0123456789abcdef' for c in content_hash):
+            return jsonify({'error': 'sha256 格式不正确'}), 400
+        if doc_store is None:
+            return jsonify({'error': 'DocumentStore未初始化'}), 500
+
+        file_name = data.get('file_name')
+        file_path = upload_path(upload_folder, process_filename(file_name), content_hash) if file_name else None
+        # 只按模型名称定位索引，检查本身不需要调用嵌入接口
+        model_name = data.get('embedding_model_name')
+        document_id = doc_store.find_by_content_hash(content_hash, file_path, model_name=model_name)
+        if document_id:
+            logger.info(f"上传前检查命中已入库文档: {document_id}")
+            return jsonify({'exists': True, 'status': 'completed', 'document_id': document_id})
+
+        # 相同内容正在处理时返回任务ID，客户端可以直接查询进度
+        job = job_queue.active_job(content_hash, model_name)
+        if job is not None:
+            return jsonify({'exists': True, 'status': job.status, 'job_id': job.job_id})
+        return jsonify({'exists': False})
+
+    @app.route('/upload/jobs', methods=['GET'])
+    def upload_job_stats():
+        """返回入库任务队列统计"""
+        return jsonify(job_queue.stats())
+
+    @app.route('/upload/jobs/<job_id>', methods=['GET'])
+    def upload_job_status(job_id):
+        """查询入库任务进度，stream=true 时以 SSE 推送进度直到任务结束"""
+        job = job_queue.get(job_id)
+        if job is None:
+            return jsonify({'error': '任务不存在'}), 404
+
+        if request.args.get('stream', 'false') != 'true':
+            return jsonify(job.to_dict())
+
+        def generate():
+            version = None
+            while True:
+                state = job.to_dict()
+                if version != state['version']:
+                    version = state['version']
+                    yield f"data: {json.dumps(state)}\n\n".encode('utf-8')
+                if state['status'] not in ('queued', 'running'):
+                    break
+                job.wait_for_change(version, timeout=15)
+            yield b"data: [DONE]\n\n"
+
+        return Response(
+            stream_with_context(generate()),
+            mimetype='text/event-stream',
+            headers={
+                'Cache-Control': 'no-cache',
+                'X-Accel-Buffering': 'no'
+            }
+        )
@@ -0,0 +1,194 @@
+import logging
+import re
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger('document_store')
+
+_token_encoder = None
+
+# 切分边界，按优先级: 段落（空行）> 句子（。！？ 以及英文 .!? 后跟空白）> 换行
+_BOUNDARY = re.compile(
+    r'(?=[。！？.!?\n])(?:'  # 大部分位置不是边界，先用首字符快速排除
+    r'((?:[。！？.!?]+["\'”’」』）》)\]]*[ \t]*)?\n[ \t]*\n\s*)'
+    r'|([。！？]+["\'”’」』）》]*[ \t]*|[.!?]+["\'”’)\]]*(?:[ \t]+|(?=\n)|$))'
+    r'|(\n))'
+)
+PARAGRAPH, SENTENCE, LINE, NONE = 3, 2, 1, 0
+_GROUP_LEVELS = {1: PARAGRAPH, 2: SENTENCE, 3: LINE}
+
+# 超长句子强制拆分时优先在这些字符之后断开
+_SOFT_BREAK = re.compile(r'[，,、；;：:\s]')
+
+
+def _encoder():
+    global _token_encoder
+    if _token_encoder is None:
+        try:
+            import tiktoken
+            _token_encoder = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            logger.warning(f"加载 tiktoken 失败，使用字节数估算 token: {str(e)}")
+            _token_encoder = False
+    return _token_encoder
+
+
+def count_tokens(text):
+    """估算文本的 token 数，tiktoken 不可用时按 UTF-8 字节数粗略估算"""
+    encoder = _encoder()
+    if encoder:
+        return len(encoder.encode(text, disallowed_special=()))
+    return len(text.encode('utf-8')) // 3 + 1
+
+
+def count_tokens_batch(texts):
+    """批量估算 token 数，tiktoken 可用时一次调用编码全部文本"""
+    encoder = _encoder()
+    if encoder:
+        return [len(tokens) for tokens in encoder.encode_ordinary_batch(texts)]
+    return [len(text.encode('utf-8')) // 3 + 1 for text in texts]
+
+
+class TextChunker:
+    """按 token 数切分文本
+
+    一遍正则扫描把文本切成带边界级别的片段（段落 / 句子 / 行），每个片段只计算一次 token 数，
+    再按前缀和贪心装箱：放不下时在后半段中优先级最高的边界处断开，
+    下一块以上一块末尾不超过 overlap_tokens 的完整片段开头。
+    切分结果是原文中的偏移 (start, end)，只在生成 Document 时才截取字符串。
+    """
+
+    def __init__(self, chunk_tokens=400, overlap_tokens=80, min_fill=0.5):
+        if overlap_tokens >= chunk_tokens:
+            raise ValueError("overlap_tokens 必须小于 chunk_tokens")
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.min_fill = min_fill  # 断点之前至少要装满的比例，避免为了找段落边界切出很小的块
+
+    def _segments(self, text):
+        """返回 [(start, end, tokens, 结尾的边界级别)]，超长片段拆成多段"""
+        # 先只记录偏移，只有空白的片段（空行等）并入前一个片段，边界级别取较高者
+        bounds = []
+        start = 0
+        for match in _BOUNDARY.finditer(text):
+            end = match.end()
+            level = _GROUP_LEVELS[match.lastindex]
+            if text[start].isspace() and text[start:end].isspace():
+                if bounds:
+                    previous = bounds[-1]
+                    bounds[-1] = (previous[0], end, max(previous[2], level))
+            else:
+                bounds.append((start, end, level))
+            start = end
+        if start < len(text):
+            if text[start:].isspace():
+                if bounds:
+                    bounds[-1] = (bounds[-1][0], len(text), PARAGRAPH)
+            else:
+                bounds.append((start, len(text), PARAGRAPH))
+
+        # 每个片段只计算一次 token 数，批量编码
+        counts = count_tokens_batch([text[start:end] for start, end, _ in bounds])
+        segments = []
+        for (start, end, level), tokens in zip(bounds, counts):
+            if tokens <= self.chunk_tokens:
+                segments.append((start, end, tokens, level))
+            else:
+                self._split_segment(segments, text, start, end, tokens, level)
+        return segments
+
+    def _split_segment(self, segments, text, start, end, tokens, level):
+        """没有标点的超长片段按字符数估算拆分位置，尽量在逗号或空白之后断开"""
+        pieces = -(-tokens // self.chunk_tokens)
+        step = max(1, (end - start) // pieces)
+        piece_start = start
+        while piece_start < end:
+            piece_end = min(end, piece_start + step)
+            if piece_end < end:
+                window_start = piece_start + step // 2
+                soft = None
+                for soft in _SOFT_BREAK.finditer(text, window_start, piece_end):
+                    pass
+                if soft is not None:
+                    piece_end = soft.end()
+            piece_tokens = count_tokens(text[piece_start:piece_end])
+            if piece_tokens > self.chunk_tokens and piece_end - piece_start > 1:
+                # 估算偏差导致仍然超长时缩短一半再试
+                step = max(1, (piece_end - piece_start) // 2)
+                continue
+            piece_level = level if piece_end == end else NONE
+            if text[piece_start:piece_end].isspace():
+                self._merge_whitespace(segments, piece_end, piece_level)
+            else:
+                segments.append((piece_start, piece_end, piece_tokens, piece_level))
+            piece_start = piece_end
+
+    @staticmethod
+    def _merge_whitespace(segments, end, level):
+        """只有空白的片段（空行等）并入前一个片段，边界级别取较高者"""
+        if segments:
+            previous_start, _, previous_tokens, previous_level = segments[-1]
+            segments[-1] = (previous_start, end, previous_tokens, max(previous_level, level))
+
+    def spans(self, text):
+        """切分文本
+
+        Returns:
+            List[Tuple[int, int, int]]: (起始偏移, 结束偏移, token 数)，已去掉首尾空白
+        """
+        segments = self._segments(text)
+        count = len(segments)
+        prefix = [0]
+        for segment in segments:
+            prefix.append(prefix[-1] + segment[2])
+
+        spans = []
+        first = 0
+        previous_end = 0  # 上一块结束的片段序号，下一块必须包含它之后的新片段
+        while first < count:
+            stop = first
+            while stop < count and prefix[stop + 1] - prefix[first] <= self.chunk_tokens:
+                stop += 1
+            if stop < count:
+                # 在装满 min_fill 之后的范围内找优先级最高（同级取最靠后）的边界
+                cut, cut_level = stop, segments[stop - 1][3]
+                for end in range(stop - 1, max(first, previous_end), -1):
+                    if prefix[end] - prefix[first] < self.chunk_tokens * self.min_fill:
+                        break
+                    if segments[end - 1][3] > cut_level:
+                        cut, cut_level = end, segments[end - 1][3]
+                        if cut_level == PARAGRAPH:
+                            break
+                stop = cut
+            self._emit(spans, text, segments[first][0], segments[stop - 1][1], prefix[stop] - prefix[first])
+            if stop >= count:
+                break
+            # 重叠: 从末尾向前取不超过 overlap_tokens 的完整片段，并保证下一个新片段放得下
+            next_first = stop
+            while next_first > first + 1 and prefix[stop] - prefix[next_first - 1] <= self.overlap_tokens:
+                next_first -= 1
+            while next_first < stop and prefix[stop + 1] - prefix[next_first] > self.chunk_tokens:
+                next_first += 1
+            previous_end = stop
+            first = next_first
+        return spans
+
+    @staticmethod
+    def _emit(spans, text, start, end, tokens):
+        while start < end and text[start].isspace():
+            start += 1
+        while end > start and text[end - 1].isspace():
+            end -= 1
+        # 新增的片段只有空白时，这一块已经完全包含在上一块中
+        if end > start and (not spans or end > spans[-1][1]):
+            spans.append((start, end, tokens))
+
+    def split_documents(self, documents):
+        """切分 Document 列表，元数据中记录文本块在原文中的 start_index / end_index"""
+        chunks = []
+        for document in documents:
+            text = document.page_content
+            for start, end, _ in self.spans(text):
+                chunks.append(Document(page_content=text[start:end],
+                                       metadata={**document.metadata, 'start_index': start, 'end_index': end}))
+        return chunks
@@ -1,5 +1,8 @@
+import codecs
+import hashlib
 import os
 import re
+import uuid
 from werkzeug.utils import secure_filename
 from datetime import datetime
 from pypinyin import lazy_pinyin
@@ -9,6 +12,13 @@ logger = logging.getLogger(__name__)
 
 # 允许的文件扩展名
 ALLOWED_EXTENSIONS = {'txt', 'pdf', 'doc', 'docx'}
+# 原始字节即为文本、可以边上传边扫描敏感信息的文件类型；
+# pdf/doc/docx 的内容是压缩或二进制格式，按 UTF-8 解码只会得到乱码
+TEXT_EXTENSIONS = {'txt', 'md'}
+# 流式保存上传文件时每次读取的字节数
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+PHONE_PATTERN = re.compile(r'\b1\d{10}\b')
 
 def allowed_file(filename):
     """检查文件扩展名是否在允许列表中"""
@@ -37,13 +47,102 @@ def process_filename(original_filename):
 def check_sensitive_info(file_content, sensitive_info_protected=False):
     """检查文件内容中是否包含敏感信息"""
     # 检查是否包含手机号码
-    phone_pattern = re.compile(r'\b1\d{10}\b')
-    phone_matches = phone_pattern.findall(file_content)
+    phone_matches = PHONE_PATTERN.findall(file_content)
+    _log_sensitive_info(phone_matches, sensitive_info_protected)
+    return phone_matches
+
+def _log_sensitive_info(phone_matches, sensitive_info_protected):
     if phone_matches:
         logger.warning(f"文件中包含未掩码的手机号码: {phone_matches[:3]}")
         if sensitive_info_protected:
             logger.error("警告：敏感信息保护已启用，但文件中仍包含未掩码的手机号码")
-    return phone_matches
+
+class SensitiveInfoScanner:
+    """按块扫描上传文件中的敏感信息
+
+    文本类型的文件增量解码后用正则匹配，只保留跨块匹配所需的少量尾部文本，内存占用与文件大小无关；
+    其他类型的原始字节不是文本，不做扫描（scanned 为 False）。
+    """
+
+    # 跨块保留的字符数，需大于最长匹配的长度
+    OVERLAP = 16
+
+    def __init__(self, filename, max_matches=20, preview_chars=200):
+        ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+        self.scanned = ext in TEXT_EXTENSIONS
+        self.max_matches = max_matches
+        self.preview_chars = preview_chars
+        self.preview = ''
+        self.phone_matches = []  # 最多保留 max_matches 个
+        self.phone_count = 0
+        self._decoder = codecs.getincrementaldecoder('utf-8')(errors='ignore')
+        self._tail = ''
+        self._tail_start = 0  # 尾部文本中已扫描过的前缀长度（保留它作为 \b 的上下文）
+
+    def feed(self, data, final=False):
+        """喂入一块原始字节，final 为 True 表示文件结束"""
+        if not self.scanned:
+            return
+        decoded = self._decoder.decode(data, final=final)
+        if len(self.preview) < self.preview_chars:
+            self.preview += decoded[:self.preview_chars - len(self.preview)]
+        text = self._tail + decoded
+        # 非最后一块时，结尾附近的匹配可能被下一块延长，留到下一次扫描
+        limit = len(text) if final else max(len(text) - self.OVERLAP, self._tail_start)
+        for match in PHONE_PATTERN.finditer(text, self._tail_start):
+            if match.start() >= limit:
+                break
+            self.phone_count += 1
+            if len(self.phone_matches) < self.max_matches:
+                self.phone_matches.append(match.group())
+        keep_from = max(limit - 1, 0)
+        self._tail = text[keep_from:]
+        self._tail_start = limit - keep_from
+
+    def finish(self, sensitive_info_protected=False):
+        """结束扫描并记录结果，返回找到的手机号码（最多 max_matches 个）"""
+        self.feed(b'', final=True)
+        if not self.scanned:
+            logger.info("非文本文件，跳过上传时的敏感信息扫描")
+        _log_sensitive_info(self.phone_matches, sensitive_info_protected)
+        return self.phone_matches
+
+def save_upload_stream(stream, upload_folder, filename, scanner=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    """把上传的文件流写入磁盘，同一遍读取中计算 SHA256 并把数据喂给敏感信息扫描器
+
+    先写入唯一的临时文件，算出内容哈希后移动到按内容寻址的路径 upload_folder/<sha256>/<filename>：
+    同名但内容不同的上传各自保存，排队中的入库任务读到的始终是提交时的文件。
+
+    Returns:
+        Tuple[str, str, int]: (保存后的文件路径, 内容的 SHA256, 字节数)
+    """
+    hash_sha256 = hashlib.sha256()
+    size = 0
+    os.makedirs(upload_folder, exist_ok=True)
+    tmp_path = os.path.join(upload_folder, f".{uuid.uuid4().hex}.uploading")
+    try:
+        with open(tmp_path, "wb") as f:
+            for chunk in iter(lambda: stream.read(chunk_size), b""):
+                f.write(chunk)
+                hash_sha256.update(chunk)
+                size += len(chunk)
+                if scanner is not None:
+                    scanner.feed(chunk)
+        content_hash = hash_sha256.hexdigest()
+        file_path = upload_path(upload_folder, filename, content_hash)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        # 内容相同的文件已经存在时原子替换，字节完全一致
+        os.replace(tmp_path, file_path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return file_path, content_hash, size
+
+
+def upload_path(upload_folder, filename, content_hash):
+    """上传文件按内容寻址的保存路径"""
+    return os.path.join(upload_folder, content_hash, filename)
 
 def is_masked_file(filename):
     """检查文件名是否包含_masked后缀，这表明它是经过掩码处理的"""
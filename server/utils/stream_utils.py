@@ -0,0 +1,62 @@
+import json
+import logging
+
+logger = logging.getLogger(__name__)
+
+# 流式聊天接口的响应头，同步和异步两种服务方式共用
+SSE_HEADERS = {
+    'Content-Type': 'text/event-stream',
+    'Cache-Control': 'no-cache',
+    'Connection': 'keep-alive',
+    'X-Accel-Buffering': 'no'  # 禁用 Nginx 缓冲
+}
+
+SSE_DONE = b"data: [DONE]\n\n"
+
+
+def _event(payload):
+    data = json.dumps(payload, ensure_ascii=False)
+    return f"data: {data}\n\n".encode('utf-8')
+
+
+def chunk_event(chunk):
+    """把上游的流式 chunk 转换成 SSE 事件
+
+    Args:
+        chunk: SDK 返回的 ChatCompletionChunk，或直接解析上游 SSE 得到的 dict
+
+    Returns:
+        Tuple[bytes, str] | None: (SSE 事件, 本次输出的文本)，chunk 中没有内容时返回 None
+    """
+    if isinstance(chunk, dict):
+        choices = chunk.get('choices')
+        if not choices:
+            logger.error("收到 chunk 中没有 choices 字段")
+            return None
+        delta = choices[0].get('delta') or {}
+        field = delta.get
+    else:
+        if not (hasattr(chunk, 'choices') and len(chunk.choices) > 0):
+            logger.error("收到 chunk 中没有 choices 字段")
+            return None
+        delta = chunk.choices[0].delta
+        field = lambda name: getattr(delta, name, None)
+    # 部分模型的推理过程放在 reasoning_content，OpenRouter 放在 reasoning，统一按 reasoning_content 返回
+    if field('reasoning_content'):
+        key, content = 'reasoning_content', field('reasoning_content')
+    elif field('reasoning'):
+        key, content = 'reasoning_content', field('reasoning')
+    elif field('content'):
+        key, content = 'content', field('content')
+    else:
+        return None
+    return _event({'choices': [{'delta': {key: content}}]}), content
+
+
+def links_event(search_result_urls_str):
+    """联网搜索的网页链接，作为回答末尾的一段内容返回"""
+    return _event({'choices': [{'delta': {'content': '\n\n相关网页链接：' + search_result_urls_str + '\n'}}]})
+
+
+def error_event(error):
+    return _event({'error': str(error)})
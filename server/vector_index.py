@@ -0,0 +1,827 @@
+import heapq
+import json
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from embedding_cache import text_hash
+
+logger = logging.getLogger('document_store')
+
+# 全量扫描时每次交给 faiss 计算的向量行数
+SCAN_BLOCK_ROWS = 16384
+
+# 近似索引类型：flat 为精确扫描；auto 按存活文本块数量在 flat / hnsw / ivfpq 之间自动选择
+ANN_TYPES = ('flat', 'hnsw', 'ivfsq8', 'ivfpq')
+HNSW_M = 32
+HNSW_EF_CONSTRUCTION = 200
+# 近似检索多取的候选倍数，候选再用原始向量精确重排，距离与精确扫描一致
+ANN_RERANK_FACTOR = 4
+# 近似索引建好之后追加的向量行超过这个数量（且超过已索引行数的 10%）时，在后台并入索引
+ANN_TAIL_ROWS = 20000
+# 限定文档范围的检索，候选行数不超过这个值时直接精确计算
+ANN_FILTER_EXACT_ROWS = 50000
+
+
+def _pq_subquantizers(dimension):
+    """PQ 子空间数：不超过 64 且每个子空间至少 8 维的最大约数"""
+    limit = max(1, min(64, dimension // 8))
+    return max(m for m in range(1, limit + 1) if dimension % m == 0)
+
+
+class VectorIndex:
+    """语料级向量索引
+
+    所有文档的文本块共用一份向量存储，每个文本块的 chunk_id 就是它在向量文件中的行号。
+    向量以 float32 原始格式追加写入 vectors.f32，读取时用 mmap 映射，
+    多个 worker 进程通过操作系统页缓存共享同一份物理内存；
+    文本块内容和元数据保存在 SQLite（chunks.db）中，按 chunk_id 和 document_id 建索引，不使用 pickle。
+
+    删除文档时只删除 SQLite 中的记录并把对应的行记为墓碑，向量文件不做原地修改。
+    限定文档范围的搜索只读取这些文档的向量行。
+
+    打开索引只需要映射向量文件和读取少量元数据，与语料规模无关；
+    命中的文本块放在有字节预算的 LRU 中，固定文档（pinned）常驻。
+
+    语料规模超过阈值后，在向量文件之上额外建立 faiss 近似索引（HNSW / IVF-SQ8 / IVF-PQ），
+    近似索引在后台线程中构建并保存为 ann_<类型>_<行数>.faiss，建好之前和之后新追加的行仍走精确扫描；
+    近似检索的候选用原始向量重排，墓碑行通过 IDSelector 排除。
+    """
+
+    def __init__(self, index_dir, cache_max_bytes=256 * 1024 * 1024, pinned=None, index_type='auto',
+                 hnsw_threshold=50000, ivf_threshold=500000, ef_search=64, nprobe=16, nlist=None):
+        if index_type not in ('auto',) + ANN_TYPES:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+        self.index_dir = Path(index_dir)
+        self.vectors_path = self.index_dir / "vectors.f32"
+        self.db_path = self.index_dir / "chunks.db"
+        self.cache_max_bytes = cache_max_bytes
+        self.pinned = set(pinned or [])
+        self.index_type = index_type
+        self.hnsw_threshold = hnsw_threshold
+        self.ivf_threshold = ivf_threshold
+        self.ef_search = ef_search
+        self.nprobe = nprobe
+        self.nlist = nlist
+        self._lock = threading.RLock()
+        self._conn = None
+        self._ann_generation = 0  # clear() 后作废仍在构建中的近似索引
+        self._reset()
+
+    def _reset(self):
+        self._loaded = False
+        self._data_version = None
+        self.dimension = None
+        self._row_count = 0  # 已提交的向量行数，向量文件末尾未提交的行会被忽略
+        self._tombstones = np.empty(0, dtype='int64')  # 已删除的行号，升序
+        self._mmap = None
+        self._mmap_rows = 0
+        # 文本块缓存: chunk_id -> (document_id, Document)，按最近使用排序
+        self._chunks: "OrderedDict[int, Tuple[str, Document]]" = OrderedDict()
+        self._chunk_bytes: Dict[int, int] = {}
+        self._cached_bytes = 0
+        self.chunk_hits = 0
+        self.chunk_misses = 0
+        self.chunk_evictions = 0
+        # 近似索引: 覆盖向量文件前 _ann_rows 行
+        self._ann = None
+        self._ann_type = 'flat'
+        self._ann_rows = 0
+        self._ann_building = False
+        self._ann_selector = None  # (墓碑数组, 排除墓碑的 IDSelector)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if not self._loaded:
+                self._open()
+                self._loaded = True
+
+    def _open(self):
+        """打开 SQLite 存储并创建表结构"""
+        self.index_dir.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(self.db_path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS documents (
+                document_id TEXT PRIMARY KEY,
+                chunk_count INTEGER NOT NULL,
+                complete INTEGER NOT NULL DEFAULT 1
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                chunk_id INTEGER PRIMARY KEY,
+                document_id TEXT NOT NULL,
+                page_content TEXT NOT NULL,
+                metadata TEXT NOT NULL,
+                content_hash TEXT
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_document_id ON chunks(document_id);
+            CREATE TABLE IF NOT EXISTS tombstones (
+                chunk_id INTEGER PRIMARY KEY
+            );
+            CREATE TABLE IF NOT EXISTS document_versions (
+                document_id TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            );
+        """)
+        # 索引的纪元：新建（包括清空后重建）的数据库各不相同，清空前的版本号不会与之后的混淆
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('epoch', ?)", (uuid.uuid4().hex,))
+        # 旧版本的 documents 表没有 complete 列，已有文档都是完整写入的
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(documents)")]
+        if "complete" not in columns:
+            self._conn.execute("ALTER TABLE documents ADD COLUMN complete INTEGER NOT NULL DEFAULT 1")
+        # 旧版本的 chunks 表没有 content_hash 列，读取时再按内容计算
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "content_hash" not in columns:
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN content_hash TEXT")
+        self._refresh()
+        logger.info(f"已打开语料索引: {self.index_dir}，向量维度 {self.dimension}，共 {self._row_count} 行")
+
+    def _refresh(self):
+        """其他连接（包括其他 worker 进程）提交过写入时，重新读取元数据和墓碑"""
+        data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if data_version == self._data_version:
+            return
+        meta = dict(self._conn.execute("SELECT key, value FROM meta").fetchall())
+        self.dimension = int(meta["dimension"]) if "dimension" in meta else None
+        self._row_count = int(meta.get("row_count", 0))
+        self._tombstones = np.fromiter(
+            (row[0] for row in self._conn.execute("SELECT chunk_id FROM tombstones ORDER BY chunk_id")),
+            dtype='int64'
+        )
+        self._data_version = data_version
+
+    def _vectors(self):
+        """返回映射到向量文件的只读 memmap，文件增长后重新映射"""
+        if not self.dimension or not self._row_count:
+            return None
+        if self._mmap is None or self._mmap_rows != self._row_count:
+            self._mmap = np.memmap(self.vectors_path, dtype='float32', mode='r',
+                                   shape=(self._row_count, self.dimension))
+            self._mmap_rows = self._row_count
+        return self._mmap
+
+    def __contains__(self, document_id):
+        """文档是否已完整写入索引，正在流式写入的文档不算"""
+        return self.document_status(document_id) == 'complete'
+
+    def document_status(self, document_id):
+        """返回文档的写入状态: 'complete'、'partial'（正在流式写入，已写入的部分可检索）或 None"""
+        self._ensure_loaded()
+        with self._lock:
+            row = self._conn.execute("SELECT complete FROM documents WHERE document_id = ?",
+                                     (document_id,)).fetchone()
+        if row is None:
+            return None
+        return 'complete' if row[0] else 'partial'
+
+    def __len__(self):
+        self._ensure_loaded()
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    @property
+    def chunk_count(self):
+        self._ensure_loaded()
+        with self._lock:
+            self._refresh()
+            return self._row_count - len(self._tombstones)
+
+    def document_ids(self):
+        self._ensure_loaded()
+        with self._lock:
+            return [row[0] for row in self._conn.execute("SELECT document_id FROM documents")]
+
+    def add_document(self, document_id, documents, embeddings, append=False, complete=True):
+        """把一个文档的文本块追加到索引中，提交后立即持久化并可被检索
+
+        Args:
+            document_id: 文档ID（文件哈希）
+            documents: 文本块列表（langchain Document）
+            embeddings: 与 documents 一一对应的向量列表
+            append: 为 True 时追加到该文档已有的文本块之后，否则先替换掉该文档的旧文本块
+            complete: 写入后是否把文档标记为完整；流式写入时除最后一步外传 False，
+                最后调用 mark_complete
+
+        Returns:
+            List[int]: 分配给各文本块的 chunk_id
+        """
+        if len(documents) != len(embeddings):
+            raise ValueError(f"文本块数量({len(documents)})与向量数量({len(embeddings)})不一致")
+        if not documents:
+            raise ValueError("没有可添加的文本块")
+
+        self._ensure_loaded()
+        vectors = np.ascontiguousarray(embeddings, dtype='float32')
+        with self._lock:
+            # BEGIN IMMEDIATE 同时作为跨进程的写锁，保证行号分配和文件追加不会交错
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._refresh()
+                if self.dimension is None:
+                    self.dimension = vectors.shape[1]
+                    self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('dimension', ?)",
+                                       (str(self.dimension),))
+                elif vectors.shape[1] != self.dimension:
+                    raise ValueError(f"向量维度不匹配: 索引为 {self.dimension}，新向量为 {vectors.shape[1]}")
+
+                # 同一个文档重复写入时先移除旧的文本块
+                if not append:
+                    self._remove_document_rows(document_id)
+
+                start_row = self._row_count
+                with open(self.vectors_path, "ab") as f:
+                    # 丢弃上次写入失败时残留在文件末尾的未提交数据
+                    f.truncate(start_row * self.dimension * 4)
+                    f.write(vectors.tobytes())
+                    f.flush()
+                    os.fsync(f.fileno())
+
+                self._conn.executemany(
+                    "INSERT INTO chunks (chunk_id, document_id, page_content, metadata, content_hash) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (start_row + i, document_id, doc.page_content,
+                         json.dumps(doc.metadata, ensure_ascii=False, default=str), text_hash(doc.page_content))
+                        for i, doc in enumerate(documents)
+                    ]
+                )
+                self._conn.execute(
+                    "INSERT INTO documents (document_id, chunk_count, complete) VALUES (?, ?, ?) "
+                    "ON CONFLICT(document_id) DO UPDATE SET chunk_count = chunk_count + excluded.chunk_count, "
+                    "complete = excluded.complete",
+                    (document_id, len(documents), int(complete))
+                )
+                self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('row_count', ?)",
+                                   (str(start_row + len(documents)),))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                self._data_version = None
+                raise
+            self._data_version = None
+            self._refresh()
+            logger.info(f"文档 {document_id} 已写入语料索引，{'追加' if append else '共'} {len(documents)} 个文本块")
+            return list(range(start_row, start_row + len(documents)))
+
+    def reassign_chunks(self, chunk_ids, document_id, metadatas, complete=True):
+        """把已有的文本块（通常属于同一逻辑文档的旧版本）转给另一个文档，向量行保持不变
+
+        用于增量重建索引：内容没有变化的文本块不重新向量化，也不写入新的向量行。
+
+        Args:
+            chunk_ids: 要转移的 chunk_id 列表
+            document_id: 目标文档ID
+            metadatas: 与 chunk_ids 一一对应的新元数据（如页码）
+            complete: 写入后是否把目标文档标记为完整
+        """
+        if len(chunk_ids) != len(metadatas):
+            raise ValueError(f"元数据数量({len(metadatas)})与 chunk_id 数量({len(chunk_ids)})不一致")
+        if not chunk_ids:
+            return
+
+        self._ensure_loaded()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                previous = Counter()
+                for i in range(0, len(chunk_ids), 500):
+                    part = list(chunk_ids[i:i + 500])
+                    previous.update(row[0] for row in self._conn.execute(
+                        f"SELECT document_id FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})", part))
+                if sum(previous.values()) != len(chunk_ids):
+                    raise ValueError("要转移的文本块不存在或已被删除")
+                self._conn.executemany(
+                    "UPDATE chunks SET document_id = ?, metadata = ? WHERE chunk_id = ?",
+                    [
+                        (document_id, json.dumps(metadata, ensure_ascii=False, default=str), chunk_id)
+                        for chunk_id, metadata in zip(chunk_ids, metadatas)
+                    ]
+                )
+                self._conn.executemany("UPDATE documents SET chunk_count = chunk_count - ? WHERE document_id = ?",
+                                       [(count, previous_id) for previous_id, count in previous.items()])
+                self._conn.execute(
+                    "INSERT INTO documents (document_id, chunk_count, complete) VALUES (?, ?, ?) "
+                    "ON CONFLICT(document_id) DO UPDATE SET chunk_count = chunk_count + excluded.chunk_count, "
+                    "complete = excluded.complete",
+                    (document_id, len(chunk_ids), int(complete))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._data_version = None
+            for chunk_id in chunk_ids:
+                self._drop_chunk(chunk_id)
+
+    def chunk_hashes(self, document_id):
+        """返回一个文档全部文本块的 (chunk_id, 内容哈希)，按 chunk_id 排序"""
+        self._ensure_loaded()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, content_hash FROM chunks WHERE document_id = ? ORDER BY chunk_id",
+                (document_id,)
+            ).fetchall()
+            missing = [chunk_id for chunk_id, content_hash in rows if content_hash is None]
+            computed = {}
+            for i in range(0, len(missing), 500):
+                part = missing[i:i + 500]
+                computed.update(
+                    (chunk_id, text_hash(page_content)) for chunk_id, page_content in self._conn.execute(
+                        f"SELECT chunk_id, page_content FROM chunks WHERE chunk_id IN ({','.join('?' * len(part))})",
+                        part)
+                )
+        return [(chunk_id, content_hash or computed[chunk_id]) for chunk_id, content_hash in rows]
+
+    def bump_versions(self, document_ids):
+        """文档写入或删除后把它们的版本号加一，同时增加整个索引的版本号
+
+        版本号保存在 chunks.db 中，共享索引目录的所有 worker 进程看到的是同一组版本号。
+        删除的文档保留版本记录，重新入库时版本号继续递增，不会回到旧值。
+        """
+        self._ensure_loaded()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT INTO document_versions (document_id, version) VALUES (?, 1) "
+                    "ON CONFLICT(document_id) DO UPDATE SET version = version + 1",
+                    [(document_id,) for document_id in document_ids]
+                )
+                self._conn.execute(
+                    "INSERT INTO meta (key, value) VALUES ('generation', '1') "
+                    "ON CONFLICT(key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def versions(self, document_ids=None):
+        """返回 (纪元, 各文档的版本号...)，document_ids 为 None 时返回 (纪元, 整个索引的版本号)"""
+        self._ensure_loaded()
+        with self._lock:
+            meta = dict(self._conn.execute(
+                "SELECT key, value FROM meta WHERE key IN ('epoch', 'generation')").fetchall())
+            if document_ids is None:
+                return (meta.get("epoch"), int(meta.get("generation", 0)))
+            document_ids = list(document_ids)
+            versions = {}
+            for i in range(0, len(document_ids), 500):
+                part = document_ids[i:i + 500]
+                versions.update(self._conn.execute(
+                    f"SELECT document_id, version FROM document_versions "
+                    f"WHERE document_id IN ({','.join('?' * len(part))})", part).fetchall())
+        return (meta.get("epoch"),) + tuple(versions.get(document_id, 0) for document_id in document_ids)
+
+    def mark_complete(self, document_id):
+        """把流式写入的文档标记为完整"""
+        self._ensure_loaded()
+        with self._lock:
+            self._conn.execute("UPDATE documents SET complete = 1 WHERE document_id = ?", (document_id,))
+            self._data_version = None
+
+    def remove_document(self, document_id):
+        """从索引中删除一个文档的全部文本块"""
+        self._ensure_loaded()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._remove_document_rows(document_id)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._data_version = None
+            self._refresh()
+            if removed:
+                logger.info(f"文档 {document_id} 已从语料索引中删除，{removed} 个文本块记为墓碑")
+
+    def _remove_document_rows(self, document_id):
+        """在当前事务中删除文档的记录，并把它的向量行记为墓碑"""
+        chunk_ids = [row[0] for row in self._conn.execute(
+            "SELECT chunk_id FROM chunks WHERE document_id = ?", (document_id,))]
+        # 文本块全部转给新版本的旧文档没有向量行，但仍要删除它的文档记录
+        self._conn.execute("DELETE FROM documents WHERE document_id = ?", (document_id,))
+        if not chunk_ids:
+            return 0
+        self._conn.executemany("INSERT OR IGNORE INTO tombstones (chunk_id) VALUES (?)",
+                               [(chunk_id,) for chunk_id in chunk_ids])
+        self._conn.execute("DELETE FROM chunks WHERE document_id = ?", (document_id,))
+        for chunk_id in chunk_ids:
+            self._drop_chunk(chunk_id)
+        return len(chunk_ids)
+
+    def _document_rows(self, document_ids):
+        """查询若干文档的全部向量行号"""
+        rows = []
+        document_ids = list(document_ids)
+        # SQLite 单条语句的参数数量有限，分段查询
+        for i in range(0, len(document_ids), 500):
+            part = document_ids[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows.extend(row[0] for row in self._conn.execute(
+                f"SELECT chunk_id FROM chunks WHERE document_id IN ({placeholders})", part))
+        return np.asarray(sorted(rows), dtype='int64')
+
+    def search_by_vector(self, query_embedding, k=3, document_ids=None, ef_search=None,
+                         nprobe=None) -> List[Tuple[Document, float]]:
+        """用查询向量检索
+
+        Args:
+            query_embedding: 查询向量
+            k: 返回结果数量
+            document_ids: 只在这些文档中搜索，None 表示搜索全部文档
+            ef_search: HNSW 检索宽度，默认使用构造时的 ef_search
+            nprobe: IVF 检索的聚类数，默认使用构造时的 nprobe
+
+        Returns:
+            List[Tuple[Document, float]]: 按 L2 距离升序排列的 (文本块, 距离) 列表
+        """
+        self._ensure_loaded()
+        query = np.asarray([query_embedding], dtype='float32')
+        # 持锁时只取快照：memmap、近似索引和墓碑数组都只会被整体替换，不会原地修改，
+        # 扫描在锁外进行，并发查询和写入不用等整个扫描结束
+        with self._lock:
+            self._refresh()
+            vectors = self._vectors()
+            if vectors is None:
+                return []
+            if query.shape[1] != self.dimension:
+                raise ValueError(f"查询向量维度不匹配: 索引为 {self.dimension}，查询为 {query.shape[1]}")
+            ann = self._ann_for_search()
+            ann_type, ann_rows, tombstones = self._ann_type, self._ann_rows, self._tombstones
+            rows = self._document_rows(document_ids) if document_ids is not None else None
+            selector = self._tombstone_selector(ann_rows) if ann is not None and rows is None else None
+
+        if rows is not None:
+            if not len(rows):
+                return []
+            if ann is None or len(rows) <= ANN_FILTER_EXACT_ROWS:
+                # 只读取目标文档的向量行
+                distances, positions = faiss.knn(query, vectors[rows], min(k, len(rows)))
+                hits = [(float(distance), int(rows[position]))
+                        for distance, position in zip(distances[0], positions[0]) if position >= 0]
+            else:
+                hits = self._ann_search(ann, ann_type, ann_rows, query, vectors, tombstones, k, rows,
+                                        None, ef_search, nprobe)
+        elif ann is not None:
+            hits = self._ann_search(ann, ann_type, ann_rows, query, vectors, tombstones, k, None,
+                                    selector, ef_search, nprobe)
+        else:
+            hits = self._scan(query, vectors, tombstones, k)
+
+        with self._lock:
+            chunks = self._get_chunks([chunk_id for _, chunk_id in hits])
+        results = []
+        for distance, chunk_id in hits:
+            if chunk_id not in chunks:
+                continue
+            document_id, doc = chunks[chunk_id]
+            results.append((
+                Document(page_content=doc.page_content,
+                         metadata={**doc.metadata, 'document_id': document_id, 'chunk_id': chunk_id,
+                                   'score': distance}),
+                distance
+            ))
+        return results
+
+    def _scan(self, query, vectors, tombstones, k, start_row=0):
+        """从 start_row 开始分块扫描向量，跳过墓碑行，返回 (距离, chunk_id) 列表"""
+        candidates = []
+        for start in range(start_row, len(vectors), SCAN_BLOCK_ROWS):
+            end = min(start + SCAN_BLOCK_ROWS, len(vectors))
+            dead = np.searchsorted(tombstones, end) - np.searchsorted(tombstones, start)
+            if dead == end - start:
+                continue
+            # 多取墓碑数量的结果，过滤后仍能凑够 k 个
+            distances, positions = faiss.knn(query, vectors[start:end], min(k + int(dead), end - start))
+            for distance, position in zip(distances[0], positions[0]):
+                if position < 0:
+                    continue
+                chunk_id = start + int(position)
+                if dead:
+                    i = np.searchsorted(tombstones, chunk_id)
+                    if i < len(tombstones) and tombstones[i] == chunk_id:
+                        continue
+                candidates.append((float(distance), chunk_id))
+        return heapq.nsmallest(k, candidates)
+
+    def _target_ann_type(self):
+        """按配置和存活文本块数量决定应使用的索引类型"""
+        if self.index_type != 'auto':
+            return self.index_type
+        live_rows = self._row_count - len(self._tombstones)
+        if live_rows >= self.ivf_threshold:
+            return 'ivfpq'
+        if live_rows >= self.hnsw_threshold:
+            return 'hnsw'
+        return 'flat'
+
+    def _ann_for_search(self):
+        """返回可用的近似索引，需要升级类型或并入新行时在后台更新"""
+        target = self._target_ann_type()
+        if target == 'flat':
+            return None
+        tail_rows = self._row_count - self._ann_rows
+        stale = self._ann_type != target or (tail_rows > ANN_TAIL_ROWS and tail_rows > self._ann_rows // 10)
+        if stale and not self._ann_building:
+            self._ann_building = True
+            threading.Thread(target=self._update_ann, args=(target, self._ann_generation), daemon=True).start()
+        # 更新完成之前继续使用旧的近似索引（可能是另一种类型），没有时退回精确扫描
+        return self._ann
+
+    def _ann_search(self, ann, ann_type, ann_rows, query, vectors, tombstones, k, rows, selector,
+                    ef_search, nprobe):
+        """近似检索已建索引的行，精确扫描之后追加的行，合并后返回 (距离, chunk_id) 列表
+
+        不持锁调用，索引和墓碑都使用调用方持锁时取得的快照；rows 为 None 时 selector 排除墓碑行。
+        """
+        if rows is None:
+            tail_hits = self._scan(query, vectors, tombstones, k, start_row=ann_rows)
+            searchable = ann_rows - int(np.searchsorted(tombstones, ann_rows))
+        else:
+            inside = rows[rows < ann_rows]
+            outside = rows[rows >= ann_rows]
+            selector = faiss.IDSelectorBatch(inside) if len(inside) else None
+            tail_hits = []
+            if len(outside):
+                distances, positions = faiss.knn(query, vectors[outside], min(k, len(outside)))
+                tail_hits = [(float(distance), int(outside[position]))
+                             for distance, position in zip(distances[0], positions[0]) if position >= 0]
+            searchable = len(inside)
+
+        hits = list(tail_hits)
+        fetch = min(k * ANN_RERANK_FACTOR, searchable)
+        if fetch > 0:
+            if ann_type == 'hnsw':
+                params = faiss.SearchParametersHNSW(efSearch=max(ef_search or self.ef_search, fetch), sel=selector)
+            else:
+                params = faiss.SearchParametersIVF(nprobe=nprobe or self.nprobe, sel=selector)
+            _, positions = ann.search(query, fetch, params=params)
+            candidates = np.unique(positions[0][positions[0] >= 0])
+            if len(candidates):
+                # 用原始向量重排，量化索引的近似距离不直接返回
+                distances = ((np.asarray(vectors[candidates]) - query[0]) ** 2).sum(axis=1)
+                hits.extend((float(distance), int(chunk_id)) for distance, chunk_id in zip(distances, candidates))
+        return heapq.nsmallest(k, hits)
+
+    def _tombstone_selector(self, ann_rows):
+        """排除近似索引范围内墓碑行的 IDSelector，墓碑不变时复用"""
+        tombstones = self._tombstones[:np.searchsorted(self._tombstones, ann_rows)]
+        if not len(tombstones):
+            return None
+        if self._ann_selector is None or not np.array_equal(self._ann_selector[0], tombstones):
+            batch = faiss.IDSelectorBatch(tombstones)
+            selector = faiss.IDSelectorNot(batch)
+            # IDSelectorNot 不持有 batch 的引用，一起保存
+            self._ann_selector = (tombstones, selector, batch)
+        return self._ann_selector[1]
+
+    def _ann_path(self, index_type, rows):
+        return self.index_dir / f"ann_{index_type}_{rows}.faiss"
+
+    def _saved_ann(self, index_type, max_rows):
+        """磁盘上该类型、覆盖行数不超过 max_rows 的最新近似索引，返回 (路径, 行数)"""
+        best = None
+        for path in self.index_dir.glob(f"ann_{index_type}_*.faiss"):
+            try:
+                rows = int(path.stem.rsplit("_", 1)[1])
+            except ValueError:
+                continue
+            if rows <= max_rows and (best is None or rows > best[1]):
+                best = (path, rows)
+        return best
+
+    def build_ann(self, index_type=None):
+        """同步构建或更新近似索引，index_type 默认为当前应使用的类型"""
+        self._ensure_loaded()
+        with self._lock:
+            self._refresh()
+            index_type = index_type or self._target_ann_type()
+            self._ann_building = True
+            generation = self._ann_generation
+        self._update_ann(index_type, generation)
+
+    def _update_ann(self, index_type, generation):
+        """构建 index_type 类型的近似索引，或把新追加的行并入已有索引，完成后替换正在使用的索引
+
+        构建和序列化不持锁；持锁确认索引没有在构建期间被 clear() 清空后，才替换磁盘文件和正在使用的索引。
+        """
+        tmp_path = None
+        try:
+            with self._lock:
+                self._refresh()
+                vectors = self._vectors()
+                row_count = self._row_count
+                if index_type == 'flat' or vectors is None:
+                    self._ann, self._ann_type, self._ann_rows = None, 'flat', 0
+                    return
+                current = self._ann if self._ann_type == index_type else None
+                current_rows = self._ann_rows
+
+            started = time.time()
+            fresh = False
+            if current is not None:
+                index = faiss.clone_index(current)
+            else:
+                # 优先使用磁盘上已有的索引（进程重启、其他 worker 建好的）
+                saved = self._saved_ann(index_type, row_count)
+                if saved is not None:
+                    index = faiss.read_index(str(saved[0]))
+                    current_rows = saved[1]
+                else:
+                    index = self._new_ann(index_type, vectors[:row_count])
+                    current_rows = 0
+                    fresh = True
+            for start in range(current_rows, row_count, SCAN_BLOCK_ROWS):
+                index.add(np.ascontiguousarray(vectors[start:min(start + SCAN_BLOCK_ROWS, row_count)]))
+
+            if fresh or row_count != current_rows:
+                tmp_path = self.index_dir / f".ann_{index_type}_{row_count}.{os.getpid()}.tmp"
+                faiss.write_index(index, str(tmp_path))
+
+            with self._lock:
+                if generation != self._ann_generation:
+                    return
+                if tmp_path is not None:
+                    os.replace(tmp_path, self._ann_path(index_type, row_count))
+                    tmp_path = None
+                    for old_path in self.index_dir.glob("ann_*.faiss"):
+                        if old_path != self._ann_path(index_type, row_count):
+                            old_path.unlink(missing_ok=True)
+                self._ann, self._ann_type, self._ann_rows = index, index_type, row_count
+                self._ann_selector = None
+            logger.info(f"近似索引已更新: {index_type}，覆盖 {row_count} 行，耗时 {time.time() - started:.1f} 秒")
+        except Exception as e:
+            logger.error(f"构建近似索引失败: {str(e)}")
+        finally:
+            if tmp_path is not None:
+                tmp_path.unlink(missing_ok=True)
+            with self._lock:
+                # clear() 之后可能已经开始了新一轮构建，由那一轮清除标记
+                if generation == self._ann_generation:
+                    self._ann_building = False
+
+    def _new_ann(self, index_type, vectors):
+        """创建并训练一个空的近似索引"""
+        dimension = vectors.shape[1]
+        if index_type == 'hnsw':
+            index = faiss.IndexHNSWFlat(dimension, HNSW_M)
+            index.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+            return index
+
+        row_count = len(vectors)
+        # 每个聚类至少需要约 39 个训练样本
+        nlist = self.nlist or int(4 * math.sqrt(row_count))
+        nlist = max(1, min(nlist, row_count // 39))
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == 'ivfpq':
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, _pq_subquantizers(dimension), 8)
+        elif index_type == 'ivfsq8':
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist, faiss.ScalarQuantizer.QT_8bit)
+        else:
+            raise ValueError(f"不支持的索引类型: {index_type}")
+
+        # PQ 码本每个子空间 256 个中心，训练样本不少于 1 万
+        sample_size = min(row_count, max(nlist * 64, 10000))
+        sample = np.sort(np.random.default_rng(0).choice(row_count, sample_size, replace=False))
+        index.train(np.ascontiguousarray(vectors[sample]))
+        return index
+
+    def get_chunks(self, chunk_ids):
+        """按 chunk_id 读取文本块
+
+        Returns:
+            Dict[int, Tuple[str, Document]]: chunk_id -> (document_id, 文本块)，已删除的文本块不会出现
+        """
+        self._ensure_loaded()
+        with self._lock:
+            return self._get_chunks(list(chunk_ids))
+
+    def document_chunks(self, document_id):
+        """按顺序返回一个文档的全部 (chunk_id, 文本块)，不经过缓存"""
+        self._ensure_loaded()
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chunk_id, page_content, metadata FROM chunks WHERE document_id = ? ORDER BY chunk_id",
+                (document_id,)
+            ).fetchall()
+        return [(chunk_id, Document(page_content=page_content, metadata=json.loads(metadata)))
+                for chunk_id, page_content, metadata in rows]
+
+    def _get_chunks(self, chunk_ids):
+        """读取文本块内容，优先使用缓存
+
+        Returns:
+            Dict[int, Tuple[str, Document]]: chunk_id -> (document_id, 文本块)
+        """
+        found = {}
+        missing = []
+        for chunk_id in chunk_ids:
+            cached = self._chunks.get(chunk_id)
+            if cached is not None:
+                self._chunks.move_to_end(chunk_id)
+                self.chunk_hits += 1
+                found[chunk_id] = cached
+            else:
+                missing.append(chunk_id)
+
+        for i in range(0, len(missing), 500):
+            part = missing[i:i + 500]
+            placeholders = ",".join("?" * len(part))
+            rows = self._conn.execute(
+                f"SELECT chunk_id, document_id, page_content, metadata FROM chunks WHERE chunk_id IN ({placeholders})",
+                part
+            ).fetchall()
+            for chunk_id, document_id, page_content, metadata in rows:
+                self.chunk_misses += 1
+                entry = (document_id, Document(page_content=page_content, metadata=json.loads(metadata)))
+                self._cache_chunk(chunk_id, entry, len(page_content.encode('utf-8')) + len(metadata))
+                found[chunk_id] = entry
+        return found
+
+    def _cache_chunk(self, chunk_id, entry, size):
+        """放入文本块缓存，超出字节预算时淘汰最久未使用的非固定文本块"""
+        self._drop_chunk(chunk_id)
+        self._chunks[chunk_id] = entry
+        self._chunk_bytes[chunk_id] = size
+        self._cached_bytes += size
+
+        for candidate in list(self._chunks.keys()):
+            if self._cached_bytes <= self.cache_max_bytes:
+                break
+            if candidate == chunk_id or self._chunks[candidate][0] in self.pinned:
+                continue
+            self._drop_chunk(candidate)
+            self.chunk_evictions += 1
+
+    def _drop_chunk(self, chunk_id):
+        if chunk_id in self._chunks:
+            del self._chunks[chunk_id]
+            self._cached_bytes -= self._chunk_bytes.pop(chunk_id)
+
+    def warm_up(self, document_ids=None):
+        """预加载指定文档（默认为固定文档）的文本块，并预读它们的向量页"""
+        self._ensure_loaded()
+        with self._lock:
+            self._refresh()
+            document_ids = list(document_ids if document_ids is not None else self.pinned)
+            rows = self._document_rows(document_ids)
+            vectors = self._vectors()
+            if vectors is not None and len(rows):
+                # 触碰一次向量行，让对应的文件页进入页缓存
+                vectors[rows].sum()
+            self._get_chunks(rows.tolist())
+        logger.info(f"索引预加载完成，已缓存 {len(self._chunks)} 个文本块")
+
+    def stats(self):
+        """返回索引和文本块缓存的统计信息"""
+        return {
+            "loaded": self._loaded,
+            "dimension": self.dimension,
+            "rows": self._row_count,
+            "tombstones": len(self._tombstones),
+            "cached_chunks": len(self._chunks),
+            "cached_bytes": self._cached_bytes,
+            "cache_max_bytes": self.cache_max_bytes,
+            "chunk_hits": self.chunk_hits,
+            "chunk_misses": self.chunk_misses,
+            "chunk_evictions": self.chunk_evictions,
+            "index_type": self.index_type,
+            "ann_type": self._ann_type,
+            "ann_rows": self._ann_rows,
+            "ann_building": self._ann_building,
+        }
+
+    def clear(self):
+        """清空索引并删除磁盘文件"""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._mmap = None
+            for path in (self.vectors_path, self.db_path,
+                         Path(f"{self.db_path}-wal"), Path(f"{self.db_path}-shm"),
+                         *self.index_dir.glob("ann_*.faiss")):
+                if path.exists():
+                    path.unlink()
+            self._reset()
+            self._ann_generation += 1
@@ -2,6 +2,13 @@
 
 import requests
 import asyncio
+import difflib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from crawl4ai import AsyncWebCrawler
 import json
 import re
@@ -112,12 +119,103 @@ async def crawl_single_page_jina(url):
 # 移除模块级别的初始化
 multi_client = MultiSearXClient()
 
+logger = logging.getLogger(__name__)
+
+
+class SearchClientPool:
+    """MultiSearXClient 池
+
+    每个 MultiSearXClient 持有一组 Selenium WebDriver，WebDriver 不是线程安全的，
+    所以同一时刻一个客户端只执行一次搜索：并发的搜索各自借出一个客户端，用完归还。
+    客户端在需要时才创建，最多 max_clients 个（默认读取 WEB_SEARCH_CLIENTS），都在使用时等待归还。
+    acquire 会阻塞等待，协程中通过 asyncio.to_thread 调用，不阻塞事件循环。
+    """
+
+    def __init__(self, clients=(), max_clients=None):
+        self._idle = list(clients)
+        self._created = len(self._idle)
+        self._max_clients = max_clients
+        self._changed = threading.Condition()
+
+    def _limit(self):
+        if self._max_clients is None:
+            self._max_clients = max(1, int(os.getenv('WEB_SEARCH_CLIENTS', '2')))
+        return self._max_clients
+
+    def acquire(self):
+        """借出一个客户端，都在使用时等待归还；用完必须调用 release"""
+        with self._changed:
+            self._changed.wait_for(lambda: self._idle or self._created < self._limit())
+            if self._idle:
+                client = self._idle.pop()
+            else:
+                client = None
+                self._created += 1
+        if client is None:
+            # 启动浏览器较慢，不持锁创建
+            try:
+                client = MultiSearXClient()
+                logger.info(f"已创建第 {self._created} 个搜索客户端")
+            except Exception:
+                with self._changed:
+                    self._created -= 1
+                    self._changed.notify()
+                raise
+        return client
+
+    def release(self, client):
+        with self._changed:
+            self._idle.append(client)
+            self._changed.notify()
+
+    @contextmanager
+    def client(self):
+        client = self.acquire()
+        try:
+            yield client
+        finally:
+            self.release(client)
+
+
+search_clients = SearchClientPool([multi_client])
+
+# 并行搜索使用的线程池，调用方线程只等待结果，不会占用池中的线程
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+
+def _executor():
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(max_workers=int(os.getenv('WEB_SEARCH_WORKERS', '16')),
+                                                  thread_name_prefix='web_search')
+        return _search_executor
+
+def format_web_results(combined_results, offset=0):
+    """把组合后的搜索结果格式化成提示词中的网页资料和回答末尾的引用链接"""
+    search_results = []
+    search_result_urls = []
+    for idx, item in enumerate(combined_results):
+        try:
+            search_results.append(f"[webpage {idx+1+offset} begin]第{idx+1+offset}个网站资料：\\n网站url: {item['url']} \\n标题：{item['title']} \\n摘要：{item['summary']}\\n正文：{item['content']}\\n[webpage {idx+1+offset} end]")
+            search_result_urls.append(f"\n\n[citation:{idx+1+offset}] {item['url']}")
+        except Exception as e:
+            print(f"生成摘要失败: {e}")
+            continue
+    return "\n".join(search_results), "\n".join(search_result_urls)
+
 # 主函数：搜索+抓取网页内容
 async def get_web_kg(query, num_results=3, offset=0):
     try:
         
         #search_results = search_with_searxng(query)
-        search_results = multi_client.multi_search(query)
+        # 借出客户端可能要等待、搜索本身也是同步调用，都放到线程中执行，不阻塞事件循环
+        client = await asyncio.to_thread(search_clients.acquire)
+        try:
+            search_results = await asyncio.to_thread(client.multi_search, query)
+        finally:
+            search_clients.release(client)
 
     except Exception as e:
         print(f"搜索失败: {e}")
@@ -155,17 +253,7 @@ async def get_web_kg(query, num_results=3, offset=0):
             continue
 
     # 返回组合后的结构化数据
-    search_results = []
-    search_result_urls = []
-    for idx, item in enumerate(combined_results):
-        try:
-            search_results.append(f"[webpage {idx+1+offset} begin]第{idx+1+offset}个网站资料：\\n网站url: {item['url']} \\n标题：{item['title']} \\n摘要：{item['summary']}\\n正文：{item['content']}\\n[webpage {idx+1+offset} end]")
-            search_result_urls.append(f"\n\n[citation:{idx+1+offset}] {item['url']}")
-        except Exception as e:
-            print(f"生成摘要失败: {e}")
-            continue
-    search_results_str = "\n".join(search_results)
-    search_result_urls_str = "\n".join(search_result_urls)
+    search_results_str, search_result_urls_str = format_web_results(combined_results, offset)
     return combined_results, search_results_str, search_result_urls_str
 
     # 显示组合后的结构化数据
@@ -175,6 +263,109 @@ async def get_web_kg(query, num_results=3, offset=0):
     #    print(f"摘要：{item['summary']}")
     #    print(f"正文内容(前500字)：\n{item['content'][:500]}...\n{'-'*50}\n")
 
+def _normalize_query(query):
+    return re.sub(r'\s+', ' ', (query or '').strip().lower())
+
+
+def intent_differs(query, intent, threshold=None):
+    """搜索意图与原始问题的相似度低于阈值时认为两者不同，需要用意图再搜索一次"""
+    if threshold is None:
+        threshold = float(os.getenv('WEB_SEARCH_INTENT_SIMILARITY', '0.6'))
+    query, intent = _normalize_query(query), _normalize_query(intent)
+    if not intent or intent == query:
+        return False
+    return difflib.SequenceMatcher(None, query, intent).ratio() < threshold
+
+
+class SearchTimingStats:
+    """联网搜索各阶段的耗时统计，通过 /api/web_search/stats 查看"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.searches = 0
+        self.intent_searches = 0  # 意图与原始问题差别较大、补充搜索了一次的次数
+        self._totals = {}  # 阶段 -> 累计秒数
+        self._counts = {}  # 阶段 -> 次数
+        self.saved_seconds = 0.0  # 与串行流程相比累计节省的时间
+        self.last = None
+
+    def record(self, timings, intent_search):
+        with self._lock:
+            self.searches += 1
+            self.intent_searches += int(intent_search)
+            for name, seconds in timings.items():
+                self._totals[name] = self._totals.get(name, 0.0) + seconds
+                self._counts[name] = self._counts.get(name, 0) + 1
+            self.saved_seconds += max(0.0, timings['serial_estimate'] - timings['total'])
+            self.last = {name: round(seconds, 3) for name, seconds in timings.items()}
+
+    def stats(self):
+        with self._lock:
+            return {
+                "searches": self.searches,
+                "intent_searches": self.intent_searches,
+                "avg_seconds": {name: self._totals[name] / self._counts[name] for name in self._totals},
+                "avg_saved_seconds": self.saved_seconds / self.searches if self.searches else 0.0,
+                "last": self.last,
+            }
+
+
+search_timings = SearchTimingStats()
+
+
+def _run_search(query, num_results):
+    # get_web_kg 是协程，在工作线程中各自用一个事件循环运行
+    started = time.perf_counter()
+    result = asyncio.run(get_web_kg(query, num_results=num_results))
+    return result, time.perf_counter() - started
+
+
+def search_with_intent(query, extract_intent, num_results=3):
+    """联网搜索和搜索意图提取并行执行
+
+    立即用原始问题搜索，同时调用 extract_intent(query) 提取搜索意图；意图与原始问题差别较大时
+    再用意图搜索一次，两次的结果按 URL 去重后合并。原来的串行流程要先等意图提取（一次完整的模型调用）
+    再开始搜索，这里意图提取的时间被原始问题的搜索覆盖。
+
+    两次搜索各自从 search_clients 借出一个客户端，不会同时使用同一组 WebDriver。
+    各阶段耗时记录在日志和 search_timings 中。
+
+    Returns:
+        Tuple[list, str, str]: (组合后的结果, 网页资料, 引用链接)
+    """
+    started = time.perf_counter()
+    raw_future = _executor().submit(_run_search, query, num_results)
+    timings = {}
+    intent_started = time.perf_counter()
+    try:
+        intent = extract_intent(query)
+    except Exception as e:
+        logger.error(f"提取搜索意图失败: {str(e)}")
+        intent = query
+    timings['intent'] = time.perf_counter() - intent_started
+
+    intent_future = None
+    if intent_differs(query, intent):
+        intent_future = _executor().submit(_run_search, intent, num_results)
+
+    (combined_results, _, _), timings['search_query'] = raw_future.result()
+    if intent_future is not None:
+        (intent_results, _, _), timings['search_intent'] = intent_future.result()
+        seen = {item['url'] for item in combined_results}
+        combined_results = combined_results + [item for item in intent_results if item['url'] not in seen]
+
+    search_results_str, search_result_urls_str = format_web_results(combined_results)
+    timings['total'] = time.perf_counter() - started
+    # 串行流程的耗时：先提取意图，再用意图搜索
+    timings['serial_estimate'] = timings['intent'] + timings.get('search_intent', timings['search_query'])
+    logger.info(
+        f"联网搜索完成: 意图 {intent!r}, {'两次搜索' if intent_future else '一次搜索'}, 结果 {len(combined_results)} 条, "
+        + ", ".join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+        + f", 节省约 {max(0.0, timings['serial_estimate'] - timings['total']):.2f}s"
+    )
+    search_timings.record(timings, intent_future is not None)
+    return combined_results, search_results_str, search_result_urls_str
+
 # 执行示例搜索
 if __name__ == "__main__":
     query = "GPT-4 最新动态"
@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+文本切分性能测试
+在大规模中文、英文以及模拟 PDF 硬换行的语料上对比 RecursiveCharacterTextSplitter(1000, 200) 与按 token 切分的 TextChunker：
+切分耗时、吞吐量、文本块数、每块 token 数分布，以及在句子边界结束的文本块比例
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from text_chunker import TextChunker, count_tokens
+
+SENTENCE_ENDINGS = ("。", "！", "？", ".", "!", "?", "”", "\"")
+
+
+def make_chinese(size):
+    """生成约 size 个字符的中文语料：句子以 。！？ 结尾，若干句组成一个段落"""
+    words = ["向量", "检索", "文档", "模型", "索引", "查询", "数据", "系统", "性能", "分析", "用户", "结果", "的", "了", "在", "和"]
+    paragraphs = []
+    total = 0
+    while total < size:
+        sentences = []
+        for _ in range(random.randint(2, 12)):
+            sentence = "".join(random.choice(words) for _ in range(random.randint(5, 40)))
+            sentence += random.choice(["。", "。", "。", "！", "？"])
+            sentences.append(sentence)
+        paragraph = "".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def make_english(size):
+    """生成约 size 个字符的英文语料"""
+    words = ["vector", "search", "document", "model", "index", "query", "data", "system", "latency", "the", "of", "and", "a", "to"]
+    paragraphs = []
+    total = 0
+    while total < size:
+        sentences = []
+        for _ in range(random.randint(2, 12)):
+            sentence = " ".join(random.choice(words) for _ in range(random.randint(5, 30)))
+            sentences.append(sentence.capitalize() + random.choice([".", ".", ".", "!", "?"]))
+        paragraph = " ".join(sentences)
+        paragraphs.append(paragraph)
+        total += len(paragraph) + 2
+    return "\n\n".join(paragraphs)
+
+
+def make_pdf_text(size):
+    """模拟 PDF 抽取的文本：每 40 个字符硬换行，段落之间没有空行"""
+    text = make_chinese(size).replace("\n\n", "\n")
+    return "\n".join(text[start:start + 40] for start in range(0, len(text), 40))
+
+
+def measure(name, split, text):
+    started = time.perf_counter()
+    chunks = split(text)
+    elapsed = time.perf_counter() - started
+    tokens = np.array([count_tokens(chunk) for chunk in chunks])
+    at_boundary = np.mean([chunk.rstrip().endswith(SENTENCE_ENDINGS) for chunk in chunks])
+    size_mb = len(text.encode('utf-8')) / 1024 / 1024
+    print(f"{name:<12}{elapsed:>9.2f}s{size_mb / elapsed:>10.1f}{len(chunks):>8}"
+          f"{tokens.mean():>10.0f}{tokens.max():>8}{at_boundary:>10.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="文本切分性能测试")
+    parser.add_argument("--size", type=int, default=5_000_000, help="每种语料的字符数")
+    parser.add_argument("--chunk-tokens", type=int, default=400, help="TextChunker 每块的 token 数")
+    parser.add_argument("--overlap-tokens", type=int, default=80, help="TextChunker 相邻块重叠的 token 数")
+    parser.add_argument("--file", action="append", default=[], help="使用真实语料文件（可多次指定），替代合成语料")
+    args = parser.parse_args()
+
+    random.seed(0)
+    if args.file:
+        corpora = {Path(path).name: Path(path).read_text(encoding='utf-8') for path in args.file}
+    else:
+        corpora = {"中文": make_chinese(args.size), "英文": make_english(args.size),
+                   "PDF 硬换行": make_pdf_text(args.size)}
+
+    recursive = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    chunker = TextChunker(chunk_tokens=args.chunk_tokens, overlap_tokens=args.overlap_tokens)
+
+    for corpus_name, text in corpora.items():
+        print(f"\n语料: {corpus_name}，{len(text)} 个字符")
+        print(f"{'切分器':<12}{'耗时':>10}{'MB/s':>10}{'块数':>8}{'平均token':>10}{'最大':>8}{'句末结束':>10}")
+        measure("recursive", recursive.split_text, text)
+        measure("token", lambda value: [value[start:end] for start, end, _ in chunker.spans(value)], text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""pytest 只收集 test_*.py 行为测试
+
+目录中的 *_test.py 是需要运行中的服务、API 密钥或浏览器的手动测试脚本，由 run_tests.py 运行。
+需要 DocumentStore 的测试使用 store fixture：索引写在临时目录中，嵌入向量由词哈希生成，不访问网络。
+"""
+
+import hashlib
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+collect_ignore_glob = ["*_test.py"]
+
+
+class HashEmbeddings:
+    """按词哈希生成向量的嵌入客户端，不访问网络，记录向量化过的文本块数"""
+
+    def __init__(self, model_name="hash-test"):
+        self.model_name = model_name
+        self.embedded = 0
+
+    def _vector(self, text):
+        vector = np.zeros(32, dtype="float32")
+        for word in text.split():
+            vector[int(hashlib.md5(word.encode()).hexdigest(), 16) % 32] += 1
+        return (vector / (np.linalg.norm(vector) + 1e-9)).tolist()
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    import document_store
+    from document_store import DocumentStore
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(DocumentStore, "_instance", None)
+    monkeypatch.setattr(DocumentStore, "_initialized", False)
+    monkeypatch.setattr(document_store, "ArkEmbeddings", lambda *args, **kwargs: HashEmbeddings())
+    return DocumentStore(api_key="test", base_url="http://127.0.0.1:9", model_name="hash-test")
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ArkEmbeddings 批量嵌入性能测试
+启动一个本地的假嵌入服务（固定延迟 + 偶发 429），对比串行定长批次与并发按 token 分批的吞吐量
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from document_store import ArkEmbeddings
+
+
+class FakeEmbeddingHandler(BaseHTTPRequestHandler):
+    """模拟 OpenAI 兼容的 /embeddings 接口"""
+    latency = 0.08  # 每个请求的固定延迟（秒）
+    per_item_latency = 0.002  # 每个文本额外的延迟（秒）
+    rate_limit_ratio = 0.0  # 返回 429 的比例
+    dimension = 256
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        inputs = body["input"]
+        if random.random() < self.rate_limit_ratio:
+            self._send(429, {"error": {"message": "rate limited", "type": "rate_limit"}})
+            return
+        time.sleep(self.latency + self.per_item_latency * len(inputs))
+        data = [
+            {"object": "embedding", "index": i, "embedding": [float(len(text) % 7)] * self.dimension}
+            for i, text in enumerate(inputs)
+        ]
+        self._send(200, {
+            "object": "list",
+            "data": data,
+            "model": body["model"],
+            "usage": {"prompt_tokens": 0, "total_tokens": 0}
+        })
+
+    def _send(self, status, payload):
+        content = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_texts(count):
+    """生成中英文混合的测试文本块"""
+    words = ["向量", "检索", "文档", "embedding", "batch", "模型", "latency", "吞吐量", "index", "查询"]
+    return [" ".join(random.choice(words) for _ in range(random.randint(50, 300))) for _ in range(count)]
+
+
+def run(base_url, texts, limits):
+    embeddings = ArkEmbeddings(api_key="fake", base_url=base_url, model_name="fake-embedding", limits=limits)
+    start = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    elapsed = time.perf_counter() - start
+    assert len(vectors) == len(texts)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ArkEmbeddings 批量嵌入性能测试")
+    parser.add_argument("--chunks", type=int, default=500, help="文本块数量")
+    parser.add_argument("--concurrency", type=int, default=8, help="并发批次数")
+    parser.add_argument("--max-batch-size", type=int, default=64, help="每批最多文本数")
+    parser.add_argument("--max-batch-tokens", type=int, default=8000, help="每批最多 token 数")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.05, help="假服务返回 429 的比例")
+    args = parser.parse_args()
+
+    FakeEmbeddingHandler.rate_limit_ratio = args.rate_limit_ratio
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakeEmbeddingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}/v1"
+
+    random.seed(0)
+    texts = make_texts(args.chunks)
+
+    sequential = run(base_url, texts, {
+        "concurrency": 1, "max_batch_size": 10, "max_batch_tokens": 10 ** 9, "max_retries": 8
+    })
+    concurrent = run(base_url, texts, {
+        "concurrency": args.concurrency, "max_batch_size": args.max_batch_size,
+        "max_batch_tokens": args.max_batch_tokens, "max_retries": 8
+    })
+    server.shutdown()
+
+    print(f"文本块数量: {args.chunks}")
+    print(f"串行，每批10个: {sequential:.2f}s，{args.chunks / sequential:.1f} 块/秒")
+    print(f"并发{args.concurrency}，按token分批: {concurrent:.2f}s，{args.chunks / concurrent:.1f} 块/秒")
+    print(f"加速比: {sequential / concurrent:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+本地 CPU 嵌入模型性能测试
+用进程内的 ONNX / sentence-transformers 模型向量化合成文本块，对比不同批大小的吞吐量，
+并统计单条查询的延迟（不经过网络，可与 embedding_benchmark.py 的远程接口结果对照）
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from local_embeddings import LocalEmbeddings, load_local_model
+
+
+def make_texts(count):
+    """生成长短不一的中英文混合文本块"""
+    words = ["向量", "检索", "文档", "embedding", "batch", "模型", "latency", "吞吐量", "index", "查询"]
+    return [" ".join(random.choice(words) for _ in range(random.randint(20, 300))) for _ in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地 CPU 嵌入模型性能测试")
+    parser.add_argument("--model", required=True, help="模型目录（含 tokenizer.json 和 model.onnx，或 sentence-transformers 模型）")
+    parser.add_argument("--chunks", type=int, default=500, help="文本块数量")
+    parser.add_argument("--batch-sizes", default="1,8,32,64", help="逗号分隔的批大小")
+    parser.add_argument("--queries", type=int, default=100, help="查询数量")
+    parser.add_argument("--threads", type=int, default=0, help="推理线程数，0 为默认")
+    args = parser.parse_args()
+
+    random.seed(0)
+    texts = make_texts(args.chunks)
+
+    started = time.perf_counter()
+    load_local_model(args.model, threads=args.threads)
+    print(f"模型加载耗时: {time.perf_counter() - started:.2f}s")
+    print(f"文本块数量: {args.chunks}")
+
+    for batch_size in [int(size) for size in args.batch_sizes.split(",")]:
+        embeddings = LocalEmbeddings(args.model, batch_size=batch_size, threads=args.threads)
+        started = time.perf_counter()
+        vectors = embeddings.embed_documents(texts)
+        elapsed = time.perf_counter() - started
+        assert len(vectors) == len(texts)
+        print(f"批大小 {batch_size:>3}: {elapsed:.2f}s，{args.chunks / elapsed:.1f} 块/秒")
+
+    embeddings = LocalEmbeddings(args.model, threads=args.threads)
+    latencies = []
+    for text in make_texts(args.queries):
+        started = time.perf_counter()
+        embeddings.embed_query(text[:100])
+        latencies.append((time.perf_counter() - started) * 1000)
+    print(f"查询延迟: p50 {np.percentile(latencies, 50):.1f}ms，p95 {np.percentile(latencies, 95):.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
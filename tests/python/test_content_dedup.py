@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+按内容哈希去重的行为测试：内容相同的文件只向量化一次，与文件名无关，按嵌入模型分别入库
+运行: python -m pytest tests/python/test_content_dedup.py -q
+
+store fixture 见 conftest.py
+"""
+
+import threading
+
+from conftest import HashEmbeddings
+
+TEXT = "第一段内容。\n\n" + "第二段内容。" * 50
+
+
+def write(path, text=TEXT):
+    path.write_text(text, encoding="utf-8")
+    return str(path)
+
+
+def test_same_content_is_embedded_once(store, tmp_path):
+    first = store.process_single_file(write(tmp_path / "report.txt"))
+    embedded = store.embeddings.embedded
+    namespace = store._namespace(store.embeddings.model_name)
+    rows = namespace.vector_index.stats()["rows"]
+
+    second = store.process_single_file(write(tmp_path / "report-copy.txt"))
+    assert second == {"success": True, "document_id": first["document_id"]}
+    assert store.embeddings.embedded == embedded
+    assert namespace.vector_index.stats()["rows"] == rows
+    # 两个文件都记录在清单中，指向同一个文档
+    assert set(store.manifest.paths_for_hash(first["document_id"])) == {
+        str(tmp_path / "report.txt"), str(tmp_path / "report-copy.txt")}
+
+
+def test_concurrent_uploads_of_same_content_ingest_once(store, tmp_path):
+    paths = [write(tmp_path / f"copy-{i}.txt") for i in range(4)]
+    results = []
+    threads = [threading.Thread(target=lambda path=path: results.append(store.process_single_file(path)))
+               for path in paths]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len({result["document_id"] for result in results}) == 1
+    assert all(result["success"] for result in results)
+    namespace = store._namespace(store.embeddings.model_name)
+    document_id = results[0]["document_id"]
+    assert store.embeddings.embedded == len(namespace.vector_index.document_chunks(document_id))
+    assert namespace.vector_index.stats()["rows"] == store.embeddings.embedded
+
+
+def test_other_embedding_model_ingests_again(store, tmp_path):
+    path = write(tmp_path / "report.txt")
+    document_id = store.process_single_file(path)["document_id"]
+    other = HashEmbeddings("hash-other")
+    assert store.process_single_file(path, embeddings=other)["document_id"] == document_id
+    assert other.embedded > 0
+    assert document_id in store._namespace("hash-other").vector_index
+
+
+def test_changed_content_does_not_match_submitted_hash(store, tmp_path):
+    path = write(tmp_path / "report.txt")
+    document_id = store.process_single_file(path)["document_id"]
+    write(tmp_path / "report.txt", "另一份内容。" * 20)
+
+    result = store.process_single_file(path, expected_hash=document_id)
+    assert result["success"] is False
+    namespace = store._namespace(store.embeddings.model_name)
+    assert list(namespace.vector_index.document_ids()) == [document_id]
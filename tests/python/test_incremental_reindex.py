@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+增量重建索引行为测试：复用的文本块在两个索引中的归属，以及转移失败时旧版本保持可检索
+运行: python -m pytest tests/python/test_incremental_reindex.py -q
+
+store fixture 见 conftest.py
+"""
+
+
+def paragraphs(*words):
+    # 每段足够长，切分后成为若干个只含同一个词的文本块
+    return "".join(" ".join([word] * 300) + "\n\n" for word in words)
+
+
+def ingest(store, path, text, replaces=None):
+    path.write_text(text, encoding="utf-8")
+    return store.process_single_file(str(path), replaces=replaces)
+
+
+def chunk_owners(store, query, mode):
+    """检索结果中包含 query 的文本块: {chunk_id: document_id}，同一个文本块出现两次时测试失败"""
+    owners = {}
+    for doc, _ in store.search_with_scores(query, k=50, mode=mode):
+        if query in doc.page_content:
+            assert doc.metadata["chunk_id"] not in owners
+            owners[doc.metadata["chunk_id"]] = doc.metadata["document_id"]
+    return owners
+
+
+def test_reused_chunks_move_to_new_version(store, tmp_path):
+    path = tmp_path / "guide.txt"
+    old = ingest(store, path, paragraphs("alpha", "bravo", "charlie"))["document_id"]
+    namespace = store._namespace(store.embeddings.model_name)
+    old_chunks = len(namespace.vector_index.document_chunks(old))
+
+    new = ingest(store, path, paragraphs("alpha", "bravo", "charlie", "delta"), replaces=old)["document_id"]
+
+    assert old not in namespace.vector_index
+    assert len(namespace.vector_index.document_chunks(new)) > old_chunks
+    for mode in ("keyword", "hybrid"):
+        # 复用的文本块只属于新版本，不会被计入两次
+        for word in ("alpha", "delta"):
+            owners = chunk_owners(store, word, mode)
+            assert owners and set(owners.values()) == {new}
+
+
+def test_failed_transfer_keeps_previous_version_searchable(store, tmp_path, monkeypatch):
+    path = tmp_path / "guide.txt"
+    old = ingest(store, path, paragraphs("alpha", "bravo", "charlie"))["document_id"]
+    namespace = store._namespace(store.embeddings.model_name)
+    old_chunk_ids = sorted(chunk_id for chunk_id, _ in namespace.vector_index.document_chunks(old))
+
+    add_document = namespace.keyword_index.add_document
+
+    def fail_on_transfer(*args, replaces=None, **kwargs):
+        # 向量行已经转给新文档之后，关键词倒排表转移失败
+        if replaces:
+            raise RuntimeError("keyword index unavailable")
+        return add_document(*args, **kwargs)
+
+    with monkeypatch.context() as patch:
+        patch.setattr(namespace.keyword_index, "add_document", fail_on_transfer)
+        result = ingest(store, path, paragraphs("alpha", "bravo", "charlie", "delta"), replaces=old)
+
+    assert result["success"] is False
+    assert old in namespace.vector_index
+    assert sorted(chunk_id for chunk_id, _ in namespace.vector_index.document_chunks(old)) == old_chunk_ids
+    for mode in ("keyword", "vector", "hybrid"):
+        owners = chunk_owners(store, "alpha", mode)
+        assert owners and set(owners.values()) == {old}
+        assert set(owners) <= set(old_chunk_ids)
+        assert not chunk_owners(store, "delta", mode)
+    assert store.search_with_scores("bravo", k=5, document_ids=[old], mode="keyword")
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+IngestJobQueue 行为测试：任务状态和进度、相同内容的任务合并、排队上限以及失败的处理
+运行: python -m pytest tests/python/test_ingest_jobs.py -q
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from ingest_jobs import IngestJobQueue, QueueFullError
+
+TIMEOUT = 10
+
+
+class Model:
+    def __init__(self, model_name):
+        self.model_name = model_name
+
+
+class FakeStore:
+    """process_single_file 在 release 之前阻塞，记录每次调用的文件"""
+
+    def __init__(self):
+        self.embeddings = Model("default-model")
+        self.release = threading.Event()
+        self.calls = []
+        self.fail_with = None
+
+    def process_single_file(self, file_path, embeddings=None, progress_callback=None, expected_hash=None,
+                            replaces=None):
+        self.calls.append((file_path, expected_hash, replaces))
+        progress_callback('embedding', 1, 2)
+        assert self.release.wait(TIMEOUT)
+        if self.fail_with is not None:
+            raise self.fail_with
+        if file_path.endswith("broken.txt"):
+            return {"success": False, "error": "文档加载失败"}
+        return {"success": True, "document_id": expected_hash}
+
+
+@pytest.fixture
+def store():
+    store = FakeStore()
+    yield store
+    store.release.set()
+
+
+def wait_until(job, predicate):
+    version = job.version
+    while not predicate(job):
+        version = job.wait_for_change(version, timeout=TIMEOUT)
+
+
+def wait_running(job):
+    wait_until(job, lambda job: job.status != 'queued')
+
+
+def wait_finished(queue, job):
+    """任务结束后，工作线程随即把它从进行中的任务表移除"""
+    assert job.wait(TIMEOUT)
+    deadline = time.monotonic() + TIMEOUT
+    while queue.active_job(job.content_hash, job.model_name) is job:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_job_reports_progress_and_result(store):
+    queue = IngestJobQueue(store, workers=1)
+    job, coalesced = queue.submit("/uploads/a.txt", "a.txt", "hash-a", replaces="hash-old")
+    assert not coalesced and queue.get(job.job_id) is job
+
+    wait_until(job, lambda job: job.stage == 'embedding')
+    state = job.to_dict()
+    assert state["status"] == 'running' and state["stage"] == 'embedding' and state["progress"] == 0.5
+
+    store.release.set()
+    assert job.wait(TIMEOUT)
+    state = job.to_dict()
+    assert state["status"] == 'completed' and state["document_id"] == "hash-a" and state["progress"] == 1.0
+    assert store.calls == [("/uploads/a.txt", "hash-a", "hash-old")]
+
+
+def test_same_content_is_coalesced_while_active(store):
+    queue = IngestJobQueue(store, workers=2)
+    job, _ = queue.submit("/uploads/a.txt", "a.txt", "hash-a")
+    again, coalesced = queue.submit("/uploads/copy-of-a.txt", "copy-of-a.txt", "hash-a")
+    assert coalesced and again is job
+    assert queue.active_job("hash-a") is job
+
+    # 另一个嵌入模型下是不同的索引，不合并
+    other, coalesced = queue.submit("/uploads/a.txt", "a.txt", "hash-a", embeddings=Model("other-model"))
+    assert not coalesced and other is not job
+
+    store.release.set()
+    wait_finished(queue, job)
+    wait_finished(queue, other)
+    assert queue.active_job("hash-a") is None
+    assert len(store.calls) == 2 and queue.stats()["coalesced"] == 1
+
+    # 任务结束后再次上传会重新入库
+    later, coalesced = queue.submit("/uploads/a.txt", "a.txt", "hash-a")
+    assert not coalesced and later is not job
+    assert later.wait(TIMEOUT)
+
+
+def test_queue_full_rejects_new_jobs(store):
+    queue = IngestJobQueue(store, workers=1, max_pending=1)
+    running, _ = queue.submit("/uploads/a.txt", "a.txt", "hash-a")
+    wait_running(running)
+    queued, _ = queue.submit("/uploads/b.txt", "b.txt", "hash-b")
+    assert queued.status == 'queued'
+
+    with pytest.raises(QueueFullError):
+        queue.submit("/uploads/c.txt", "c.txt", "hash-c")
+    # 合并到已有任务不占用排队名额
+    assert queue.submit("/uploads/b2.txt", "b2.txt", "hash-b") == (queued, True)
+
+    store.release.set()
+    assert queued.wait(TIMEOUT)
+    assert queue.stats()["jobs"] == {'completed': 2}
+
+
+def test_failures_are_reported_on_the_job(store):
+    queue = IngestJobQueue(store, workers=1)
+    store.release.set()
+    failed, _ = queue.submit("/uploads/broken.txt", "broken.txt", "hash-broken")
+    assert failed.wait(TIMEOUT)
+    assert failed.status == 'failed' and failed.error == "文档加载失败"
+
+    store.fail_with = RuntimeError("embedding service unavailable")
+    crashed, _ = queue.submit("/uploads/a.txt", "a.txt", "hash-a")
+    wait_finished(queue, crashed)
+    assert crashed.status == 'failed' and "embedding service unavailable" in crashed.error
+    assert crashed.finished_at is not None
+
+
+def test_finished_jobs_expire(store):
+    queue = IngestJobQueue(store, workers=1, job_ttl=-1)
+    store.release.set()
+    job, _ = queue.submit("/uploads/a.txt", "a.txt", "hash-a")
+    assert job.wait(TIMEOUT)
+    queue.submit("/uploads/b.txt", "b.txt", "hash-b")[0].wait(TIMEOUT)
+    assert queue.get(job.job_id) is None
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+SearchIntentCache 行为测试：TTL 过期、LRU 淘汰，以及 SQLite 磁盘缓存在重启后的命中、过期、覆盖和淘汰
+运行: python -m pytest tests/python/test_intent_cache.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from intent_cache import SearchIntentCache
+
+
+class FakeClock:
+    def __init__(self, now=1_000_000.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def test_hit_is_keyed_by_normalized_query_and_model(clock):
+    cache = SearchIntentCache(max_entries=10, ttl=60, clock=clock)
+    cache.put("What is  RAG?", "model-a", "RAG 检索增强生成")
+    assert cache.get("what is rag?", "model-a") == "RAG 检索增强生成"
+    assert cache.get("what is rag?", "model-b") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 1)
+
+
+def test_memory_entry_expires_after_ttl(clock):
+    cache = SearchIntentCache(max_entries=10, ttl=60, clock=clock)
+    cache.put("query", "model", "intent")
+    clock.now += 60
+    assert cache.get("query", "model") == "intent"
+    clock.now += 1
+    assert cache.get("query", "model") is None
+    assert cache.stats()["expirations"] == 1
+    assert cache.stats()["entries"] == 0
+
+
+def test_lru_evicts_least_recently_used(clock):
+    cache = SearchIntentCache(max_entries=2, ttl=60, clock=clock)
+    cache.put("a", "model", "A")
+    cache.put("b", "model", "B")
+    assert cache.get("a", "model") == "A"
+    cache.put("c", "model", "C")
+    assert cache.get("b", "model") is None
+    assert cache.get("a", "model") == "A"
+    assert cache.get("c", "model") == "C"
+
+
+def test_disabled_cache_stores_nothing(clock):
+    cache = SearchIntentCache(max_entries=0, ttl=60, clock=clock)
+    cache.put("query", "model", "intent")
+    assert cache.get("query", "model") is None
+
+
+def test_sqlite_tier_survives_restart(clock, tmp_path):
+    db_path = tmp_path / "intents.db"
+    SearchIntentCache(max_entries=10, ttl=60, db_path=db_path, clock=clock).put("query", "model", "intent")
+
+    restarted = SearchIntentCache(max_entries=10, ttl=60, db_path=db_path, clock=clock)
+    assert restarted.stats()["disk_entries"] == 1
+    assert restarted.get("query", "model") == "intent"
+    assert restarted.get("query", "model") == "intent"
+    stats = restarted.stats()
+    # 第一次从磁盘读取后放入内存，第二次命中内存
+    assert (stats["disk_hits"], stats["hits"]) == (1, 1)
+
+
+def test_sqlite_tier_respects_ttl(clock, tmp_path):
+    db_path = tmp_path / "intents.db"
+    SearchIntentCache(max_entries=10, ttl=60, db_path=db_path, clock=clock).put("query", "model", "intent")
+
+    clock.now += 61
+    restarted = SearchIntentCache(max_entries=10, ttl=60, db_path=db_path, clock=clock)
+    # 启动时清理过期条目
+    assert restarted.stats()["disk_entries"] == 0
+    assert restarted.get("query", "model") is None
+
+
+def test_sqlite_tier_expired_entry_not_returned_before_cleanup(clock, tmp_path):
+    cache = SearchIntentCache(max_entries=10, ttl=60, db_path=tmp_path / "intents.db", clock=clock)
+    cache.put("query", "model", "intent")
+    cache._entries.clear()  # 只留下磁盘上的条目
+    clock.now += 61
+    assert cache.get("query", "model") is None
+
+
+def test_sqlite_tier_replacing_an_entry_keeps_count(clock, tmp_path):
+    cache = SearchIntentCache(max_entries=10, ttl=60, db_path=tmp_path / "intents.db", clock=clock)
+    cache.put("query", "model", "intent")
+    clock.now += 61
+    # 过期后重新提取，覆盖同一个键
+    cache.put("query", "model", "new intent")
+    cache.put("other", "model", "intent")
+    assert cache.stats()["disk_entries"] == 2
+    restarted = SearchIntentCache(max_entries=10, ttl=60, db_path=tmp_path / "intents.db", clock=clock)
+    assert restarted.stats()["disk_entries"] == 2
+    assert restarted.get("query", "model") == "new intent"
+
+
+def test_sqlite_tier_evicts_oldest(clock, tmp_path):
+    cache = SearchIntentCache(max_entries=100, ttl=3600, db_path=tmp_path / "intents.db", max_disk_entries=10,
+                              clock=clock)
+    for i in range(11):
+        clock.now += 1
+        cache.put(f"query {i}", "model", f"intent {i}")
+    # 超出上限时淘汰到上限的 90%，最早写入的先被淘汰
+    assert cache.stats()["disk_entries"] == 9
+    restarted = SearchIntentCache(max_entries=100, ttl=3600, db_path=tmp_path / "intents.db", clock=clock)
+    assert restarted.get("query 0", "model") is None
+    assert restarted.get("query 10", "model") == "intent 10"
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+KeywordIndex 行为测试：BM25 精确词排序、文档过滤、删除，以及 RRF 融合顺序
+运行: python -m pytest tests/python/test_keyword_index.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from keyword_index import KeywordIndex, reciprocal_rank_fusion, tokenize
+
+
+@pytest.fixture
+def index(tmp_path):
+    index = KeywordIndex(tmp_path / "keywords.db")
+    index.add_document("doc-a", [0, 1, 2], [
+        "The deployment guide explains how to configure the server.",
+        "Error code E4021 means the embedding quota is exhausted.",
+        "Vector search returns the nearest chunks for a query.",
+    ])
+    index.add_document("doc-b", [3, 4], [
+        "向量检索返回与查询最接近的文本块。",
+        "错误码 E4021 出现时请检查嵌入接口的配额，E4021 通常在批量入库时出现。",
+    ])
+    return index
+
+
+def test_exact_term_matches_only_chunks_containing_it(index):
+    results = index.search("E4021", k=5)
+    assert {chunk_id for chunk_id, _ in results} == {1, 4}
+    assert all(score > 0 for _, score in results)
+
+
+def test_term_frequency_and_length_normalization(tmp_path):
+    index = KeywordIndex(tmp_path / "keywords.db")
+    index.add_document("doc", [0, 1, 2, 3], [
+        "alpha beta gamma delta",
+        "alpha alpha gamma delta",
+        "alpha beta gamma delta epsilon zeta eta theta iota kappa",
+        "beta gamma delta epsilon",
+    ])
+    # 同样长度时词频高的在前，同样词频时短的在前，不含该词的文本块不出现
+    assert [chunk_id for chunk_id, _ in index.search("alpha", k=10)] == [1, 0, 2]
+
+
+def test_rare_term_outweighs_common_terms(index):
+    results = index.search("the quota", k=3)
+    assert results[0][0] == 1
+
+
+def test_cjk_bigrams_match(index):
+    assert tokenize("向量检索") == ["向量", "量检", "检索"]
+    assert index.search("向量检索", k=1)[0][0] == 3
+
+
+def test_document_filter_and_remove(index):
+    assert [chunk_id for chunk_id, _ in index.search("E4021", document_ids=["doc-a"])] == [1]
+    index.remove_document("doc-b")
+    assert "doc-b" not in index
+    assert [chunk_id for chunk_id, _ in index.search("E4021")] == [1]
+    assert index.search("向量检索") == []
+
+
+def test_append_extends_existing_document(index):
+    index.add_document("doc-a", [5], ["Appended chunk mentions E4021 twice: E4021."], append=True)
+    chunk_ids = {chunk_id for chunk_id, _ in index.search("E4021", document_ids=["doc-a"])}
+    assert chunk_ids == {1, 5}
+
+
+def test_rrf_prefers_keys_ranked_by_both_lists():
+    vector_ranked = ["a", "b", "c"]
+    keyword_ranked = ["c", "d", "a"]
+    fused = reciprocal_rank_fusion([vector_ranked, keyword_ranked], k=4, rrf_k=60)
+    assert [key for key, _ in fused] == ["a", "c", "b", "d"]
+    assert fused[0][1] == pytest.approx(1 / 61 + 1 / 63)
+    assert fused[2][1] == pytest.approx(1 / 62)
+
+
+def test_rrf_truncates_to_k():
+    fused = reciprocal_rank_fusion([["a", "b", "c"], ["b", "c", "a"]], k=2)
+    assert [key for key, _ in fused] == ["b", "a"]
@@ -0,0 +1,166 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LLMClientPool 行为测试：按 (base_url, 密钥指纹) 复用客户端，同一服务共享连接池并复用连接，
+LRU 和空闲淘汰，异步客户端轮流使用连接池分片以及关闭
+运行: python -m pytest tests/python/test_llm_clients.py -q
+"""
+
+import asyncio
+import json
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+import llm_clients
+from llm_clients import ASYNC_POOL_SHARDS, LLMClientPool
+
+BASE_URL = "https://upstream.example.com/api/v1"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(llm_clients.time, "monotonic", clock)
+    return clock
+
+
+def test_clients_are_reused_per_key_and_share_the_endpoint_pool():
+    pool = LLMClientPool(http2=False)
+    client = pool.get("key-a", BASE_URL)
+    assert pool.get("key-a", BASE_URL) is client
+
+    other_key = pool.get("key-b", BASE_URL)
+    other_path = pool.get("key-a", "https://upstream.example.com/other/v1")
+    assert other_key is not client and other_path is not client
+    # 同一 scheme://host:port 的客户端共用一个 HTTP 连接池
+    assert other_key._client is client._client and other_path._client is client._client
+    assert pool.get("key-a", "https://other.example.com/v1")._client is not client._client
+
+    stats = pool.stats()
+    assert stats["hits"] == 1 and stats["misses"] == 4 and stats["clients"] == 4
+    assert set(stats["endpoints"]) == {"https://upstream.example.com", "https://other.example.com"}
+    # 池的键中只有密钥指纹
+    assert "key-a" not in repr(list(pool._clients))
+
+
+def test_least_recently_used_client_is_evicted():
+    pool = LLMClientPool(max_clients=2, http2=False)
+    first = pool.get("key-a", BASE_URL)
+    pool.get("key-b", BASE_URL)
+    pool.get("key-a", BASE_URL)
+    pool.get("key-c", BASE_URL)
+    assert pool.stats()["evictions"] == 1 and pool.stats()["clients"] == 2
+    assert pool.get("key-a", BASE_URL) is first
+    assert pool.stats()["misses"] == 3
+
+
+def test_idle_endpoints_are_evicted(clock):
+    pool = LLMClientPool(idle_ttl=60, http2=False)
+    client = pool.get("key-a", BASE_URL)
+    other = pool.get("key-a", "https://other.example.com/v1")
+    clock.now += 30
+    assert pool.get("key-a", BASE_URL) is client
+    clock.now += 45
+    # other 已空闲 75 秒，连同它的客户端一起淘汰；client 30 秒前刚用过
+    assert pool.get("key-a", BASE_URL) is client
+    assert set(pool.stats()["endpoints"]) == {"https://upstream.example.com"}
+    assert pool.get("key-a", "https://other.example.com/v1") is not other
+    assert pool.stats()["evictions"] == 1
+
+
+def test_async_clients_rotate_over_shards_and_close():
+    pool = LLMClientPool(http2=False, async_max_connections=64)
+    clients = [pool.get_async("key-a", BASE_URL) for _ in range(ASYNC_POOL_SHARDS * 2)]
+    assert len({id(client) for client in clients}) == ASYNC_POOL_SHARDS
+    assert clients[:ASYNC_POOL_SHARDS] == clients[ASYNC_POOL_SHARDS:]
+    assert len({id(client._client) for client in clients}) == ASYNC_POOL_SHARDS
+    # 其他密钥的异步客户端共用这些分片
+    assert pool.get_async("key-b", BASE_URL)._client in {client._client for client in clients}
+    assert pool.stats()["async_clients"] == 2
+
+    http_clients = {client._client for client in clients}
+    asyncio.run(pool.aclose())
+    assert all(http_client.is_closed for http_client in http_clients)
+    assert pool.stats()["async_clients"] == 0
+    # 关闭后再次使用时重新创建
+    assert pool.get_async("key-a", BASE_URL)._client not in http_clients
+
+
+class CompletionHandler(BaseHTTPRequestHandler):
+    """返回固定对话结果的上游服务，保持长连接"""
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        body = json.dumps({
+            "id": "chatcmpl-test", "object": "chat.completion", "created": 0, "model": "test-model",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": "pong"}}],
+        }).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def upstream():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CompletionHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def ask(client):
+    response = client.chat.completions.create(model="test-model", messages=[{"role": "user", "content": "ping"}])
+    return response.choices[0].message.content
+
+
+def test_requests_reuse_connections(upstream):
+    pool = LLMClientPool(http2=False)
+    for api_key in ("key-a", "key-a", "key-b"):
+        assert ask(pool.get(api_key, f"{upstream}/v1")) == "pong"
+    stats = pool.stats()["endpoints"][upstream]
+    # 三次请求（两个密钥）只建立了一条连接
+    assert stats["requests"] == 3 and stats["connections"] == 1
+
+
+def test_async_requests_reuse_connections(upstream):
+    pool = LLMClientPool(http2=False)
+
+    async def run():
+        for _ in range(ASYNC_POOL_SHARDS * 2):
+            client = pool.get_async("key-a", f"{upstream}/v1")
+            response = await client.chat.completions.create(model="test-model",
+                                                            messages=[{"role": "user", "content": "ping"}])
+            assert response.choices[0].message.content == "pong"
+        await pool.aclose()
+
+    asyncio.run(run())
+    stats = pool.stats()["endpoints"][upstream]
+    # 每个分片各建立一条连接，第二轮全部复用
+    assert stats["requests"] == ASYNC_POOL_SHARDS * 2 and stats["connections"] == ASYNC_POOL_SHARDS
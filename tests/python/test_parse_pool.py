@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+ParsePool 行为测试：服务进程的其他线程持有锁时子进程照常解析，子进程不导入服务模块，超时和出错的处理
+运行: python -m pytest tests/python/test_parse_pool.py -q
+"""
+
+import sys
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from parse_pool import ParsePool, ParseTimeoutError
+from parse_worker import split_chunk_batches
+
+# 模拟服务进程中被其他线程频繁持有的锁（SQLite 连接、缓存等）；fork 出的子进程会继承已锁住的状态
+SHARED_LOCK = threading.Lock()
+
+
+# 以下模块级函数在解析子进程中运行
+
+def use_shared_lock():
+    with SHARED_LOCK:
+        yield "ok"
+
+
+def loaded_modules(names):
+    yield [name for name in names if name in sys.modules]
+
+
+def sleep_forever():
+    time.sleep(60)
+    yield "never"
+
+
+def fail():
+    raise ValueError("broken document")
+    yield
+
+
+@pytest.fixture
+def busy_threads():
+    stop = threading.Event()
+
+    def work():
+        while not stop.is_set():
+            with SHARED_LOCK:
+                time.sleep(0.01)
+
+    threads = [threading.Thread(target=work, daemon=True) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    yield
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+
+def test_parses_while_other_threads_hold_locks(tmp_path, busy_threads):
+    path = tmp_path / "notes.txt"
+    path.write_text("第一段内容。\n\n" + "第二段内容。" * 50, encoding="utf-8")
+    pool = ParsePool(workers=2, timeout=60)
+
+    batches = list(pool.iter(split_chunk_batches, str(path), 2))
+    text = "".join(chunk.page_content for batch in batches for chunk in batch)
+    assert "第一段内容" in text and "第二段内容" in text
+    # 子进程使用的锁在父进程中正被其他线程持有
+    for _ in range(3):
+        assert list(pool.iter(use_shared_lock, timeout=30)) == ["ok"]
+    assert pool.stats()["completed"] == 4
+
+
+def test_child_does_not_import_server_modules():
+    pool = ParsePool(workers=1, timeout=60)
+    assert list(pool.iter(loaded_modules, ["app", "asgi", "document_store"])) == [[]]
+
+
+def test_timeout_kills_child():
+    pool = ParsePool(workers=1, timeout=60)
+    started = time.monotonic()
+    with pytest.raises(ParseTimeoutError):
+        list(pool.iter(sleep_forever, timeout=3))
+    assert time.monotonic() - started < 30
+    assert pool.stats()["timed_out"] == 1
+
+
+def test_child_error_is_raised_in_parent():
+    pool = ParsePool(workers=1, timeout=60)
+    with pytest.raises(ValueError, match="broken document"):
+        list(pool.iter(fail))
+    assert pool.stats()["failed"] == 1
@@ -0,0 +1,60 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+LocalIntentExtractor 行为测试：问候语和内容过少的问题不走本地提取，关键词按 TF×IDF 选取
+运行: python -m pytest tests/python/test_query_keywords.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from query_keywords import LocalIntentExtractor
+
+
+@pytest.fixture
+def extractor():
+    # 使用内置问句语料
+    return LocalIntentExtractor(threshold=0.7)
+
+
+@pytest.mark.parametrize("query", ["你好", "您好！", "谢谢", "hello", "hi there", "Good morning!", "thank you so much"])
+def test_greetings_are_not_answered_locally(extractor, query):
+    _, confidence = extractor.extract(query)
+    assert confidence < extractor.threshold
+
+
+@pytest.mark.parametrize("query", ["猫", "x"])
+def test_too_little_content_gets_zero_confidence(extractor, query):
+    assert extractor.extract(query)[1] == 0.0
+
+
+def test_greeting_is_stripped_from_a_real_question(extractor):
+    keywords, _ = extractor.extract("你好，请问量子计算是什么")
+    assert keywords == "量子计算"
+
+
+def test_keyword_questions_are_still_answered_locally(extractor):
+    for query in ("What is RAG?", "北京天气", "GPT-4 最新动态"):
+        keywords, confidence = extractor.extract(query)
+        assert keywords and confidence >= extractor.threshold
+
+
+def test_keywords_ranked_by_tf_idf(tmp_path):
+    corpus = tmp_path / "corpus.txt"
+    # python 出现在四行中的一行，rust 没有出现：IDF(rust) > IDF(python)
+    corpus.write_text("learn python\nweather today\nnews today\nrecipes today\n", encoding="utf-8")
+    extractor = LocalIntentExtractor(corpus_path=corpus, max_keywords=1)
+    assert extractor._idf("rust") > extractor._idf("python")
+
+    # 只保留一个关键词时，出现三次的 python 的 TF×IDF 更高
+    keywords, _ = extractor.extract("python python python rust")
+    assert keywords == "python"
+    keywords, _ = extractor.extract("python rust")
+    assert keywords == "rust"
@@ -0,0 +1,130 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+检索结果缓存行为测试：命中与复制、版本号失效、TTL 和 LRU 淘汰，以及 DocumentStore 写入后缓存失效
+运行: python -m pytest tests/python/test_retrieval_cache.py -q
+
+store fixture 见 conftest.py
+"""
+
+import pytest
+from langchain_core.documents import Document
+
+import document_store
+import retrieval_cache as retrieval_cache_module
+from retrieval_cache import RetrievalCache
+from vector_index import VectorIndex
+
+
+def results(text):
+    return [(Document(page_content=text, metadata={"chunk_id": 1}), 0.5)]
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(retrieval_cache_module.time, "monotonic", clock)
+    return clock
+
+
+def test_hit_returns_a_copy():
+    cache = RetrievalCache()
+    cache.put("q", (1,), results("answer"), elapsed=0.2)
+    first = cache.get("q", (1,))
+    first[0][0].metadata["chunk_id"] = 99
+    assert cache.get("q", (1,))[0][0].metadata["chunk_id"] == 1
+    assert cache.stats()["hits"] == 2 and cache.stats()["saved_seconds"] == pytest.approx(0.4)
+
+
+def test_changed_versions_invalidate_entry():
+    cache = RetrievalCache()
+    cache.put("q", ("epoch", 1), results("old"), elapsed=0.1)
+    assert cache.get("q", ("epoch", 2)) is None
+    # 过期的条目被丢弃，版本号回到旧值也不会再命中
+    assert cache.get("q", ("epoch", 1)) is None
+    stats = cache.stats()
+    assert stats["stale"] == 1 and stats["misses"] == 2 and stats["entries"] == 0
+
+
+def test_entries_expire_after_ttl(clock):
+    cache = RetrievalCache(ttl=60)
+    cache.put("q", (1,), results("answer"), elapsed=0.1)
+    clock.now += 59
+    assert cache.get("q", (1,)) is not None
+    clock.now += 2
+    assert cache.get("q", (1,)) is None
+    assert cache.stats()["expirations"] == 1
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = RetrievalCache(max_entries=2)
+    cache.put("a", (1,), results("a"), elapsed=0.1)
+    cache.put("b", (1,), results("b"), elapsed=0.1)
+    assert cache.get("a", (1,)) is not None
+    cache.put("c", (1,), results("c"), elapsed=0.1)
+    assert cache.get("b", (1,)) is None
+    assert cache.get("a", (1,)) is not None and cache.get("c", (1,)) is not None
+
+
+def test_zero_size_disables_cache():
+    cache = RetrievalCache(max_entries=0)
+    cache.put("q", (1,), results("answer"), elapsed=0.1)
+    assert cache.get("q", (1,)) is None and cache.stats()["entries"] == 0
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    # DocumentStore 使用模块级的缓存，每个测试换成新的实例
+    cache = RetrievalCache()
+    monkeypatch.setattr(document_store, "retrieval_cache", cache)
+    return cache
+
+
+def ingest(store, path, text, replaces=None):
+    path.write_text(text, encoding="utf-8")
+    return store.process_single_file(str(path), replaces=replaces)["document_id"]
+
+
+def test_store_writes_invalidate_cached_results(store, cache, tmp_path):
+    first = ingest(store, tmp_path / "a.txt", "alpha bravo " * 50)
+    ingest(store, tmp_path / "b.txt", "charlie delta " * 50)
+
+    store.search_with_scores("alpha", k=3, document_ids=[first])
+    store.search_with_scores("alpha", k=3)
+    store.search_with_scores("alpha", k=3, document_ids=[first])
+    store.search_with_scores("alpha", k=3)
+    assert cache.stats()["hits"] == 2
+
+    # 写入另一个文档：全库检索的结果失效，只检索 first 的结果仍然有效
+    ingest(store, tmp_path / "c.txt", "alpha echo " * 50)
+    store.search_with_scores("alpha", k=3, document_ids=[first])
+    assert cache.stats()["hits"] == 3
+    store.search_with_scores("alpha", k=3)
+    assert cache.stats()["stale"] == 1
+
+    # first 被新版本替换后，检索它的结果失效
+    ingest(store, tmp_path / "a.txt", "alpha foxtrot " * 50, replaces=first)
+    assert store.search_with_scores("alpha", k=3, document_ids=[first]) == []
+    assert cache.stats()["stale"] == 2
+
+
+def test_writes_from_another_process_invalidate_cached_results(store, cache, tmp_path):
+    document_id = ingest(store, tmp_path / "a.txt", "alpha bravo " * 50)
+    store.search_with_scores("alpha", k=3)
+    store.search_with_scores("alpha", k=3)
+    assert cache.stats()["hits"] == 1
+
+    # 共享索引目录的另一个 worker 进程写入了这个文档
+    namespace = store._namespace(store.embeddings.model_name)
+    VectorIndex(namespace.vector_index.index_dir).bump_versions([document_id])
+    store.search_with_scores("alpha", k=3)
+    assert cache.stats()["stale"] == 1 and cache.stats()["hits"] == 1
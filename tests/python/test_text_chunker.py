@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+TextChunker 行为测试：边界选择、重叠、start_index / end_index
+运行: python -m pytest tests/python/test_text_chunker.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+from langchain_core.documents import Document
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+import text_chunker
+from text_chunker import TextChunker, count_tokens
+
+
+@pytest.fixture(autouse=True)
+def byte_token_estimate(monkeypatch):
+    """固定使用按字节估算的 token 数，结果不依赖 tiktoken 是否能下载编码表"""
+    monkeypatch.setattr(text_chunker, "_token_encoder", False)
+
+
+def english_paragraphs(paragraphs=6, sentences=8):
+    return "\n\n".join(
+        " ".join(f"Paragraph {p} sentence {s} talks about vector search." for s in range(sentences))
+        for p in range(paragraphs)
+    )
+
+
+def test_spans_are_offsets_into_original_text():
+    text = "  \n" + english_paragraphs() + "\n\n  "
+    chunker = TextChunker(chunk_tokens=60, overlap_tokens=15)
+    chunks = chunker.split_documents([Document(page_content=text, metadata={"source": "a.txt"})])
+    assert len(chunks) > 1
+    for chunk in chunks:
+        start, end = chunk.metadata["start_index"], chunk.metadata["end_index"]
+        assert text[start:end] == chunk.page_content
+        assert chunk.page_content == chunk.page_content.strip()
+        assert chunk.metadata["source"] == "a.txt"
+
+
+def test_chunks_respect_token_budget_and_cover_text():
+    text = english_paragraphs()
+    chunker = TextChunker(chunk_tokens=60, overlap_tokens=15)
+    spans = chunker.spans(text)
+    for start, end, tokens in spans:
+        assert tokens <= 60
+        assert count_tokens(text[start:end]) <= 60
+    covered = [False] * len(text)
+    for start, end, _ in spans:
+        covered[start:end] = [True] * (end - start)
+    assert all(covered[i] for i, char in enumerate(text) if not char.isspace())
+
+
+def test_prefers_paragraph_then_sentence_boundaries():
+    # 每段约 2/3 个块，段落边界落在装满 min_fill 之后的范围内，应在空行处断开
+    paragraphs = [" ".join(f"Topic {p} fact {s} is stored." for s in range(5)) for p in range(6)]
+    text = "\n\n".join(paragraphs)
+    paragraph_ends = {text.index(paragraph) + len(paragraph) for paragraph in paragraphs}
+    spans = TextChunker(chunk_tokens=60, overlap_tokens=0).spans(text)
+    assert len(spans) > 1
+    for _, end, _ in spans:
+        assert end in paragraph_ends
+
+    # 没有段落时在句末断开，不在句子中间
+    text = " ".join(f"Sentence {s} is short." for s in range(60))
+    for _, end, _ in TextChunker(chunk_tokens=40, overlap_tokens=0).spans(text)[:-1]:
+        assert text[end - 1] == "."
+
+
+def test_overlap_repeats_tail_of_previous_chunk():
+    text = " ".join(f"Sentence {s} is short." for s in range(60))
+    spans = TextChunker(chunk_tokens=40, overlap_tokens=12).spans(text)
+    assert len(spans) > 2
+    for (start, end, _), (next_start, next_end, _) in zip(spans, spans[1:]):
+        assert start < next_start < end < next_end
+        # 重叠部分由完整的句子组成，不超过 overlap_tokens
+        assert text[next_start:end].endswith(".")
+        assert count_tokens(text[next_start:end]) <= 12
+
+
+def test_no_overlap_when_disabled():
+    text = " ".join(f"Sentence {s} is short." for s in range(60))
+    spans = TextChunker(chunk_tokens=40, overlap_tokens=0).spans(text)
+    for (_, end, _), (next_start, _, _) in zip(spans, spans[1:]):
+        assert next_start >= end
+
+
+def test_long_run_without_punctuation_is_split():
+    text = "，".join("向量检索" * 20 for _ in range(20))
+    spans = TextChunker(chunk_tokens=50, overlap_tokens=10).spans(text)
+    assert len(spans) > 1
+    assert all(tokens <= 50 for _, _, tokens in spans)
+
+
+def test_overlap_must_be_smaller_than_chunk():
+    with pytest.raises(ValueError):
+        TextChunker(chunk_tokens=100, overlap_tokens=100)
@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+上传流式处理行为测试：按块扫描手机号与整段扫描结果一致（号码和多字节字符跨块），
+一遍读取同时写盘和计算哈希，出错时不留临时文件
+运行: python -m pytest tests/python/test_upload_stream.py -q
+"""
+
+import hashlib
+import io
+import sys
+from pathlib import Path
+
+import pytest
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from utils.file_utils import PHONE_PATTERN, SensitiveInfoScanner, save_upload_stream
+
+TEXT = (
+    "联系人：张三，电话：13812345678。\n"
+    "订单号 213812345678 和 1381234567 都不是手机号。\n"
+    "备用号码:15900001111,15900002222\n"
+    "结尾的号码 18600003333\n"
+)
+
+
+def scan(data, chunk_size, filename="notes.txt", **kwargs):
+    scanner = SensitiveInfoScanner(filename, **kwargs)
+    for start in range(0, len(data), chunk_size):
+        scanner.feed(data[start:start + chunk_size])
+    return scanner, scanner.finish()
+
+
+def test_chunked_scan_matches_whole_text_scan():
+    data = TEXT.encode("utf-8")
+    expected = PHONE_PATTERN.findall(TEXT)
+    assert expected == ["13812345678", "15900001111", "15900002222", "18600003333"]
+    # 每种块大小都会把一些号码和中文字符的 UTF-8 字节切到两块中
+    for chunk_size in range(1, len(data) + 1):
+        scanner, matches = scan(data, chunk_size)
+        assert matches == expected, chunk_size
+        assert scanner.phone_count == len(expected)
+
+
+def test_number_at_end_of_file_is_found():
+    # 最后一块结尾的号码在 finish 时扫描
+    for chunk_size in (1, 4, 100):
+        assert scan("号码 18600003333".encode("utf-8"), chunk_size)[1] == ["18600003333"]
+
+
+def test_matches_are_capped_but_counted():
+    data = ("号码 13800000000 " * 50).encode("utf-8")
+    scanner, matches = scan(data, 7, max_matches=5)
+    assert len(matches) == 5 and scanner.phone_count == 50
+
+
+def test_preview_keeps_leading_text():
+    scanner, _ = scan(TEXT.encode("utf-8"), 3, preview_chars=10)
+    assert scanner.preview == TEXT[:10]
+
+
+@pytest.mark.parametrize("filename", ["report.pdf", "report.docx", "noextension"])
+def test_binary_files_are_not_scanned(filename):
+    scanner, matches = scan(TEXT.encode("utf-8"), 64, filename=filename)
+    assert not scanner.scanned and matches == [] and scanner.preview == ""
+
+
+def test_save_upload_stream_hashes_and_scans_in_one_pass(tmp_path):
+    data = TEXT.encode("utf-8") * 100
+    scanner = SensitiveInfoScanner("notes.txt")
+    file_path, content_hash, size = save_upload_stream(io.BytesIO(data), str(tmp_path), "notes.txt",
+                                                       scanner=scanner, chunk_size=1000)
+
+    assert content_hash == hashlib.sha256(data).hexdigest() and size == len(data)
+    # 按内容寻址保存，不留临时文件
+    assert Path(file_path) == tmp_path / content_hash / "notes.txt"
+    assert Path(file_path).read_bytes() == data
+    assert not list(tmp_path.glob(".*.uploading"))
+    assert len(scanner.finish()) == 20 and scanner.phone_count == 400
+
+
+def test_same_name_different_content_saved_separately(tmp_path):
+    first, _, _ = save_upload_stream(io.BytesIO(b"version one"), str(tmp_path), "notes.txt")
+    second, _, _ = save_upload_stream(io.BytesIO(b"version two"), str(tmp_path), "notes.txt")
+    assert first != second
+    assert Path(first).read_bytes() == b"version one" and Path(second).read_bytes() == b"version two"
+
+
+class BrokenStream:
+    """读到一半连接断开"""
+
+    def __init__(self):
+        self.reads = 0
+
+    def read(self, size):
+        self.reads += 1
+        if self.reads > 2:
+            raise ConnectionError("client disconnected")
+        return b"x" * size
+
+
+def test_interrupted_upload_leaves_no_files(tmp_path):
+    with pytest.raises(ConnectionError):
+        save_upload_stream(BrokenStream(), str(tmp_path), "notes.txt", chunk_size=16)
+    assert list(tmp_path.iterdir()) == []
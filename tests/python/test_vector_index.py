@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+VectorIndex 行为测试：所有文档共用一个索引，按文档过滤检索，删除的文本块不再出现在结果中，
+重新打开后从磁盘恢复（不使用 pickle），未提交的向量行被忽略；
+近似索引（HNSW / IVF）按规模自动选用，检索结果排除墓碑并包含建索引之后追加的行
+运行: python -m pytest tests/python/test_vector_index.py -q
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from vector_index import VectorIndex
+
+DIMENSION = 16
+
+
+def unit(axis, noise=0.0):
+    vector = np.zeros(DIMENSION, dtype="float32")
+    vector[axis] = 1.0
+    vector[(axis + 1) % DIMENSION] = noise
+    return vector.tolist()
+
+
+def add(index, document_id, axis, count=3):
+    """添加 count 个文本块，向量都靠近第 axis 维"""
+    documents = [Document(page_content=f"{document_id}-{i}", metadata={"page": i}) for i in range(count)]
+    embeddings = [unit(axis, 0.01 * i) for i in range(count)]
+    return index.add_document(document_id, documents, embeddings)
+
+
+def add_random(index, document_id, vectors):
+    documents = [Document(page_content=f"{document_id}-{i}") for i in range(len(vectors))]
+    return index.add_document(document_id, documents, vectors.tolist())
+
+
+def exact_nearest(vectors, chunk_ids, query, k):
+    """暴力计算最近的 k 个 chunk_id"""
+    order = np.argsort(((vectors - query) ** 2).sum(axis=1))[:k]
+    return {chunk_ids[i] for i in order}
+
+
+def owners(results):
+    return {doc.metadata["document_id"] for doc, _ in results}
+
+
+@pytest.fixture
+def index(tmp_path):
+    return VectorIndex(tmp_path / "index")
+
+
+def test_search_filters_by_document(index):
+    add(index, "doc-a", 0)
+    add(index, "doc-b", 1)
+    add(index, "doc-c", 2)
+
+    # 不过滤时最近的是 doc-a；只在 doc-b、doc-c 中搜索时不会返回 doc-a 的文本块
+    assert owners(index.search_by_vector(unit(0), k=3)) == {"doc-a"}
+    results = index.search_by_vector(unit(0), k=10, document_ids=["doc-b", "doc-c"])
+    assert owners(results) == {"doc-b", "doc-c"} and len(results) == 6
+    assert index.search_by_vector(unit(0), k=3, document_ids=["missing"]) == []
+    assert set(index.document_ids()) == {"doc-a", "doc-b", "doc-c"}
+
+
+def test_results_carry_chunk_metadata(index):
+    chunk_ids = add(index, "doc-a", 0)
+    doc, distance = index.search_by_vector(unit(0), k=1)[0]
+    assert doc.metadata["chunk_id"] == chunk_ids[0]
+    assert doc.metadata["page"] == 0 and doc.page_content == "doc-a-0"
+    assert distance == pytest.approx(0.0, abs=1e-6)
+
+
+def test_removed_document_is_not_returned(index):
+    add(index, "doc-a", 0)
+    add(index, "doc-b", 1)
+    index.remove_document("doc-a")
+
+    assert "doc-a" not in index and "doc-b" in index
+    assert owners(index.search_by_vector(unit(0), k=10)) == {"doc-b"}
+    assert index.search_by_vector(unit(0), k=3, document_ids=["doc-a"]) == []
+    # 删除只写墓碑，向量行保留到压缩时
+    assert index.stats()["tombstones"] == 3
+
+
+def test_reassigned_chunks_keep_their_vectors(index):
+    chunk_ids = add(index, "old", 0)
+    rows = index.stats()["rows"]
+    index.reassign_chunks(chunk_ids, "new", [{"page": 9}] * len(chunk_ids))
+    index.remove_document("old")
+
+    assert index.stats()["rows"] == rows
+    results = index.search_by_vector(unit(0), k=3)
+    assert owners(results) == {"new"}
+    assert {doc.metadata["chunk_id"] for doc, _ in results} == set(chunk_ids)
+    assert all(doc.metadata["page"] == 9 for doc, _ in results)
+
+
+def test_dimension_mismatch_is_rejected(index):
+    add(index, "doc-a", 0)
+    with pytest.raises(ValueError):
+        index.search_by_vector([1.0, 0.0], k=1)
+
+
+def test_reopened_index_restores_documents_and_tombstones(tmp_path):
+    first = VectorIndex(tmp_path / "index")
+    add(first, "doc-a", 0)
+    add(first, "doc-b", 1)
+    first.remove_document("doc-a")
+
+    reopened = VectorIndex(tmp_path / "index")
+    assert "doc-b" in reopened and "doc-a" not in reopened
+    assert owners(reopened.search_by_vector(unit(0), k=10)) == {"doc-b"}
+    stats = reopened.stats()
+    assert stats["dimension"] == DIMENSION and stats["rows"] == 6 and stats["tombstones"] == 3
+    # 索引只由原始向量文件和 SQLite 组成
+    assert not list((tmp_path / "index").glob("*.pkl"))
+
+
+def test_uncommitted_tail_rows_are_ignored(tmp_path):
+    first = VectorIndex(tmp_path / "index")
+    add(first, "doc-a", 0)
+    # 模拟写入向量后、提交元数据前进程退出：文件末尾多出一行
+    with open(first.vectors_path, "ab") as f:
+        f.write(np.asarray(unit(5), dtype="float32").tobytes())
+
+    reopened = VectorIndex(tmp_path / "index")
+    assert owners(reopened.search_by_vector(unit(5), k=10)) == {"doc-a"}
+    assert reopened.stats()["rows"] == 3
+    # 下一次写入覆盖残留的数据
+    add(reopened, "doc-b", 1)
+    assert reopened.vectors_path.stat().st_size == 6 * DIMENSION * 4
+    assert owners(reopened.search_by_vector(unit(1), k=3)) == {"doc-b"}
+
+
+def test_other_instance_sees_committed_writes(tmp_path):
+    # 另一个 worker 进程的写入在下一次检索时可见
+    reader = VectorIndex(tmp_path / "index")
+    writer = VectorIndex(tmp_path / "index")
+    add(writer, "doc-a", 0)
+    assert owners(reader.search_by_vector(unit(0), k=3)) == {"doc-a"}
+    writer.remove_document("doc-a")
+    assert reader.search_by_vector(unit(0), k=3) == []
+
+
+def test_ann_type_follows_live_rows(tmp_path):
+    index = VectorIndex(tmp_path / "index", hnsw_threshold=200)
+    rng = np.random.default_rng(0)
+    add_random(index, "small", rng.random((100, DIMENSION), dtype="float32"))
+    index.search_by_vector(unit(0), k=3)
+    # 文本块不多时精确扫描，不构建近似索引
+    assert index.stats()["ann_type"] == "flat" and not index.stats()["ann_building"]
+    assert not list((tmp_path / "index").glob("ann_*"))
+
+    add_random(index, "large", rng.random((150, DIMENSION), dtype="float32"))
+    index.build_ann()
+    stats = index.stats()
+    assert stats["ann_type"] == "hnsw" and stats["ann_rows"] == 250
+    assert [path.name for path in (tmp_path / "index").glob("ann_*")] == ["ann_hnsw_250.faiss"]
+    assert not list((tmp_path / "index").glob(".ann_*"))
+
+
+@pytest.mark.parametrize("index_type", ["hnsw", "ivfsq8"])
+def test_ann_search_skips_tombstones_and_scans_new_rows(tmp_path, index_type):
+    index = VectorIndex(tmp_path / "index", index_type=index_type, nlist=4)
+    rng = np.random.default_rng(1)
+    kept = rng.random((300, DIMENSION), dtype="float32")
+    removed = rng.random((100, DIMENSION), dtype="float32")
+    kept_ids = add_random(index, "kept", kept)
+    add_random(index, "removed", removed)
+    index.build_ann()
+    assert index.stats()["ann_type"] == index_type
+
+    index.remove_document("removed")
+    query = removed[0]
+    results = index.search_by_vector(query.tolist(), k=10, ef_search=128, nprobe=4)
+    assert len(results) == 10 and owners(results) == {"kept"}
+    # 近似检索后按精确距离重排，召回率足够高
+    found = {doc.metadata["chunk_id"] for doc, _ in results}
+    assert len(found & exact_nearest(kept, kept_ids, query, 10)) >= 8
+
+    # 建索引之后追加的行还没并入近似索引，也能检索到
+    late_ids = add_random(index, "late", query[None, :])
+    doc, distance = index.search_by_vector(query.tolist(), k=1)[0]
+    assert doc.metadata["chunk_id"] == late_ids[0] and distance == pytest.approx(0.0, abs=1e-5)
+    assert owners(index.search_by_vector(query.tolist(), k=5, document_ids=["kept"])) == {"kept"}
+
+
+def test_reopened_index_reuses_saved_ann(tmp_path):
+    first = VectorIndex(tmp_path / "index", index_type="hnsw")
+    rng = np.random.default_rng(2)
+    vectors = rng.random((200, DIMENSION), dtype="float32")
+    chunk_ids = add_random(first, "doc-a", vectors)
+    first.build_ann()
+
+    reopened = VectorIndex(tmp_path / "index", index_type="hnsw")
+    reopened.build_ann()
+    assert reopened.stats()["ann_rows"] == 200
+    assert [path.name for path in (tmp_path / "index").glob("ann_*")] == ["ann_hnsw_200.faiss"]
+    doc, _ = reopened.search_by_vector(vectors[7].tolist(), k=1)[0]
+    assert doc.metadata["chunk_id"] == chunk_ids[7]
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""
+VectorIndex 近似索引召回率/延迟测试
+在合成的聚类向量上分别用 flat、HNSW、IVF-SQ8、IVF-PQ 检索，以 flat 的结果为基准计算 recall@k，
+并对比不同 efSearch / nprobe 下的单次查询延迟
+"""
+
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+# 添加 server 目录到 Python 路径
+server_dir = Path(__file__).resolve().parent.parent.parent / "server"
+sys.path.append(str(server_dir))
+
+from langchain_core.documents import Document
+from vector_index import VectorIndex
+
+
+def make_vectors(count, dimension, clusters, seed=0):
+    """生成带聚类结构的向量，比均匀随机向量更接近真实的文本向量分布"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype('float32')
+    labels = rng.integers(0, clusters, size=count)
+    vectors = centers[labels] + 0.3 * rng.normal(size=(count, dimension)).astype('float32')
+    return vectors.astype('float32')
+
+
+def build_index(index_dir, vectors, batch_size=20000):
+    index = VectorIndex(index_dir, index_type='flat')
+    for start in range(0, len(vectors), batch_size):
+        part = vectors[start:start + batch_size]
+        documents = [Document(page_content=f"chunk {start + i}", metadata={}) for i in range(len(part))]
+        index.add_document(f"doc{start // batch_size}", documents, part)
+    return index
+
+
+def run_queries(index, queries, k, **params):
+    """返回 (每个查询的 chunk_id 集合列表, 平均延迟毫秒)"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        hits = index.search_by_vector(query, k=k, **params)
+        results.append({doc.metadata['chunk_id'] for doc, _ in hits})
+    elapsed = time.perf_counter() - start
+    return results, elapsed / len(queries) * 1000
+
+
+def recall(results, truth):
+    return float(np.mean([len(found & expected) / len(expected) for found, expected in zip(results, truth)]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="VectorIndex 近似索引召回率/延迟测试")
+    parser.add_argument("--vectors", type=int, default=100000, help="向量数量")
+    parser.add_argument("--dimension", type=int, default=128, help="向量维度")
+    parser.add_argument("--clusters", type=int, default=200, help="合成数据的聚类数")
+    parser.add_argument("--queries", type=int, default=200, help="查询数量")
+    parser.add_argument("--k", type=int, default=10, help="每次返回的结果数")
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.vectors, args.dimension, args.clusters)
+    queries = make_vectors(args.queries, args.dimension, args.clusters, seed=1)
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        index = build_index(tmp_dir, vectors)
+        truth, flat_latency = run_queries(index, queries, args.k)
+        print(f"向量数量: {args.vectors}，维度: {args.dimension}，k={args.k}")
+        print(f"{'索引':<10}{'参数':<16}{'recall':>8}{'延迟(ms)':>12}")
+        print(f"{'flat':<10}{'-':<16}{1.0:>8.3f}{flat_latency:>12.2f}")
+
+        sweeps = {
+            'hnsw': ('ef_search', [16, 32, 64, 128]),
+            'ivfsq8': ('nprobe', [1, 4, 16, 64]),
+            'ivfpq': ('nprobe', [1, 4, 16, 64]),
+        }
+        for index_type, (param, values) in sweeps.items():
+            started = time.perf_counter()
+            index.index_type = index_type
+            index.build_ann(index_type)
+            build_seconds = time.perf_counter() - started
+            for value in values:
+                results, latency = run_queries(index, queries, args.k, **{param: value})
+                print(f"{index_type:<10}{f'{param}={value}':<16}{recall(results, truth):>8.3f}{latency:>12.2f}")
+            print(f"{'':<10}构建耗时 {build_seconds:.1f}s")
+
+
+if __name__ == "__main__":
+    main()